@@ -22,6 +22,14 @@ from services.llm_init_service import (
 )
 from services.meta_data import MetaDataService
 from services.vector_db_service import VectorDbService
+from services.embedding_cache import EmbeddingCache
+from services.page_text_cache import PageTextCache
+from services.document_parser import ParseOptions, EXTRACTOR_VERSION
+from services.ingestion_queue import IngestionQueue
+from services.upload_store import UploadStore
+from services.watcher_status import WatcherStatus
+from services.reindex_runs import ReindexRuns
+from services.chunk_dedup import ChunkDeduplicator
 from services.db import Db
 from services.checkpointer import CheckPointer
 from services.email_service import EmailService
@@ -29,9 +37,11 @@ from services.email_service import EmailService
 from web.api.chat import chat_bp
 from web.api.meta_data import meta_data_bp
 from web.api.document_manager import document_manager_bp
+from web.api.metrics import metrics_bp
 from web.front.front import front_bp
 
 from model.chat_graph import ScholarGraph
+from model.fast_classifier import FastPathClassifier
 
 env_path = find_dotenv()
 load_dotenv(env_path)
@@ -43,6 +53,8 @@ TEXT_LLM_MODEL_NAME = os.getenv("TEXT_LLM_MODEL_NAME")
 INSTRUCT_LLM_MODEL_NAME = os.getenv("INSTRUCT_LLM_MODEL_NAME")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
 MILVUS_DB = os.getenv("MILVUS_DB")
+MILVUS_COLLECTION = os.getenv("MILVUS_COLLECTION", "LangChainCollection")
+MILVUS_PARTITION_KEY = os.getenv("MILVUS_PARTITION_KEY") or None
 MILVUS_HOST = os.getenv("MILVUS_HOST")
 MILVUS_PORT = os.getenv("MILVUS_PORT")
 SQL_DB_PATH = os.getenv("SQL_DB_PATH")
@@ -56,6 +68,30 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
 SENDER_NAME = os.getenv("SENDER_NAME", "Document Scholar")
+FAST_CLASSIFIER_THRESHOLD = os.getenv("FAST_CLASSIFIER_THRESHOLD")
+FAST_CLASSIFIER_MARGIN = float(os.getenv("FAST_CLASSIFIER_MARGIN", "0.05"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "0"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_BATCH_FILES = int(os.getenv("INGESTION_BATCH_FILES", "8"))
+COMPACT_AFTER_DELETE_FILES = int(os.getenv("COMPACT_AFTER_DELETE_FILES", "100"))
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+PARSER_TIME_LIMIT = float(os.getenv("PARSER_TIME_LIMIT", "0")) or None
+PARSER_MEMORY_LIMIT_MB = int(os.getenv("PARSER_MEMORY_LIMIT_MB", "0")) or None
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "600"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "90"))
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "true").lower() == "true"
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.8"))
+CHUNK_DEDUP_MIN_WORDS = int(os.getenv("CHUNK_DEDUP_MIN_WORDS", "20"))
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+FIND_DOCUMENTS_PAGE_SIZE = int(os.getenv("FIND_DOCUMENTS_PAGE_SIZE", "10"))
+FIND_DOCUMENTS_GROUP_SIZE = int(os.getenv("FIND_DOCUMENTS_GROUP_SIZE", "3"))
+RETRIEVAL_DIRECT_MAX_CHUNKS = int(os.getenv("RETRIEVAL_DIRECT_MAX_CHUNKS", "20"))
+RETRIEVAL_POST_FILTER_SHARE = float(os.getenv("RETRIEVAL_POST_FILTER_SHARE", "0.9"))
 
 
 with open(CATEGORIES_PATH, "r") as file:
@@ -64,18 +100,69 @@ with open(CATEGORIES_PATH, "r") as file:
 
 def create_app() -> Quart:
     app = Quart(__name__)
+    # The upload form posts files of up to 8MB in batches of at most 12MB, and
+    # larger files as resumable uploads in 8MB blocks
+    app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+    # Time allowed to receive a request body; a 12MB batch on a slow link
+    # needs more than the 60s default
+    app.config["BODY_TIMEOUT"] = 300
 
     @app.before_serving
     async def startup():
         text_llm_model = GetTextLLModle(TEXT_LLM_MODEL_NAME)
         instruct_llm_model = GetInstructLLModle(INSTRUCT_LLM_MODEL_NAME)
-        embedding_model = GetEmbeddingModel(EMBEDDING_MODEL_NAME)
+        embedding_model = GetEmbeddingModel(
+            EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS
+        )
         db = Db(SQL_DB_PATH)
 
+        embedding_cache = (
+            EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                EMBEDDING_MODEL_NAME,
+                EMBEDDING_CACHE_MAX_ENTRIES,
+                EMBEDDING_CACHE_DTYPE,
+            )
+            if EMBEDDING_CACHE_DIR
+            else None
+        )
+
         vectordb = VectorDbService(
-            MILVUS_HOST, MILVUS_PORT, MILVUS_DB, embedding_model, db, categories
+            MILVUS_HOST,
+            MILVUS_PORT,
+            MILVUS_DB,
+            embedding_model,
+            db,
+            categories,
+            embedding_cache=embedding_cache,
+            ingest_batch_size=INGEST_BATCH_SIZE,
+            parse_options=ParseOptions(
+                chunk_size=CHUNK_SIZE,
+                chunk_overlap=CHUNK_OVERLAP,
+                time_limit=PARSER_TIME_LIMIT,
+                memory_limit_mb=PARSER_MEMORY_LIMIT_MB,
+                text_cache=PageTextCache(DOCUMENT_FOLDER_DIR, EXTRACTOR_VERSION),
+            ),
+            collection_name=MILVUS_COLLECTION,
+            partition_key=MILVUS_PARTITION_KEY,
+            direct_fetch_max_chunks=RETRIEVAL_DIRECT_MAX_CHUNKS,
+            post_filter_share=RETRIEVAL_POST_FILTER_SHARE,
+            deduplicator=(
+                ChunkDeduplicator(
+                    db,
+                    MILVUS_COLLECTION,
+                    CHUNK_DEDUP_THRESHOLD,
+                    CHUNK_DEDUP_MIN_WORDS,
+                )
+                if CHUNK_DEDUP
+                else None
+            ),
         )
         meta_data_service = MetaDataService(db, categories)
+        ingestion_queue = IngestionQueue(
+            db, vectordb, workers=INGESTION_WORKERS, batch_files=INGESTION_BATCH_FILES
+        )
+        ingestion_queue.start()
         checkpointer = CheckPointer(CHECKPOINTER_DB_PATH)
         checkpointer.checkpointer = await checkpointer.checkpointer_cm.__aenter__()
 
@@ -88,6 +175,13 @@ def create_app() -> Quart:
             sender_name=SENDER_NAME,
         )
 
+        fast_classifier = FastPathClassifier(
+            threshold=(
+                float(FAST_CLASSIFIER_THRESHOLD) if FAST_CLASSIFIER_THRESHOLD else None
+            ),
+            margin=FAST_CLASSIFIER_MARGIN,
+        )
+
         chat_graph = ScholarGraph(
             text_llm_model,
             instruct_llm_model,
@@ -96,24 +190,37 @@ def create_app() -> Quart:
             checkpointer,
             GENERAL_CHAT_PROMPT,
             email_service=email_service,
+            fast_classifier=fast_classifier,
+            speculative_retrieval=SPECULATIVE_RETRIEVAL,
+            find_page_size=FIND_DOCUMENTS_PAGE_SIZE,
+            find_group_size=FIND_DOCUMENTS_GROUP_SIZE,
         )
         app.secret_key = SESSION_SECRET_KEY
         app.chat_graph = chat_graph
         app.meta_data_service = meta_data_service
         app.vectordb = vectordb
+        app.embedding_model = embedding_model
         app.app_name = APP_NAME
         app.app_description = APP_DESCRIPTION
         app.DOCUMENT_FOLDER_DIR = DOCUMENT_FOLDER_DIR
         app.checkpointer = checkpointer
+        app.ingestion_queue = ingestion_queue
+        app.reindex_runs = ReindexRuns(db)
+        app.MILVUS_COLLECTION = MILVUS_COLLECTION
+        app.COMPACT_AFTER_DELETE_FILES = COMPACT_AFTER_DELETE_FILES
+        app.watcher_status = WatcherStatus(db)
+        app.upload_store = UploadStore(db, DOCUMENT_FOLDER_DIR, UPLOAD_SESSION_TTL_HOURS)
 
     @app.after_serving
     async def shutdown():
+        app.ingestion_queue.stop()
         # exit async context
         await app.checkpointer.checkpointer_cm.__aexit__(None, None, None)
 
     app.register_blueprint(chat_bp, url_prefix="/api/chat")
     app.register_blueprint(meta_data_bp, url_prefix="/api/meta_data")
     app.register_blueprint(document_manager_bp, url_prefix="/api/document_manager")
+    app.register_blueprint(metrics_bp, url_prefix="/api/metrics")
     app.register_blueprint(front_bp, url_prefix="/")
 
     return app
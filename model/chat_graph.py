@@ -1,4 +1,6 @@
+import asyncio
 from langchain_ollama import ChatOllama, OllamaEmbeddings
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 
 from model.domain.core import GraphState, Task, TaskType
@@ -10,6 +12,8 @@ from model.nodes.find_documents import find_documents
 from model.nodes.general import general
 from model.nodes.send_email import send_email_node
 from model.nodes.finalize import finalize, pre_finalize
+from model.fast_classifier import FastPathClassifier
+from model.speculative_retrieval import SpeculativeRetrieval
 from services.vector_db_service import VectorDbService
 from services.email_service import EmailService
 
@@ -24,6 +28,10 @@ class ScholarGraph:
         checkpointer: CheckPointer,
         general_chat_prompt: str,
         email_service: EmailService | None = None,
+        fast_classifier: FastPathClassifier | None = None,
+        speculative_retrieval: bool = False,
+        find_page_size: int = 10,
+        find_group_size: int = 3,
     ):
         self.llm_model = llm_model
         self.instruct_llm_model = instruct_llm_model
@@ -32,6 +40,12 @@ class ScholarGraph:
         self.general_chat_prompt = general_chat_prompt
         self.checkpointer = checkpointer
         self.email_service = email_service
+        self.fast_classifier = fast_classifier
+        self.find_page_size = find_page_size
+        self.find_group_size = find_group_size
+        self.speculative_retrieval = SpeculativeRetrieval(
+            vector_db, enabled=speculative_retrieval
+        )
 
         self.graph = self.build_graph()
         self.finalize_graph = self.build_finalize_graph()
@@ -88,21 +102,40 @@ class ScholarGraph:
         return graph_builder.compile(checkpointer=self.checkpointer.checkpointer)
 
     ### Nodes ###
-    def classify_and_extract_node(self, state: GraphState):
-        return classify_and_extract_node(
-            state, self.instruct_llm_model, self.embedding_model
+    async def classify_and_extract_node(self, state: GraphState, config: RunnableConfig):
+        chat_id = config["configurable"]["thread_id"]
+        self.speculative_retrieval.start(chat_id, state.user_input)
+        return await asyncio.to_thread(
+            classify_and_extract_node,
+            state,
+            self.instruct_llm_model,
+            self.embedding_model,
+            self.fast_classifier,
         )
 
-    async def inquiry(self, state: GraphState):
-        return await inquiry(state, self.llm_model, self.vector_db)
+    async def inquiry(self, state: GraphState, config: RunnableConfig):
+        chat_id = config["configurable"]["thread_id"]
+        return await inquiry(
+            state,
+            self.llm_model,
+            self.vector_db,
+            self.speculative_retrieval.take(chat_id),
+        )
 
-    async def send_email(self, state: GraphState):
+    async def send_email(self, state: GraphState, config: RunnableConfig):
+        self.speculative_retrieval.cancel(config["configurable"]["thread_id"])
         return await send_email_node(state, self.email_service)
 
-    async def find_documents(self, state: GraphState):
-        return await find_documents(state, self.vector_db)
+    async def find_documents(self, state: GraphState, config: RunnableConfig):
+        # The grouped search pages by file and searches the raw query along
+        # with the generated ones, so an ungrouped speculative result is not used
+        self.speculative_retrieval.cancel(config["configurable"]["thread_id"])
+        return await find_documents(
+            state, self.vector_db, self.find_page_size, self.find_group_size
+        )
 
-    async def general(self, state: GraphState):
+    async def general(self, state: GraphState, config: RunnableConfig):
+        self.speculative_retrieval.cancel(config["configurable"]["thread_id"])
         return await general(state, self.llm_model, self.general_chat_prompt)
 
     def finalize(self, state: GraphState):
@@ -120,6 +120,8 @@ class Task(BaseModel):
 class Conversation(BaseModel):
     task: Task
     documents: list[Document] | None = None
+    # Cursor of the next page of find_documents results, if there is one
+    next_cursor: int | None = None
     request: BaseMessage
     response: BaseMessage
 
@@ -0,0 +1,141 @@
+import logging
+import threading
+
+from model.domain.core import Scope, Task, TaskType
+from model.prompts import fresh_classification, chat_classification
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIEVAL_PROMPT = "Answer the user query using the retrieved documents."
+
+
+class ClassifierStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fast_hits = 0
+        self.llm_fallbacks = 0
+        self.fast_latency_ms = 0.0
+        self.llm_latency_ms = 0.0
+
+    def record(self, fast_hit: bool, latency_ms: float):
+        with self._lock:
+            if fast_hit:
+                self.fast_hits += 1
+                self.fast_latency_ms += latency_ms
+            else:
+                self.llm_fallbacks += 1
+                self.llm_latency_ms += latency_ms
+
+    def snapshot(self):
+        with self._lock:
+            total = self.fast_hits + self.llm_fallbacks
+            return {
+                "total": total,
+                "fast_hits": self.fast_hits,
+                "llm_fallbacks": self.llm_fallbacks,
+                "hit_rate": self.fast_hits / total if total else 0.0,
+                "avg_fast_latency_ms": (
+                    self.fast_latency_ms / self.fast_hits if self.fast_hits else 0.0
+                ),
+                "avg_llm_latency_ms": (
+                    self.llm_latency_ms / self.llm_fallbacks
+                    if self.llm_fallbacks
+                    else 0.0
+                ),
+            }
+
+
+class FastPathClassifier:
+    """
+    Nearest-neighbour intent classifier over the labelled few-shot examples.
+
+    A query is classified without the instruct LLM when its best example
+    clears `threshold` and beats the best example of any other task type by
+    at least `margin`; otherwise `classify` returns None and the caller falls
+    back to the LLM. On a follow-up turn only intents that do not need the
+    conversation (greetings, work on the selected documents) are taken; the
+    rest go to the LLM, which rewrites the query with the chat history.
+    """
+
+    def __init__(self, threshold: float | None, margin: float = 0.05):
+        self.threshold = threshold
+        self.margin = margin
+        self.stats = ClassifierStats()
+
+    @property
+    def enabled(self):
+        return self.threshold is not None
+
+    def classify(
+        self,
+        embeddings,
+        query: str,
+        query_vector,
+        has_selected_documents: bool,
+        has_history: bool,
+    ) -> Task | None:
+        if not self.enabled:
+            return None
+
+        prompt_module = chat_classification if has_history else fresh_classification
+        few_shots = prompt_module.few_shots
+        scores = prompt_module.example_index.similarities(embeddings, query_vector)
+
+        best_idx, best_score = None, float("-inf")
+        best_by_type: dict[str, float] = {}
+        for idx, ex in enumerate(few_shots):
+            if ex["has_selected_documents"] != has_selected_documents:
+                continue
+            score = float(scores[idx])
+            task_type = ex["output"]["type"]
+            best_by_type[task_type] = max(best_by_type.get(task_type, score), score)
+            if score > best_score:
+                best_idx, best_score = idx, score
+
+        if best_idx is None or best_score < self.threshold:
+            return None
+
+        best_output = few_shots[best_idx]["output"]
+        runner_up = max(
+            (s for t, s in best_by_type.items() if t != best_output["type"]),
+            default=float("-inf"),
+        )
+        if best_score - runner_up < self.margin:
+            return None
+        if has_history and not self._context_free(best_output):
+            return None
+
+        logger.info(
+            f"Fast-path classification: {best_output['type']} (score={best_score:.3f})"
+        )
+        return self._build_task(query, best_output)
+
+    @staticmethod
+    def _context_free(output: dict) -> bool:
+        if output.get("depend_on_last_task") or output["generated_search_queries"]:
+            return False
+        return (
+            output["type"] == TaskType.general.value
+            or output["scope"] == Scope.selected_documents.value
+        )
+
+    def _build_task(self, query: str, output: dict) -> Task:
+        task_type = TaskType(output["type"])
+        if task_type in (TaskType.general, TaskType.send_email):
+            queries = []
+            llm_prompt = output["generated_llm_prompt"]
+        elif not output["generated_search_queries"]:
+            # Selected-document tasks work on the selected ids only
+            queries = []
+            llm_prompt = output["generated_llm_prompt"]
+        else:
+            # Example queries are specific to the example; search the user query itself
+            queries = [query]
+            llm_prompt = DEFAULT_RETRIEVAL_PROMPT
+        return Task(
+            type=task_type,
+            generated_search_queries=queries,
+            generated_llm_prompt=llm_prompt,
+            depend_on_last_task=False,
+            scope=output["scope"],
+        )
@@ -4,28 +4,52 @@ from langchain_ollama import ChatOllama, OllamaEmbeddings
 from model.domain.core import GraphState, Task
 from model.prompts.fresh_classification import get_prompt as get_fresh_prompt
 from model.prompts.chat_classification import get_prompt as get_chat_prompt
+from model.prompts.example_index import normalize
+from model.fast_classifier import FastPathClassifier
 from langchain_core.messages import get_buffer_string
 import json
+import time
 
 
 def classify_and_extract_node(
-    state: GraphState, llm: ChatOllama, embedding_model: OllamaEmbeddings
+    state: GraphState,
+    llm: ChatOllama,
+    embedding_model: OllamaEmbeddings,
+    fast_classifier: FastPathClassifier | None = None,
 ):
+    started = time.perf_counter()
     state.tool_messages = [
         ToolMessage(content="Thinking", tool_call_id="classify_and_extract_node")
     ]
     parser = PydanticOutputParser(pydantic_object=Task)
     has_selected_documents = bool(state.user_input.selected_documents)
 
+    # Single embedding call shared by the fast path and the few-shot selection
+    query_vector = normalize(embedding_model.embed_query(state.user_input.query))[0]
+
+    if fast_classifier and fast_classifier.enabled:
+        task = fast_classifier.classify(
+            embedding_model,
+            state.user_input.query,
+            query_vector,
+            has_selected_documents,
+            has_history=bool(state.chat_messages),
+        )
+        if task:
+            fast_classifier.stats.record(True, (time.perf_counter() - started) * 1000)
+            return _set_task(state, task)
+
     if not state.chat_messages:
-        prompt = get_fresh_prompt(has_selected_documents, embedding_model)
+        prompt = get_fresh_prompt(
+            has_selected_documents, embedding_model, state.user_input.query, query_vector
+        )
         inputs = {
             "query": state.user_input.query,
             "has_selected_documents": has_selected_documents,
         }
     else:
         prompt = get_chat_prompt(
-            has_selected_documents, embedding_model, state.user_input.query
+            has_selected_documents, embedding_model, state.user_input.query, query_vector
         )
         inputs = {
             "query": state.user_input.query,
@@ -36,6 +60,12 @@ def classify_and_extract_node(
         }
     chain = prompt | llm | parser
     task: Task = chain.invoke(inputs, config={"temperature": 0.1, "callbacks": []})
+    if fast_classifier and fast_classifier.enabled:
+        fast_classifier.stats.record(False, (time.perf_counter() - started) * 1000)
+    return _set_task(state, task)
+
+
+def _set_task(state: GraphState, task: Task):
     state.task = task
     state.tool_messages = [
         ToolMessage(
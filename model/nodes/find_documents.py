@@ -1,14 +1,52 @@
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from model.domain.core import Conversation, GraphState
-from services.vector_db_service import VectorDbService
+from services.vector_db_service import RESULT_FIELDS, VectorDbService
 from langchain_core.documents import Document
 
+MIN_SCORE = 0.7
 
-async def find_documents(state: GraphState, vector_db: VectorDbService):
 
+async def find_page(
+    state: GraphState,
+    vector_db: VectorDbService,
+    cursor: int = 0,
+    page_size: int = 10,
+    group_size: int = 3,
+):
+    """
+    One page of the documents matching the task's search queries and the
+    raw user query, with their best chunks; returns (documents, next cursor
+    or None).
+    """
     file_ids = state.user_input.selected_documents or None
-    if not file_ids and state.user_input.filter:
-        file_ids = vector_db.get_file_ids(state.user_input.filter)
+    user_filter = None if file_ids else state.user_input.filter
+    queries = list(state.task.generated_search_queries)
+    if state.user_input.query.strip() and state.user_input.query not in queries:
+        queries.append(state.user_input.query)
+    documents, next_cursor = await vector_db.find_files(
+        queries,
+        file_ids,
+        user_filter=user_filter,
+        page_size=page_size,
+        cursor=cursor,
+        group_size=group_size,
+        output_fields=RESULT_FIELDS,
+    )
+    kept = [doc for doc in documents if doc.metadata.get("score", 0.0) >= MIN_SCORE]
+    if len({doc.metadata["file_id"] for doc in kept}) < len(
+        {doc.metadata["file_id"] for doc in documents}
+    ):
+        # Files come best first: once one falls below the threshold, all later ones do
+        next_cursor = None
+    return kept, next_cursor
+
+
+async def find_documents(
+    state: GraphState,
+    vector_db: VectorDbService,
+    page_size: int = 10,
+    group_size: int = 3,
+):
 
     if not state.task.generated_search_queries:
         state.chat_messages = [
@@ -17,10 +55,9 @@ async def find_documents(state: GraphState, vector_db: VectorDbService):
         ]
         return state
 
-    queries = state.task.generated_search_queries
-
-    documents = await vector_db.get_documents(queries, file_ids)
-    documents = [doc for doc in documents if doc.metadata.get("score", 0.0) >= 0.7]
+    documents, next_cursor = await find_page(
+        state, vector_db, page_size=page_size, group_size=group_size
+    )
     document_ids = set()
     for doc in documents:
         _d: Document = doc
@@ -35,6 +72,7 @@ async def find_documents(state: GraphState, vector_db: VectorDbService):
     state.last_conversation = Conversation(
         task=state.task,
         documents=documents,
+        next_cursor=next_cursor,
         request=HumanMessage(content=state.user_input.query),
         response=ai_message,
     )
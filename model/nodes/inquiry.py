@@ -1,8 +1,10 @@
+import asyncio
 import logging
 from langchain_core.messages import ToolMessage, AIMessage, HumanMessage
 from langchain_ollama import ChatOllama
 from model.domain.core import Conversation, GraphState
-from services.vector_db_service import VectorDbService
+from model.speculative_retrieval import TakenSearch
+from services.vector_db_service import RESULT_FIELDS, VectorDbService
 
 logger = logging.getLogger(__name__)
 
@@ -18,29 +20,51 @@ from langchain_core.prompts import (
 
 
 async def inquiry(
-    state: GraphState, text_llm: ChatOllama, vector_db: VectorDbService
+    state: GraphState,
+    text_llm: ChatOllama,
+    vector_db: VectorDbService,
+    speculative_documents: TakenSearch | None = None,
 ):
     logger.info(f"Inquiry node - selected_documents: {state.user_input.selected_documents}")
     logger.info(f"Inquiry node - search_queries: {state.task.generated_search_queries}")
     logger.info(f"Inquiry node - scope: {state.task.scope}")
 
     file_ids = state.user_input.selected_documents or None
-    if not file_ids and state.user_input.filter:
-        file_ids = vector_db.get_file_ids(state.user_input.filter)
+    user_filter = None if file_ids else state.user_input.filter
 
-    logger.info(f"Inquiry node - file_ids after filter: {file_ids}")
+    logger.info(f"Inquiry node - file_ids: {file_ids}, filter: {user_filter}")
 
-    if not state.task.generated_search_queries and not file_ids:
+    if not state.task.generated_search_queries and not file_ids and not user_filter:
         # No query generated and the prompt is not related with selected files or filter
         state.chat_messages = [
             HumanMessage(content=state.user_input.query),
             AIMessage(content="Please provide valid query"),
         ]
+        if speculative_documents:
+            speculative_documents.cancel()
         return state
 
     queries = state.task.generated_search_queries or [""]  # defulat query to get all
 
-    documents = await vector_db.get_documents(queries, file_ids)
+    if speculative_documents:
+        # The raw query was already searched speculatively during classification
+        queries = [q for q in queries if q != state.user_input.query]
+        try:
+            lists = await asyncio.gather(
+                vector_db.get_documents(
+                    queries, file_ids, user_filter=user_filter, output_fields=RESULT_FIELDS
+                ),
+                speculative_documents,
+            )
+        finally:
+            # A no-op once awaited; stops the speculative search if get_documents raised
+            speculative_documents.cancel()
+        # A directly fetched scope holds more than k chunks; keep all of it
+        documents = vector_db.merge_documents(lists, k=max(5, *map(len, lists)))
+    else:
+        documents = await vector_db.get_documents(
+            queries, file_ids, user_filter=user_filter, output_fields=RESULT_FIELDS
+        )
     logger.info(f"Inquiry node - documents retrieved (before filter): {len(documents)}")
 
     documents = [doc for doc in documents if doc.metadata.get("score", 0.0) >= 0.5]
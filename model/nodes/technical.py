@@ -1,7 +1,7 @@
 from langchain_core.messages import ToolMessage, AIMessage, HumanMessage
 from langchain_ollama import ChatOllama
 from model.domain.core import Conversation, GraphState
-from services.vector_db_service import VectorDbService
+from services.vector_db_service import RESULT_FIELDS, VectorDbService
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
@@ -19,10 +19,9 @@ async def technical(
 ):
 
     file_ids = state.user_input.selected_documents or None
-    if not file_ids and state.user_input.filter:
-        file_ids = vector_db.get_file_ids(state.user_input.filter)
+    user_filter = None if file_ids else state.user_input.filter
 
-    if not state.task.generated_search_queries and not file_ids:
+    if not state.task.generated_search_queries and not file_ids and not user_filter:
         # No query generated and the prompt is not related with selected files or filter
         state.chat_messages = [
             HumanMessage(content=state.user_input.query),
@@ -32,7 +31,9 @@ async def technical(
 
     queries = state.task.generated_search_queries or [""]  # defulat query to get all
 
-    documents = await vector_db.get_documents(queries, file_ids)
+    documents = await vector_db.get_documents(
+        queries, file_ids, user_filter=user_filter, output_fields=RESULT_FIELDS
+    )
 
     documents = [doc for doc in documents if doc.metadata.get("score", 0.0) >= 0.5]
    
@@ -7,8 +7,6 @@ Prompt configuration is loaded from YAML files with support for project-specific
 
 import json
 
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from langchain_core.prompts import (
     FewShotChatMessagePromptTemplate,
     SystemMessagePromptTemplate,
@@ -18,7 +16,8 @@ from langchain_core.prompts import (
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.messages.utils import get_buffer_string
 
-from model.prompts.loader import load_prompt_config
+from model.prompts.loader import load_prompt_config, get_prompt_hash
+from model.prompts.example_index import ExampleIndex
 
 # Load configuration from YAML
 _config = load_prompt_config("chat_classification")
@@ -53,43 +52,31 @@ for shot in _config["few_shots"]:
     })
 
 
-def get_prompt(has_selected_documents, embeddings, query):
-    filtered_examples = [
-        ex for ex in few_shots
-        if has_selected_documents == ex["has_selected_documents"]
-    ]
-
-    # Prepare examples with serializable format
-    prepared_examples = []
-    example_queries = []
-
-    for ex in filtered_examples:
-        prepared_example = {
-            "query": ex["query"],
-            "has_selected_documents": ex["has_selected_documents"],
-            "chat_messages": get_buffer_string(
-                ex.get("chat_messages") or [HumanMessage(content="Hi")]
-            ),
-            "output": json.dumps(ex["output"]),
-        }
-        prepared_examples.append(prepared_example)
-        example_queries.append(ex["query"])
-
-    if example_queries:
-        all_queries = example_queries + [query]
-        all_embeddings = embeddings.embed_documents(all_queries)
-
-        # Split embeddings
-        example_embeddings = np.array(all_embeddings[:-1])
-        query_embedding = np.array(all_embeddings[-1]).reshape(1, -1)
-
-        # Calculate cosine similarities
-        similarities = cosine_similarity(query_embedding, example_embeddings)[0]
-
-        top_indices = np.argsort(similarities)[-5:][::-1]
-        selected_examples = [prepared_examples[i] for i in top_indices]
-    else:
-        selected_examples = []
+# Example embeddings are computed once per (embedding model, YAML content)
+example_index = ExampleIndex(
+    "chat_classification",
+    get_prompt_hash("chat_classification"),
+    [ex["query"] for ex in few_shots],
+)
+
+
+def _prepare_example(ex):
+    return {
+        "query": ex["query"],
+        "has_selected_documents": ex["has_selected_documents"],
+        "chat_messages": get_buffer_string(
+            ex.get("chat_messages") or [HumanMessage(content="Hi")]
+        ),
+        "output": json.dumps(ex["output"]),
+    }
+
+
+def get_prompt(has_selected_documents, embeddings, query, query_vector=None):
+    if query_vector is None:
+        query_vector = example_index.embed_query(embeddings, query)
+    mask = [has_selected_documents == ex["has_selected_documents"] for ex in few_shots]
+    top_indices = example_index.top_k(embeddings, query_vector, k=5, mask=mask)
+    selected_examples = [_prepare_example(few_shots[i]) for i in top_indices]
 
     example_prompt = ChatPromptTemplate.from_messages(
         [("human", HUMAN_PROMPT), ("ai", AI_PROMPT)],
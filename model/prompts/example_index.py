@@ -0,0 +1,125 @@
+"""
+Few-shot Example Embedding Index
+
+Embeds the few-shot example queries of a prompt configuration once per
+(embedding model, YAML content hash) and keeps them as a normalized NumPy
+matrix, both in memory and on disk, so selecting the nearest examples for a
+user query costs a single embedding call.
+"""
+
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the persisted example matrices (override with PROMPTS_CACHE_DIR)
+DEFAULT_CACHE_DIR = Path("storage") / "prompt_cache"
+
+
+def get_cache_dir() -> Path:
+    """Get the example embedding cache directory from environment variable."""
+    return Path(os.getenv("PROMPTS_CACHE_DIR") or DEFAULT_CACHE_DIR)
+
+
+def get_model_name(embeddings) -> str:
+    """Name used to key cached vectors for an embedding model."""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+def normalize(vectors) -> np.ndarray:
+    """Return float32 rows scaled to unit length (zero rows are left as-is)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ExampleIndex:
+    def __init__(self, prompt_name: str, content_hash: str, queries: list[str]):
+        self.prompt_name = prompt_name
+        self.content_hash = content_hash
+        self.queries = list(queries)
+        self._matrices: dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _cache_path(self, model_name: str) -> Path:
+        model_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        return (
+            get_cache_dir()
+            / f"{self.prompt_name}-{model_slug}-{self.content_hash[:16]}.npy"
+        )
+
+    def _load(self, path: Path) -> np.ndarray | None:
+        try:
+            matrix = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        if matrix.ndim != 2 or matrix.shape[0] != len(self.queries):
+            return None
+        return matrix
+
+    def _save(self, path: Path, matrix: np.ndarray):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp.npy")
+            np.save(tmp_path, matrix, allow_pickle=False)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning(f"Could not persist example embeddings to {path}: {err}")
+
+    def get_matrix(self, embeddings) -> np.ndarray:
+        """Normalized example matrix for the model, embedding it on first use only."""
+        model_name = get_model_name(embeddings)
+        matrix = self._matrices.get(model_name)
+        if matrix is not None:
+            return matrix
+
+        with self._lock:
+            matrix = self._matrices.get(model_name)
+            if matrix is not None:
+                return matrix
+
+            path = self._cache_path(model_name)
+            matrix = self._load(path) if path.exists() else None
+            if matrix is None:
+                logger.info(
+                    f"Embedding {len(self.queries)} '{self.prompt_name}' examples with {model_name}"
+                )
+                if self.queries:
+                    matrix = normalize(embeddings.embed_documents(self.queries))
+                else:
+                    matrix = np.zeros((0, 0), dtype=np.float32)
+                self._save(path, matrix)
+            self._matrices[model_name] = matrix
+            return matrix
+
+    def embed_query(self, embeddings, query: str) -> np.ndarray:
+        """Embed and normalize a single query (the only per-turn embedding call)."""
+        return normalize(embeddings.embed_query(query))[0]
+
+    def similarities(self, embeddings, query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of a normalized query vector against every example."""
+        matrix = self.get_matrix(embeddings)
+        if not len(matrix):
+            return np.zeros(0, dtype=np.float32)
+        return matrix @ query_vector
+
+    def top_k(
+        self, embeddings, query_vector: np.ndarray, k: int, mask: list[bool] | None = None
+    ) -> list[int]:
+        """Indices of the k most similar examples, optionally restricted by mask."""
+        scores = self.similarities(embeddings, query_vector)
+        candidates = np.arange(len(scores))
+        if mask is not None:
+            candidates = candidates[np.asarray(mask, dtype=bool)]
+        if not len(candidates):
+            return []
+        order = np.argsort(-scores[candidates], kind="stable")[:k]
+        return [int(i) for i in candidates[order]]
@@ -13,10 +13,9 @@ from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     ChatPromptTemplate,
 )
-from langchain_core.example_selectors import SemanticSimilarityExampleSelector
-from langchain_chroma.vectorstores import Chroma
 
-from model.prompts.loader import load_prompt_config
+from model.prompts.loader import load_prompt_config, get_prompt_hash
+from model.prompts.example_index import ExampleIndex
 
 # Load configuration from YAML
 _config = load_prompt_config("fresh_classification")
@@ -34,30 +33,33 @@ for shot in _config["few_shots"]:
         "output": shot["output"],
     })
 
+# Example embeddings are computed once per (embedding model, YAML content)
+example_index = ExampleIndex(
+    "fresh_classification",
+    get_prompt_hash("fresh_classification"),
+    [ex["query"] for ex in few_shots],
+)
+
 
-def get_prompt(has_selected_documents, embeddings):
+def get_prompt(has_selected_documents, embeddings, query, query_vector=None):
+    if query_vector is None:
+        query_vector = example_index.embed_query(embeddings, query)
+    mask = [has_selected_documents == ex["has_selected_documents"] for ex in few_shots]
+    top_indices = example_index.top_k(embeddings, query_vector, k=3, mask=mask)
     examples = [
         {
-            "query": ex["query"],
-            "has_selected_documents": ex["has_selected_documents"],
-            "output": json.dumps(ex["output"]),
+            "query": few_shots[i]["query"],
+            "has_selected_documents": few_shots[i]["has_selected_documents"],
+            "output": json.dumps(few_shots[i]["output"]),
         }
-        for ex in few_shots
-        if has_selected_documents == ex["has_selected_documents"]
+        for i in top_indices
     ]
-    example_selector = SemanticSimilarityExampleSelector.from_examples(
-        examples=examples,
-        vectorstore_cls=Chroma,
-        k=3,
-        embeddings=embeddings,
-        input_keys=["query"],
-    )
 
     example_prompt = ChatPromptTemplate.from_messages(
         [("human", HUMAN_PROMPT), ("ai", AI_PROMPT)], template_format="jinja2"
     )
     few_shot_prompt = FewShotChatMessagePromptTemplate(
-        example_prompt=example_prompt, example_selector=example_selector
+        example_prompt=example_prompt, examples=examples
     )
     final_prompt = (
         SystemMessagePromptTemplate.from_template(SYS_PROMPT, template_format="jinja2")
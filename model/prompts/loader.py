@@ -7,6 +7,7 @@ Project-specific overrides can be placed in the directory specified by PROMPTS_D
 """
 
 import os
+import hashlib
 from pathlib import Path
 from typing import Any
 
@@ -82,3 +83,17 @@ def get_prompt_file_path(prompt_name: str) -> Path:
             return override_path
 
     return DEFAULTS_DIR / filename
+
+
+def get_prompt_hash(prompt_name: str) -> str:
+    """
+    Get the SHA-256 hash of the prompt file that would be loaded.
+
+    Args:
+        prompt_name: Name of the prompt file (without .yaml extension)
+
+    Returns:
+        Hex digest of the file content, used to key cached example embeddings
+    """
+    with open(get_prompt_file_path(prompt_name), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
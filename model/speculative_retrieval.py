@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+
+from model.domain.core import UserInput
+from services.vector_db_service import RESULT_FIELDS, VectorDbService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpeculativeSearch:
+    task: asyncio.Task
+    started_at: float
+    finished_at: float | None = None
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.cancelled = 0
+        self.saved_ms = 0.0
+        self.last_saved_ms = 0.0
+
+    def record_used(self, saved_ms: float):
+        with self._lock:
+            self.used += 1
+            self.saved_ms += saved_ms
+            self.last_saved_ms = saved_ms
+
+    def record_started(self):
+        with self._lock:
+            self.started += 1
+
+    def record_cancelled(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "cancelled": self.cancelled,
+                "total_saved_ms": self.saved_ms,
+                "avg_saved_ms": self.saved_ms / self.used if self.used else 0.0,
+                "last_saved_ms": self.last_saved_ms,
+            }
+
+
+class TakenSearch:
+    """
+    A speculative search handed to a retrieval node. Await it for the
+    documents, or `cancel` it when the node does not search after all;
+    cancelling a search already awaited does nothing.
+    """
+
+    def __init__(self, chat_id: str, search: SpeculativeSearch, stats: SpeculationStats):
+        self.chat_id = chat_id
+        self.search = search
+        self.stats = stats
+        taken_at = time.perf_counter()
+        # Time the search already ran behind classification
+        overlap_end = min(search.finished_at or taken_at, taken_at)
+        self.saved_ms = (overlap_end - search.started_at) * 1000
+        self._settled = False
+
+    def __await__(self):
+        return self._result().__await__()
+
+    async def _result(self) -> list[Document]:
+        documents = await self.search.task
+        if self._settled:
+            return documents
+        self._settled = True
+        self.stats.record_used(self.saved_ms)
+        logger.info(
+            f"Speculative retrieval for chat {self.chat_id} saved {self.saved_ms:.0f} ms"
+        )
+        return documents
+
+    def cancel(self):
+        if self._settled:
+            return
+        self._settled = True
+        self.search.task.cancel()
+        self.stats.record_cancelled()
+
+
+class SpeculativeRetrieval:
+    """
+    Starts a hybrid search for the raw user query while the turn is being
+    classified. Retrieval nodes `take` the running search and merge its
+    results with their own; other nodes `cancel` it.
+    """
+
+    def __init__(self, vector_db: VectorDbService, enabled: bool = False):
+        self.vector_db = vector_db
+        self.enabled = enabled
+        self.stats = SpeculationStats()
+        self._searches: dict[str, SpeculativeSearch] = {}
+
+    def start(self, chat_id: str, user_input: UserInput):
+        self.cancel(chat_id)
+        if not self.enabled or not user_input.query.strip():
+            return
+
+        file_ids = user_input.selected_documents or None
+        user_filter = None if file_ids else user_input.filter
+
+        search = SpeculativeSearch(task=None, started_at=time.perf_counter())
+
+        async def run():
+            try:
+                return await self.vector_db.get_documents(
+                    [user_input.query],
+                    file_ids,
+                    user_filter=user_filter,
+                    output_fields=RESULT_FIELDS,
+                )
+            except Exception as err:
+                logger.warning(f"Speculative retrieval failed for chat {chat_id}: {err}")
+                return []
+            finally:
+                search.finished_at = time.perf_counter()
+
+        search.task = asyncio.create_task(run())
+        self._searches[chat_id] = search
+        self.stats.record_started()
+
+    def take(self, chat_id: str):
+        """Return a handle on the speculative search, or None."""
+        search = self._searches.pop(chat_id, None)
+        if not search:
+            return None
+        return TakenSearch(chat_id, search, self.stats)
+
+    def cancel(self, chat_id: str):
+        search = self._searches.pop(chat_id, None)
+        if search:
+            search.task.cancel()
+            self.stats.record_cancelled()
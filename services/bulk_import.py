@@ -0,0 +1,133 @@
+import time
+import uuid
+import logging
+
+from langchain_core.documents import Document
+from pymilvus import BulkInsertState, DataType, utility
+
+logger = logging.getLogger(__name__)
+
+_FIELD_DEFAULTS = {
+    DataType.VARCHAR: "",
+    DataType.INT64: 0,
+    DataType.INT32: 0,
+    DataType.FLOAT: 0.0,
+    DataType.DOUBLE: 0.0,
+    DataType.BOOL: False,
+}
+
+
+class BulkImporter:
+    """
+    Offline load path for large corpora: chunks, embeddings and metadata are
+    written as Parquet files into the object store Milvus reads from, then
+    loaded with server-side bulk import instead of row inserts.
+
+    The collection schema comes from the existing collection. When it does
+    not exist yet, the first batch is inserted the regular way so the store
+    creates it with the same schema as every other ingest path.
+    """
+
+    def __init__(
+        self,
+        vectordb,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        bucket: str = "a-bucket",
+        secure: bool = False,
+        remote_path: str = "bulk_import",
+        file_size_mb: int = 512,
+    ):
+        self.vectordb = vectordb
+        self.connect_param = {
+            "endpoint": endpoint,
+            "access_key": access_key,
+            "secret_key": secret_key,
+            "bucket_name": bucket,
+            "secure": secure,
+        }
+        self.remote_path = remote_path
+        self.file_size_mb = file_size_mb
+        self.rows = 0
+        self._writer = None
+
+    def _open_writer(self):
+        # Needs pymilvus[bulk_writer] (minio, pyarrow); only the bulk path uses it
+        from pymilvus.bulk_writer import RemoteBulkWriter, BulkFileType
+
+        self._fields = [
+            field
+            for field in self.vectordb.vectorstore.col.schema.fields
+            if not field.is_function_output
+        ]
+        self._writer = RemoteBulkWriter(
+            schema=self.vectordb.vectorstore.col.schema,
+            remote_path=self.remote_path,
+            connect_param=RemoteBulkWriter.S3ConnectParam(**self.connect_param),
+            chunk_size=self.file_size_mb * 1024 * 1024,
+            file_type=BulkFileType.PARQUET,
+        )
+        return self._writer
+
+    def _row(self, chunk: Document, embedding) -> dict:
+        store = self.vectordb.vectorstore
+        values = {
+            **chunk.metadata,
+            store._primary_field: chunk.id or str(uuid.uuid4()),
+            store._text_field: chunk.page_content,
+            store._as_list(store._vector_field)[0]: embedding,
+        }
+        return {
+            field.name: (
+                values[field.name]
+                if values.get(field.name) is not None
+                else _FIELD_DEFAULTS.get(field.dtype, "")
+            )
+            for field in self._fields
+        }
+
+    def append(self, chunks: list[Document], embeddings):
+        if self._writer is None and self.vectordb.vectorstore.col is None:
+            self.vectordb.insert_chunks(chunks, embeddings)
+            return
+        writer = self._writer or self._open_writer()
+        for chunk, embedding in zip(chunks, embeddings):
+            writer.append_row(self._row(chunk, embedding))
+        self.rows += len(chunks)
+
+    def finish(self, poll_seconds=2.0, timeout=None) -> int:
+        """Flush the remaining rows, import every file and wait; returns the rows imported."""
+        if self._writer is None:
+            return 0
+        self._writer.commit()
+        store = self.vectordb.vectorstore
+        collection = self.vectordb.serving_collection(store.collection_name)
+        task_ids = [
+            utility.do_bulk_insert(collection_name=collection, files=files, using=store.alias)
+            for files in self._writer.batch_files
+        ]
+        logger.info(f"Started {len(task_ids)} bulk import tasks for {self.rows} rows")
+
+        deadline = time.monotonic() + timeout if timeout else None
+        pending, imported = set(task_ids), 0
+        while pending:
+            for task_id in list(pending):
+                state = utility.get_bulk_insert_state(task_id, using=store.alias)
+                if state.state == BulkInsertState.ImportCompleted:
+                    imported += state.row_count
+                    pending.discard(task_id)
+                elif state.state in (
+                    BulkInsertState.ImportFailed,
+                    BulkInsertState.ImportFailedAndCleaned,
+                ):
+                    raise RuntimeError(
+                        f"Bulk import task {task_id} failed: {state.failed_reason}"
+                    )
+            if pending:
+                if deadline and time.monotonic() > deadline:
+                    raise TimeoutError(f"{len(pending)} bulk import tasks still running")
+                time.sleep(poll_seconds)
+
+        self._writer = None
+        return imported
@@ -0,0 +1,397 @@
+import re
+import uuid
+import hashlib
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from services.db import Db
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+
+# Fixed seed: signatures are persisted and must be comparable across runs
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    return {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    }
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the word shingles of a text."""
+    hashes = np.array(
+        [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "big")
+            for s in shingles(text)
+        ],
+        dtype=np.uint64,
+    ) % _PRIME
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> list[int]:
+    return [
+        int.from_bytes(
+            hashlib.blake2b(signature[i * ROWS : (i + 1) * ROWS].tobytes(), digest_size=8).digest(),
+            "big",
+            signed=True,
+        )
+        for i in range(BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    return float(np.mean(a == b))
+
+
+class DedupStats:
+    def __init__(self):
+        self.results = 0
+        self.duplicate_results = 0
+        self._lock = threading.Lock()
+
+    def record(self, results, duplicates):
+        with self._lock:
+            self.results += results
+            self.duplicate_results += duplicates
+
+
+class StagedChunks:
+    """Fingerprint and reference rows of filtered chunks, waiting for their insert."""
+
+    def __init__(self):
+        self.new_rows = []
+        self.ref_rows = []
+
+    def extend(self, other: "StagedChunks"):
+        self.new_rows += other.new_rows
+        self.ref_rows += other.ref_rows
+
+    @property
+    def referenced(self) -> set[str]:
+        """Stored chunks the staged references point to."""
+        return {row[1] for row in self.ref_rows}
+
+
+class ChunkDeduplicator:
+    """
+    Stores each near-duplicate chunk once per collection. Every indexed chunk
+    gets a MinHash signature whose bands are indexed (LSH), so candidates are
+    found with an index lookup; a chunk whose estimated Jaccard similarity to
+    an indexed chunk of another file reaches `threshold` is not inserted but
+    recorded as a reference from its file to the stored chunk.
+
+    With 8 bands of 8 rows a pair at similarity 0.8 becomes a candidate with
+    ~99% probability and a pair at 0.5 with ~3%.
+    """
+
+    def __init__(self, db: Db, scope: str, threshold=0.8, min_words=20):
+        self.db = db
+        self.scope = scope
+        self.threshold = threshold
+        self.min_words = min_words
+        self.stats = DedupStats()
+        self._lock = threading.Lock()
+
+        band_columns = "".join(f"band{i} INTEGER NOT NULL,\n" for i in range(BANDS))
+        self.db.execute(
+            f"""CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+                scope      TEXT NOT NULL,
+                pk         TEXT NOT NULL,
+                file_id    TEXT NOT NULL,
+                signature  BLOB NOT NULL,
+                {band_columns}
+                PRIMARY KEY (scope, pk)
+            )"""
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS chunk_refs (
+                scope        TEXT NOT NULL,
+                pk           TEXT NOT NULL,
+                file_id      TEXT NOT NULL,
+                page         INTEGER,
+                chunk_index  INTEGER,
+                PRIMARY KEY (scope, pk, file_id)
+            )"""
+        )
+        for i in range(BANDS):
+            self.db.execute(
+                f"""CREATE INDEX IF NOT EXISTS chunk_fingerprints_band{i}
+                ON chunk_fingerprints (scope, band{i})"""
+            )
+        self.db.execute(
+            """CREATE INDEX IF NOT EXISTS chunk_fingerprints_file
+            ON chunk_fingerprints (scope, file_id)"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS chunk_refs_file ON chunk_refs (scope, file_id)"
+        )
+
+    ### Ingest ###
+    def _candidates(self, keys: list[list[int]]):
+        if not keys:
+            return []
+        where, params = [], {"scope": self.scope}
+        for i in range(BANDS):
+            names = []
+            for j, value in enumerate(sorted({k[i] for k in keys})):
+                params[f"b{i}_{j}"] = value
+                names.append(f":b{i}_{j}")
+            where.append(f"band{i} IN ({','.join(names)})")
+        return self.db.get_rows(
+            f"""SELECT pk, file_id, signature FROM chunk_fingerprints
+            WHERE scope=:scope AND ({' OR '.join(where)})""",
+            params,
+        )
+
+    def _match(self, signature, file_id, known):
+        # A file never references its own chunks: a new version of a file
+        # must not match the chunks it is about to replace
+        for pk, other_file_id, other in known:
+            if other_file_id != file_id and similarity(signature, other) >= self.threshold:
+                return pk
+        return None
+
+    def filter(self, chunks: list[Document]) -> tuple[list[Document], "StagedChunks"]:
+        """
+        Return the chunks that must be inserted, each with a pre-assigned id,
+        and their staged fingerprints. Near-duplicates of indexed chunks of
+        other files (or of earlier chunks of other files in the batch) are
+        dropped and staged as references of their file. Nothing is recorded
+        until commit() is called with the staged rows, once the chunks are
+        inserted: a failed insert must not leave fingerprints of chunks that
+        do not exist.
+        """
+        with self._lock:
+            signatures = [
+                minhash(c.page_content)
+                if len(re.findall(r"\w+", c.page_content)) >= self.min_words
+                else None
+                for c in chunks
+            ]
+            keys = [band_keys(sig) if sig is not None else None for sig in signatures]
+            known = [
+                (
+                    row["pk"],
+                    row["file_id"],
+                    np.frombuffer(row["signature"], dtype=np.uint32),
+                )
+                for row in self._candidates([k for k in keys if k is not None])
+            ]
+
+            kept, staged = [], StagedChunks()
+            for chunk, signature, key in zip(chunks, signatures, keys):
+                file_id = chunk.metadata["file_id"]
+                canonical = (
+                    None if signature is None else self._match(signature, file_id, known)
+                )
+                if canonical:
+                    staged.ref_rows.append(
+                        (
+                            self.scope,
+                            canonical,
+                            file_id,
+                            chunk.metadata.get("page"),
+                            chunk.metadata.get("chunk_index"),
+                        )
+                    )
+                    continue
+                chunk.id = chunk.id or str(uuid.uuid4())
+                kept.append(chunk)
+                if signature is not None:
+                    known.append((chunk.id, file_id, signature))
+                    staged.new_rows.append(
+                        (
+                            self.scope,
+                            chunk.id,
+                            file_id,
+                            signature.tobytes(),
+                            *key,
+                        )
+                    )
+            return kept, staged
+
+    def commit(self, staged: "StagedChunks"):
+        """Record the fingerprints and references staged by filter()."""
+        with self._lock:
+            if staged.new_rows:
+                bands_sql = ", ".join(f"band{i}" for i in range(BANDS))
+                self.db.execute_many(
+                    f"""INSERT OR REPLACE INTO chunk_fingerprints
+                    (scope, pk, file_id, signature, {bands_sql})
+                    VALUES ({', '.join('?' * (4 + BANDS))})""",
+                    staged.new_rows,
+                )
+            if staged.ref_rows:
+                self.db.execute_many(
+                    """INSERT OR REPLACE INTO chunk_refs
+                    (scope, pk, file_id, page, chunk_index) VALUES (?, ?, ?, ?, ?)""",
+                    staged.ref_rows,
+                )
+
+    ### Lookups ###
+    def refs_for_files(self, file_ids: list[str]) -> list[dict]:
+        """
+        References of the files (pk, file_id, page, chunk_index, and owner_id
+        of the file storing the chunk).
+        """
+        if not file_ids:
+            return []
+        params = {"scope": self.scope}
+        names = []
+        for i, file_id in enumerate(file_ids):
+            params[f"f{i}"] = file_id
+            names.append(f":f{i}")
+        return self.db.get_rows(
+            f"""SELECT r.pk, r.file_id, r.page, r.chunk_index, f.file_id AS owner_id
+            FROM chunk_refs r
+            LEFT JOIN chunk_fingerprints f ON f.scope = r.scope AND f.pk = r.pk
+            WHERE r.scope=:scope AND r.file_id IN ({','.join(names)})""",
+            params,
+        )
+
+    def refs_matching(self, where: str, params: dict) -> list[dict]:
+        """
+        References of the files matching a `files` WHERE clause, like
+        refs_for_files: pk, file_id, page, chunk_index and owner_id.
+        """
+        return self.db.get_rows(
+            f"""SELECT r.pk, r.file_id, r.page, r.chunk_index, f.file_id AS owner_id
+            FROM chunk_refs r
+            JOIN chunk_fingerprints f ON f.scope = r.scope AND f.pk = r.pk
+            JOIN files ON files.id = r.file_id
+            WHERE r.scope=:ref_scope AND {where}""",
+            {**params, "ref_scope": self.scope},
+        )
+
+    def release_file(self, file_id: str) -> list[dict]:
+        """
+        Forget a file. Stored chunks it owns that other files still reference
+        are handed to one of those files; returns those hand-overs
+        (pk, file_id, page, chunk_index of the new owner) so the caller can
+        rewrite the chunks before deleting the file's remaining ones.
+        """
+        with self._lock:
+            handovers = self._release(file_id)
+            self.db.execute(
+                "DELETE FROM chunk_refs WHERE scope=:scope AND file_id=:file_id",
+                {"scope": self.scope, "file_id": file_id},
+            )
+            return handovers
+
+    def release_chunks(self, file_id: str, pks: list[str]) -> list[dict]:
+        """Like release_file, for some of the stored chunks of a file only."""
+        if not pks:
+            return []
+        with self._lock:
+            return self._release(file_id, pks)
+
+    def clear_refs(self, file_id: str, keep=()):
+        """Drop the references of a file, except those to the stored chunks in `keep`."""
+        params = {"scope": self.scope, "file_id": file_id}
+        names = []
+        for i, pk in enumerate(keep):
+            params[f"p{i}"] = pk
+            names.append(f":p{i}")
+        with self._lock:
+            self.db.execute(
+                f"""DELETE FROM chunk_refs WHERE scope=:scope AND file_id=:file_id
+                {f"AND pk NOT IN ({','.join(names)})" if names else ""}""",
+                params,
+            )
+
+    def _release(self, file_id: str, pks: list[str] | None = None) -> list[dict]:
+        params = {"scope": self.scope, "file_id": file_id}
+        in_pks = ""
+        if pks is not None:
+            names = []
+            for i, pk in enumerate(pks):
+                params[f"p{i}"] = pk
+                names.append(f":p{i}")
+            in_pks = f"IN ({','.join(names)})"
+        handovers = self.db.get_rows(
+            f"""SELECT r.pk, MIN(r.file_id) AS file_id FROM chunk_refs r
+            JOIN chunk_fingerprints f ON f.scope = r.scope AND f.pk = r.pk
+            WHERE r.scope=:scope AND f.file_id=:file_id AND r.file_id<>:file_id
+            {f"AND f.pk {in_pks}" if in_pks else ""}
+            GROUP BY r.pk""",
+            params,
+        )
+        handovers = [
+            self.db.get_row_or_default(
+                """SELECT pk, file_id, page, chunk_index FROM chunk_refs
+                WHERE scope=:scope AND pk=:pk AND file_id=:file_id""",
+                {"scope": self.scope, **row},
+            )
+            for row in handovers
+        ]
+        self.db.execute_many(
+            """UPDATE chunk_fingerprints SET file_id=? WHERE scope=? AND pk=?""",
+            [(row["file_id"], self.scope, row["pk"]) for row in handovers],
+        )
+        self.db.execute_many(
+            "DELETE FROM chunk_refs WHERE scope=? AND pk=? AND file_id=?",
+            [(self.scope, row["pk"], row["file_id"]) for row in handovers],
+        )
+        self.db.execute(
+            f"""DELETE FROM chunk_fingerprints
+            WHERE scope=:scope AND file_id=:file_id
+            {f"AND pk {in_pks}" if in_pks else ""}""",
+            params,
+        )
+        return handovers
+
+    def move_scope(self, old: str, new: str):
+        """Re-key fingerprints when the collection they describe changes name."""
+        with self._lock:
+            for table in ("chunk_fingerprints", "chunk_refs"):
+                self.db.execute(f"DELETE FROM {table} WHERE scope=:new", {"new": new})
+                self.db.execute(
+                    f"UPDATE {table} SET scope=:new WHERE scope=:old",
+                    {"old": old, "new": new},
+                )
+
+    ### Reporting ###
+    def record_results(self, documents: list[Document]):
+        """Count returned results that are near-duplicates of a higher-ranked one."""
+        seen, duplicates = [], 0
+        for doc in documents:
+            signature = minhash(doc.page_content)
+            if any(similarity(signature, other) >= self.threshold for other in seen):
+                duplicates += 1
+            seen.append(signature)
+        self.stats.record(len(documents), duplicates)
+
+    def snapshot(self):
+        params = {"scope": self.scope}
+        stored = self.db.get_row_or_default(
+            "SELECT COUNT(0) AS cnt FROM chunk_fingerprints WHERE scope=:scope", params
+        )["cnt"]
+        refs = self.db.get_row_or_default(
+            "SELECT COUNT(0) AS cnt FROM chunk_refs WHERE scope=:scope", params
+        )["cnt"]
+        with self.stats._lock:
+            results = self.stats.results
+            duplicate_results = self.stats.duplicate_results
+        return {
+            "scope": self.scope,
+            "threshold": self.threshold,
+            "stored_chunks": stored,
+            "duplicate_chunks": refs,
+            "index_reduction": refs / (stored + refs) if stored + refs else 0.0,
+            "results": results,
+            "duplicate_results": duplicate_results,
+            "duplicate_result_rate": duplicate_results / results if results else 0.0,
+        }
@@ -0,0 +1,321 @@
+import os
+import re
+import time
+import hashlib
+import queue
+import logging
+import importlib.util
+import multiprocessing
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from langchain_community.document_loaders import (
+    PDFPlumberLoader,
+    Docx2txtLoader,
+    TextLoader,
+    UnstructuredWordDocumentLoader,
+)
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from services.page_text_cache import PageTextCache
+
+logger = logging.getLogger(__name__)
+
+# Standard loader fields with defaults so every document type
+# produces the same Milvus schema regardless of loader used.
+_LOADER_DEFAULTS = {"page": 0, "total_pages": 1}
+
+# Bump when extraction or page normalization changes so cached page text
+# written by the previous version is not reused.
+EXTRACTOR_VERSION = "1"
+
+# Pages a fast parser may return before we decide whether its output is
+# good enough, and the average amount of text per page it has to reach.
+PROBE_PAGES = 5
+MIN_CHARS_PER_PAGE = 50
+
+
+class ParserLimitExceeded(Exception):
+    pass
+
+
+@dataclass
+class ParseOptions:
+    chunk_size: int = 600
+    chunk_overlap: int = 90
+    time_limit: float | None = None
+    memory_limit_mb: int | None = None
+    text_cache: PageTextCache | None = None
+
+
+@dataclass
+class ParserBackend:
+    name: str
+    factory: Callable[[str], object]
+    # Fall back to the next backend when the output averages fewer
+    # characters per page than this (0 = always accept)
+    min_chars_per_page: int = 0
+
+
+# Format -> backends, fastest first
+PARSERS: dict[str, list[ParserBackend]] = {}
+
+
+def register_parser(fmt: str, name: str, factory, min_chars_per_page=0):
+    PARSERS.setdefault(fmt, []).append(
+        ParserBackend(name, factory, min_chars_per_page)
+    )
+
+
+# pypdfium2 only reads the text layer, which is several times faster than
+# pdfplumber's layout analysis; pdfplumber stays as the fallback.
+if importlib.util.find_spec("pypdfium2"):
+    from langchain_community.document_loaders import PyPDFium2Loader
+
+    register_parser("pdf", "pypdfium2", PyPDFium2Loader, MIN_CHARS_PER_PAGE)
+register_parser("pdf", "pdfplumber", PDFPlumberLoader)
+register_parser("docx", "docx2txt", Docx2txtLoader)
+register_parser("doc", "unstructured", UnstructuredWordDocumentLoader)
+register_parser("txt", "text", lambda path: TextLoader(path, encoding="utf-8"))
+
+_EXTENSION_FORMATS = {".pdf": "pdf", ".docx": "docx", ".doc": "doc", ".txt": "txt"}
+
+
+def file_meta(file: dict) -> dict:
+    meta = {}
+    for md in file:
+        if md != "file_path":
+            # Milvus varchar fields reject None; default to empty string
+            meta[md] = file[md] if file[md] is not None else ""
+    return meta
+
+
+def detect_format(file_path: str) -> str:
+    """Pick the parser format from the file's leading bytes, then its extension."""
+    with open(file_path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return "doc"
+    if head.startswith(b"PK\x03\x04"):
+        return "docx"
+
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in _EXTENSION_FORMATS:
+        return _EXTENSION_FORMATS[ext]
+    raise ValueError("Unsupported file type: " + ext)
+
+
+def _page_chars(pages: list[Document]) -> int:
+    return sum(len(p.page_content.strip()) for p in pages)
+
+
+def _iter_pages_inprocess(file_path: str) -> Iterator[Document]:
+    """
+    Stream pages from the first registered backend whose output passes its
+    quality check. A backend is judged on its first PROBE_PAGES pages, which
+    are buffered so nothing is yielded until the backend is accepted.
+    """
+    backends = PARSERS[detect_format(file_path)]
+    for i, backend in enumerate(backends):
+        is_last = i == len(backends) - 1
+        try:
+            pages = backend.factory(file_path).lazy_load()
+            probe = []
+            for page in pages:
+                probe.append(page)
+                if len(probe) >= PROBE_PAGES:
+                    break
+        except Exception as err:
+            if is_last:
+                raise
+            logger.warning(f"{backend.name} failed on {file_path}: {err}")
+            continue
+
+        if (
+            not is_last
+            and backend.min_chars_per_page
+            and _page_chars(probe) < backend.min_chars_per_page * max(len(probe), 1)
+        ):
+            logger.info(f"{backend.name} found little text in {file_path}, falling back")
+            continue
+
+        yield from probe
+        yield from pages
+        return
+
+
+def _address_space_bytes() -> int:
+    """Virtual memory the current process already maps (0 where unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _extract_worker(file_path, pages: multiprocessing.Queue, memory_limit_mb):
+    if memory_limit_mb:
+        try:
+            import resource
+
+            # The forked child inherits the parent's mappings (models, numpy,
+            # the embedding cache); the limit is what the parser may add to them
+            limit = _address_space_bytes() + memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            # Not enforceable on this platform; the time limit still applies
+            pass
+    try:
+        for page in _iter_pages_inprocess(file_path):
+            pages.put(("page", page.page_content, page.metadata))
+        pages.put(("done", None, None))
+    except MemoryError:
+        pages.put(("error", f"memory limit of {memory_limit_mb} MB exceeded", None))
+    except Exception as err:
+        pages.put(("error", f"{type(err).__name__}: {err}", None))
+
+
+def _iter_pages_isolated(file_path, time_limit, memory_limit_mb) -> Iterator[Document]:
+    """
+    Run extraction in a child process so a parser that hangs or allocates
+    without bound is killed instead of taking the worker down with it.
+    Pages are streamed back through a small queue. The time limit counts
+    only the time spent waiting for the child, not the time the caller
+    takes between pages.
+    """
+    pages = multiprocessing.Queue(maxsize=8)
+    process = multiprocessing.Process(
+        target=_extract_worker,
+        args=(file_path, pages, memory_limit_mb),
+        daemon=True,
+    )
+    process.start()
+    deadline = time.monotonic() + time_limit if time_limit else None
+    try:
+        while True:
+            remaining = deadline - time.monotonic() if deadline else 1.0
+            if remaining <= 0:
+                raise ParserLimitExceeded(
+                    f"Parsing {os.path.basename(file_path)} exceeded {time_limit}s"
+                )
+            try:
+                kind, content, metadata = pages.get(timeout=min(remaining, 1.0))
+            except queue.Empty:
+                if not process.is_alive() and pages.empty():
+                    raise ParserLimitExceeded(
+                        f"Parser for {os.path.basename(file_path)} died "
+                        f"(exit code {process.exitcode})"
+                    )
+                continue
+            if kind == "done":
+                return
+            if kind == "error":
+                raise ParserLimitExceeded(content)
+            paused = time.monotonic()
+            yield Document(page_content=content, metadata=metadata)
+            if deadline:
+                # Time the consumer spends on a page (embedding, inserting) is
+                # not parsing time
+                deadline += time.monotonic() - paused
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        pages.close()
+
+
+def iter_pages(file_path: str, time_limit=None, memory_limit_mb=None) -> Iterator[Document]:
+    """Stream the pages of a file, isolated in a child process when limits are set."""
+    if time_limit or memory_limit_mb:
+        return _iter_pages_isolated(file_path, time_limit, memory_limit_mb)
+    return _iter_pages_inprocess(file_path)
+
+
+def chunk_id(file_id: str, text: str, occurrence: int = 1) -> str:
+    """Deterministic primary key: the file id plus a hash of the chunk text."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+    suffix = f"_{occurrence}" if occurrence > 1 else ""
+    return f"{file_id}_{digest}{suffix}"
+
+
+def normalize_page(page: Document) -> Document | None:
+    """Keep the page text and the standard loader fields; None for empty pages."""
+    if not isinstance(page, Document) or not page.page_content:
+        return None
+    text = page.page_content.replace("\r\n", "\n").strip()
+    if not text:
+        return None
+    metadata = {k: page.metadata.get(k, default) for k, default in _LOADER_DEFAULTS.items()}
+    return Document(page_content=text, metadata=metadata)
+
+
+def iter_normalized_pages(file: dict, options: ParseOptions) -> Iterator[Document]:
+    """Normalized pages of a file, from the page text cache when it has them."""
+    cache = options.text_cache
+    if cache:
+        cached = cache.read(file["file_id"], file["file_path"])
+        if cached is not None:
+            return cached
+
+    pages = (
+        normalized
+        for page in iter_pages(
+            file["file_path"], options.time_limit, options.memory_limit_mb
+        )
+        if (normalized := normalize_page(page)) is not None
+    )
+    if cache:
+        return cache.write_through(file["file_id"], file["file_path"], pages)
+    return pages
+
+
+def iter_chunk_batches(file: dict, batch_size=128, options: ParseOptions | None = None):
+    """
+    Lazily extract pages, split them one at a time and yield the chunks in
+    batches of at most batch_size, so memory stays bounded by the batch and
+    the current page rather than the whole document.
+    """
+    options = options or ParseOptions()
+    pages = iter_normalized_pages(file, options)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=options.chunk_size, chunk_overlap=options.chunk_overlap
+    )
+    original_file_name = file["original_file_name"]
+    meta = file_meta(file)
+
+    idx = 0
+    batch = []
+    occurrences = {}
+    for page in pages:
+        for doc in splitter.split_documents([page]):
+            text = re.sub(r"\s+", " ", doc.page_content).strip()  # normalize spaces
+            if not text:
+                continue
+            doc.page_content = text
+            doc.metadata = {**doc.metadata, **meta, "chunk_index": idx}
+            if idx == 0 and original_file_name:
+                doc.page_content = f"Source: {original_file_name}\n\n{doc.page_content}"
+            occurrences[doc.page_content] = occurrences.get(doc.page_content, 0) + 1
+            doc.id = chunk_id(file["file_id"], doc.page_content, occurrences[doc.page_content])
+            idx += 1
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def load_chunks(
+    file: dict, on_progress=None, options: ParseOptions | None = None
+) -> list[Document]:
+    """Extract, split and annotate all chunks of a file (no embedding or I/O to Milvus)."""
+    report = on_progress or (lambda stage: None)
+    chunks = [c for batch in iter_chunk_batches(file, options=options) for c in batch]
+    if chunks:
+        report("parsed")
+        report("chunked")
+    return chunks
@@ -0,0 +1,156 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EmbeddingRequest:
+    texts: list[str]
+    future: Future
+    submitted_at: float = field(default_factory=time.perf_counter)
+
+
+class BatcherStats:
+    def __init__(self, max_batch_size: int):
+        self._lock = threading.Lock()
+        self.max_batch_size = max_batch_size
+        self.requests = 0
+        self.texts = 0
+        self.embedded_texts = 0
+        self.batches = 0
+        self.fill_ratio_sum = 0.0
+        self.queue_delay_ms_sum = 0.0
+        self.max_queue_delay_ms = 0.0
+
+    def record_batch(self, requests: list[_EmbeddingRequest], unique_texts: int):
+        started = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.requests += len(requests)
+            self.texts += sum(len(r.texts) for r in requests)
+            self.embedded_texts += unique_texts
+            self.fill_ratio_sum += min(unique_texts / self.max_batch_size, 1.0)
+            for request in requests:
+                delay_ms = (started - request.submitted_at) * 1000
+                self.queue_delay_ms_sum += delay_ms
+                self.max_queue_delay_ms = max(self.max_queue_delay_ms, delay_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "embedded_texts": self.embedded_texts,
+                "batches": self.batches,
+                "max_batch_size": self.max_batch_size,
+                "avg_fill_ratio": (
+                    self.fill_ratio_sum / self.batches if self.batches else 0.0
+                ),
+                "avg_queue_delay_ms": (
+                    self.queue_delay_ms_sum / self.requests if self.requests else 0.0
+                ),
+                "max_queue_delay_ms": self.max_queue_delay_ms,
+            }
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Coalesces embedding requests from concurrent callers (sync or async) that
+    arrive within `max_wait_ms` into batched calls to the wrapped model.
+    Identical texts within a batch are embedded once.
+
+    Requests of at most `query_size` texts (chat queries) are batched and
+    flushed on their own worker, so they never wait behind an ingestion batch.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, max_batch_size=64, max_wait_ms=10, query_size=8
+    ):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.query_size = query_size
+        self.stats = BatcherStats(max_batch_size)
+        self._query_queue: queue.Queue[_EmbeddingRequest] = queue.Queue()
+        self._bulk_queue: queue.Queue[_EmbeddingRequest] = queue.Queue()
+        self._workers = [
+            threading.Thread(
+                target=self._run, args=(q,), name=f"embedding-batcher-{name}", daemon=True
+            )
+            for name, q in (("query", self._query_queue), ("bulk", self._bulk_queue))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def model(self):
+        return getattr(self.embeddings, "model", None)
+
+    ### Embeddings interface ###
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._submit(texts).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    ### Batching ###
+    def _submit(self, texts: list[str]) -> Future:
+        future = Future()
+        if not texts:
+            future.set_result([])
+        elif len(texts) <= self.query_size:
+            self._query_queue.put(_EmbeddingRequest(list(texts), future))
+        else:
+            self._bulk_queue.put(_EmbeddingRequest(list(texts), future))
+        return future
+
+    def _run(self, requests_queue: queue.Queue):
+        while True:
+            requests = [requests_queue.get()]
+            pending = len(requests[0].texts)
+            deadline = time.perf_counter() + self.max_wait
+            while pending < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = requests_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                pending += len(request.texts)
+            self._embed(requests)
+
+    def _embed(self, requests: list[_EmbeddingRequest]):
+        # Skip requests whose callers were cancelled while queued
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+        unique_texts = list(dict.fromkeys(t for r in requests for t in r.texts))
+        self.stats.record_batch(requests, len(unique_texts))
+        try:
+            vectors = {}
+            for start in range(0, len(unique_texts), self.max_batch_size):
+                batch = unique_texts[start : start + self.max_batch_size]
+                vectors.update(zip(batch, self.embeddings.embed_documents(batch)))
+        except Exception as err:
+            logger.warning(f"Batched embedding of {len(unique_texts)} texts failed: {err}")
+            for request in requests:
+                request.future.set_exception(err)
+            return
+        for request in requests:
+            request.future.set_result([vectors[t] for t in request.texts])
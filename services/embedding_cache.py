@@ -0,0 +1,243 @@
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of chunk embeddings for one model.
+
+    Vectors live in a memory-mapped array (`<model>.vectors`), one row per
+    slot; a SQLite index maps the hash of the normalized chunk text to its
+    slot and last use. When `max_entries` is reached the least recently used
+    entries are evicted and their slots reused.
+
+    The cache directory is shared by the app, the loader and reindex. Slots
+    are claimed and written under an exclusive SQLite lock, and lookups copy
+    vectors while holding a shared one, so a row is never read while another
+    process rewrites it.
+    """
+
+    def __init__(
+        self, cache_dir, model_name: str, max_entries=100_000, dtype="float16"
+    ):
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        model_slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        cache_path = Path(cache_dir)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = cache_path / f"{model_slug}.{self.dtype.name}.vectors"
+        self.index_path = cache_path / f"{model_slug}.{self.dtype.name}.sqlite"
+
+        self._lock = threading.Lock()
+        # Transactions are explicit (see _get/_put); the index stays in rollback
+        # journal mode so an exclusive lock also keeps readers out
+        self._conn = sqlite3.connect(
+            self.index_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    slot INTEGER NOT NULL UNIQUE,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+        row = self._conn.execute("SELECT value FROM meta WHERE name='dim'").fetchone()
+        self.dim = row[0] if row else None
+        self._vectors = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    ### Storage ###
+    def _open_vectors(self, dim: int):
+        if self._vectors is not None:
+            return self._vectors
+        if self.dim is None:
+            self.dim = dim
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)",
+                    (dim,),
+                )
+        size = self.max_entries * self.dim * self.dtype.itemsize
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(
+            self.vectors_path,
+            dtype=self.dtype,
+            mode="r+",
+            shape=(self.max_entries, self.dim),
+        )
+        return self._vectors
+
+    def _get(self, keys: list[str]) -> dict[str, np.ndarray]:
+        if self.dim is None or not keys:
+            return {}
+        vectors = self._open_vectors(self.dim)
+        found = {}
+        self._conn.execute("BEGIN")
+        try:
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))}) "
+                    "AND slot < ?",
+                    (*batch, self.max_entries),
+                ).fetchall()
+                for key, slot in rows:
+                    found[key] = np.array(vectors[slot], dtype=np.float32)
+        finally:
+            self._conn.execute("COMMIT")
+        if found:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE entries SET last_used=? WHERE key=?",
+                    [(now, key) for key in found],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return found
+
+    def _put(self, items: dict[str, list[float]]):
+        if not items:
+            return
+        dim = len(next(iter(items.values())))
+        if self.dim is not None and dim != self.dim:
+            logger.warning(
+                f"Embedding dimension changed ({self.dim} -> {dim}); not caching"
+            )
+            return
+        vectors = self._open_vectors(dim)
+        items = dict(list(items.items())[: self.max_entries])
+
+        # Other processes share the cache: claim slots and write the rows
+        # under one exclusive lock
+        self._conn.execute("BEGIN EXCLUSIVE")
+        try:
+            # Entries beyond a reduced max_entries are dropped first
+            self._conn.execute(
+                "DELETE FROM entries WHERE slot >= ?", (self.max_entries,)
+            )
+            keys = list(items)
+            for start in range(0, len(keys), 500):
+                batch = keys[start : start + 500]
+                for (key,) in self._conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ):
+                    # Cached by another process meanwhile
+                    items.pop(key, None)
+
+            # Slots below next_slot have been handed out; reuse needs eviction
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name='next_slot'"
+            ).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT COALESCE(MAX(slot) + 1, 0) FROM entries"
+                ).fetchone()
+            next_slot = min(row[0], self.max_entries)
+            fresh = min(len(items), self.max_entries - next_slot)
+            free = list(range(next_slot, next_slot + fresh))
+
+            shortfall = len(items) - len(free)
+            if shortfall > 0:
+                evicted = self._conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used ASC LIMIT ?",
+                    (shortfall,),
+                ).fetchall()
+                self._conn.executemany(
+                    "DELETE FROM entries WHERE key=?", [(key,) for key, _ in evicted]
+                )
+                free.extend(slot for _, slot in evicted)
+                self.evictions += len(evicted)
+
+            now = time.time()
+            rows = []
+            for (key, vector), slot in zip(items.items(), free):
+                vectors[slot] = np.asarray(vector, dtype=self.dtype)
+                rows.append((key, slot, now))
+            vectors.flush()
+            self._conn.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('next_slot', ?)",
+                (next_slot + fresh,),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    ### Public ###
+    def embed_documents(self, embeddings, texts: list[str]) -> list[list[float]]:
+        """Embed texts, calling the model only for texts not in the cache."""
+        keys = [text_hash(text) for text in texts]
+        with self._lock:
+            found = self._get(list(set(keys)))
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in found and key not in missing:
+                    missing[key] = text
+            misses = sum(1 for key in keys if key in missing)
+            self.hits += len(texts) - misses
+            self.misses += misses
+
+        computed = {}
+        if missing:
+            vectors = embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._put(computed)
+
+        return [
+            computed[key] if key in computed else found[key].tolist() for key in keys
+        ]
+
+    def snapshot(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
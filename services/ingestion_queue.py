@@ -0,0 +1,228 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from pathlib import Path
+
+from services.db import Db
+
+logger = logging.getLogger(__name__)
+
+# Stages reported by VectorDbService.add_file and update_file, in order
+STAGES = ["parsed", "chunked", "embedded", "indexed"]
+
+# Job kinds
+ADD = "add"
+UPDATE = "update"
+
+
+class IngestionQueue:
+    """
+    Durable SQLite-backed queue of document ingestion jobs.
+
+    Jobs are processed by a pool of worker threads so parsing, embedding and
+    the Milvus insert never block the event loop. A worker takes up to
+    `batch_files` queued uploads at once so their chunks are embedded and
+    inserted in shared batches. Jobs of a file are run one at a time: a job
+    is not claimed while another job of its file is running. Jobs left
+    unfinished by a restart are queued again when the queue starts.
+    """
+
+    def __init__(self, db: Db, vectordb, workers: int = 2, batch_files: int = 8):
+        self.db = db
+        self.vectordb = vectordb
+        self.workers = workers
+        self.batch_files = batch_files
+        self._wakeup = threading.Condition()
+        self._claim_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id          TEXT PRIMARY KEY,
+                file_id     TEXT NOT NULL,
+                kind        TEXT NOT NULL DEFAULT 'add',
+                payload     TEXT NOT NULL,
+                status      TEXT NOT NULL DEFAULT 'queued',
+                stage       TEXT,
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                error       TEXT,
+                created_at  TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at  TEXT DEFAULT CURRENT_TIMESTAMP
+            )"""
+        )
+        columns = {row["name"] for row in self.db.get_rows("PRAGMA table_info(ingestion_jobs)")}
+        if "kind" not in columns:
+            self.db.execute(
+                "ALTER TABLE ingestion_jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'add'"
+            )
+
+    ### Lifecycle ###
+    def start(self):
+        # Resume jobs interrupted by a restart
+        self.db.execute(
+            """UPDATE ingestion_jobs SET status='queued', updated_at=CURRENT_TIMESTAMP
+            WHERE status='running'"""
+        )
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"ingestion-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    ### Jobs ###
+    def enqueue(self, file: dict, kind: str = ADD) -> str:
+        return self.enqueue_many([file], kind)[0]
+
+    def enqueue_many(self, files: list[dict], kind: str = ADD) -> list[str]:
+        job_ids = [str(uuid.uuid4()) for _ in files]
+        self.db.execute_many(
+            """INSERT INTO ingestion_jobs (id, file_id, kind, payload)
+            VALUES (:id, :file_id, :kind, :payload)""",
+            [
+                {
+                    "id": job_id,
+                    "file_id": file["file_id"],
+                    "kind": kind,
+                    "payload": json.dumps(file),
+                }
+                for job_id, file in zip(job_ids, files)
+            ],
+        )
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return job_ids
+
+    def get_job(self, job_id: str):
+        job = self.db.get_row_or_default(
+            """SELECT id, file_id, kind, status, stage, attempts, error, created_at,
+                updated_at
+            FROM ingestion_jobs WHERE id=:id""",
+            {"id": job_id},
+        )
+        if job:
+            done = STAGES.index(job["stage"]) + 1 if job["stage"] in STAGES else 0
+            job["progress"] = done / len(STAGES)
+        return job
+
+    def _claim(self) -> list[dict]:
+        with self._claim_lock:
+            # Two runs of update_file for one file would diff against the same
+            # stored chunks and insert the same chunk ids twice
+            idle = """file_id NOT IN (
+                SELECT file_id FROM ingestion_jobs WHERE status='running')"""
+            job = self.db.get_row_or_default(
+                f"""SELECT * FROM ingestion_jobs WHERE status='queued' AND {idle}
+                ORDER BY created_at ASC LIMIT 1"""
+            )
+            if not job:
+                return []
+            jobs = [job]
+            if job["kind"] == ADD and self.batch_files > 1:
+                jobs += self.db.get_rows(
+                    f"""SELECT * FROM ingestion_jobs
+                    WHERE status='queued' AND kind=:kind AND id<>:id AND {idle}
+                    ORDER BY created_at ASC LIMIT :limit""",
+                    {"kind": ADD, "id": job["id"], "limit": self.batch_files - 1},
+                )
+            self.db.execute_many(
+                """UPDATE ingestion_jobs
+                SET status='running', stage=NULL, attempts=attempts+1,
+                    updated_at=CURRENT_TIMESTAMP
+                WHERE id=:id""",
+                [{"id": job["id"]} for job in jobs],
+            )
+            return jobs
+
+    def _update(self, job_id: str, **fields):
+        sets = ", ".join(f"{key}=:{key}" for key in fields)
+        self.db.execute(
+            f"""UPDATE ingestion_jobs SET {sets}, updated_at=CURRENT_TIMESTAMP
+            WHERE id=:id""",
+            {**fields, "id": job_id},
+        )
+
+    ### Worker ###
+    def _run(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            jobs = self._claim()
+            if not jobs:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(timeout=5)
+                continue
+            if jobs[0]["kind"] == UPDATE:
+                self._process_update(jobs[0])
+            else:
+                self._process_adds(jobs)
+
+    def _process_adds(self, jobs):
+        job_ids = {job["file_id"]: job["id"] for job in jobs}
+        files = [json.loads(job["payload"]) for job in jobs]
+        try:
+            # A previous attempt may have inserted part of the chunks
+            retried = [job["file_id"] for job in jobs if job["attempts"] > 0]
+            if retried:
+                self.vectordb.delete_files(retried)
+            errors = self.vectordb.add_files(
+                files,
+                on_progress=lambda file_id, stage: self._update(job_ids[file_id], stage=stage),
+            )
+            for file_id, error in errors.items():
+                self._update(
+                    job_ids[file_id], status="failed" if error else "done", error=error
+                )
+        except Exception as err:
+            logger.exception(f"Ingestion jobs {list(job_ids.values())} failed")
+            for job_id in job_ids.values():
+                self._update(job_id, status="failed", error=str(err))
+
+    def _process_update(self, job):
+        job_id = job["id"]
+        file = json.loads(job["payload"])
+        # The new version waits in a staging file, so the served copy is not
+        # overwritten while an earlier job may still be reading it
+        staged = file.pop("staged_path", None)
+        if staged and not os.path.exists(staged):
+            # Moved into place by an attempt interrupted before it finished
+            staged = None
+        current = self.vectordb.get_file_data(file["file_id"])
+        try:
+            # Updates diff by chunk id, so a retry just picks up where it stopped
+            result = self.vectordb.update_file(
+                {**file, "file_path": staged} if staged else file,
+                on_progress=lambda stage: self._update(job_id, stage=stage),
+            )
+            if result is None:
+                self._update(job_id, status="failed", error="No text could be extracted")
+            else:
+                if staged:
+                    os.replace(staged, file["file_path"])
+                    staged = None
+                if current and current["file_name"] != file["file_name"]:
+                    # The new version has another extension; the old copy is not served any more
+                    folder = os.path.dirname(file["file_path"])
+                    Path(folder, current["file_name"]).unlink(missing_ok=True)
+                logger.info(f"Updated {file['file_id']}: {result}")
+                self._update(job_id, status="done", error=None)
+        except Exception as err:
+            logger.exception(f"Ingestion job {job_id} failed")
+            self._update(job_id, status="failed", error=str(err))
+        finally:
+            if staged:
+                Path(staged).unlink(missing_ok=True)
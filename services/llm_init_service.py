@@ -1,5 +1,7 @@
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 
+from services.embedding_batcher import BatchingEmbeddings
+
 
 def GetTextLLModle(model_name, temprature=0):
     return ChatOllama(model=model_name, temperature=temprature)
@@ -11,5 +13,9 @@ def GetInstructLLModle(model_name):
     )
 
 
-def GetEmbeddingModel(model_name):
-    return OllamaEmbeddings(model=model_name)
+def GetEmbeddingModel(model_name, max_batch_size=64, max_wait_ms=0):
+    embedding_model = OllamaEmbeddings(model=model_name)
+    if max_wait_ms > 0:
+        # Coalesce concurrent requests into batched Ollama calls
+        return BatchingEmbeddings(embedding_model, max_batch_size, max_wait_ms)
+    return embedding_model
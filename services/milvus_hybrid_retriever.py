@@ -3,6 +3,7 @@ from itertools import chain
 from typing import List, Dict, Any
 from langchain_core.documents import Document
 from langchain_core.runnables import Runnable
+from pymilvus import AnnSearchRequest
 
 
 class HybridRetrieverWithScores(Runnable):
@@ -41,3 +42,74 @@ class HybridRetrieverWithScores(Runnable):
 
     async def abatch(self, queries: List[str], **kwargs) -> List[List[Document]]:
         return await asyncio.gather(*[self.ainvoke(q, **kwargs) for q in queries])
+
+    async def abatch_hybrid(self, queries: List[str]) -> List[List[Document]]:
+        """Embed all queries in one call and run one multi-vector (nq>1) hybrid search."""
+        store = self.store
+        if store.col is None or not queries:
+            return [[] for _ in queries]
+
+        vector_fields = store._as_list(store._vector_field)
+        embedding_funcs = store._as_list(store.embedding_func)
+        embedding_fields = store._vector_fields_from_embedding
+        vectors = {
+            field: await embedding_funcs[i].aembed_documents(queries)
+            for i, field in enumerate(embedding_fields)
+        }
+
+        fetch_k = self.search_kwargs.get("fetch_k", self.k)
+        expr = self.search_kwargs.get("expr")
+        param_list = store._as_list(
+            self.search_kwargs.get("param") or store.search_params
+        )
+        search_requests = [
+            AnnSearchRequest(
+                data=vectors.get(field, queries),
+                anns_field=field,
+                param=param,
+                limit=fetch_k,
+                expr=expr,
+            )
+            for field, param in zip(vector_fields, param_list)
+        ]
+        ranker = store._create_ranker(
+            ranker_type=self.search_kwargs.get("ranker_type"),
+            ranker_params=self.search_kwargs.get("ranker_params") or {},
+        )
+        if self.search_kwargs.get("output_fields"):
+            output_fields = self.search_kwargs["output_fields"]
+        elif store.enable_dynamic_field:
+            output_fields = ["*"]
+        else:
+            output_fields = store._remove_forbidden_fields(store.fields[:])
+
+        # Grouping search: `limit` counts groups, each of up to group_size hits
+        grouping = {
+            key: self.search_kwargs[key]
+            for key in ("group_by_field", "group_size", "strict_group_size")
+            if key in self.search_kwargs
+        }
+        results = await store.aclient.hybrid_search(
+            store.collection_name,
+            reqs=search_requests,
+            ranker=ranker,
+            limit=self.k,
+            output_fields=output_fields,
+            timeout=store.timeout,
+            **grouping,
+        )
+
+        lists: List[List[Document]] = []
+        for hits in results:
+            docs: List[Document] = []
+            for hit in hits:
+                entity = hit["entity"]
+                if store._text_field in entity:
+                    doc = store._parse_document(entity)
+                else:
+                    # A projection without the chunk text
+                    doc = Document(page_content="", metadata=entity)
+                doc.metadata = {**doc.metadata, "score": float(hit["distance"])}
+                docs.append(doc)
+            lists.append(docs)
+        return lists
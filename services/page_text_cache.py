@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class PageTextCache:
+    """
+    Extracted page text, stored next to the documents as
+    `<file_id>.pages-v<version>.jsonl.gz`: a header line with the source
+    file's size and mtime, then one line per page. Entries written by another
+    extractor version, or for a source file that changed since, are ignored,
+    so re-chunking and re-embedding can skip the parsers entirely.
+    """
+
+    def __init__(self, cache_dir, version: str):
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, file_id: str) -> Path:
+        return self.cache_dir / f"{file_id}.pages-v{self.version}.jsonl.gz"
+
+    def _source_key(self, file_path: str):
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def read(self, file_id: str, file_path: str) -> Iterator[Document] | None:
+        """Return the cached pages of a file, or None when there is no valid entry."""
+        path = self.path(file_id)
+        try:
+            f = gzip.open(path, "rt", encoding="utf-8")
+        except FileNotFoundError:
+            self._count(False)
+            return None
+
+        try:
+            header = json.loads(f.readline())
+            valid = (
+                header.get("version") == self.version
+                and header.get("source") == self._source_key(file_path)
+            )
+        except (OSError, ValueError):
+            valid = False
+        if not valid:
+            f.close()
+            self._count(False)
+            return None
+
+        self._count(True)
+
+        def pages():
+            with f:
+                for line in f:
+                    page = json.loads(line)
+                    yield Document(page_content=page["text"], metadata=page["meta"])
+
+        return pages()
+
+    def write_through(
+        self, file_id: str, file_path: str, pages: Iterable[Document]
+    ) -> Iterator[Document]:
+        """
+        Yield the pages while writing them to the cache. The entry is only
+        published once every page was written, so a failed or abandoned
+        extraction never leaves a truncated entry behind.
+        """
+        path = self.path(file_id)
+        partial = path.with_name(path.name + ".part")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        header = {"version": self.version, "source": self._source_key(file_path)}
+        completed = False
+        try:
+            with gzip.open(partial, "wt", encoding="utf-8", compresslevel=6) as f:
+                f.write(json.dumps(header) + "\n")
+                for page in pages:
+                    f.write(
+                        json.dumps(
+                            {"text": page.page_content, "meta": page.metadata},
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+                    yield page
+            os.replace(partial, path)
+            completed = True
+        finally:
+            if not completed and partial.exists():
+                partial.unlink()
+
+    def delete(self, file_id: str):
+        for path in self.cache_dir.glob(f"{file_id}.pages-v*.jsonl.gz"):
+            path.unlink(missing_ok=True)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,100 @@
+import time
+import uuid
+
+from services.db import Db
+
+# Run statuses
+BUILDING = "building"
+SWAPPED = "swapped"
+FAILED = "failed"
+ROLLED_BACK = "rolled_back"
+
+
+class ReindexRuns:
+    """
+    History of shadow re-index runs: which collection was built, which one
+    it replaced behind the alias, and how far the build has got. The admin
+    command writes it; the API reads it to report progress and ETA.
+    """
+
+    def __init__(self, db: Db):
+        self.db = db
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS reindex_runs (
+                id                   TEXT PRIMARY KEY,
+                alias                TEXT NOT NULL,
+                collection           TEXT NOT NULL,
+                previous_collection  TEXT,
+                embedding_model      TEXT,
+                status               TEXT NOT NULL,
+                total_files          INTEGER NOT NULL DEFAULT 0,
+                done_files           INTEGER NOT NULL DEFAULT 0,
+                chunks               INTEGER NOT NULL DEFAULT 0,
+                failed_files         INTEGER NOT NULL DEFAULT 0,
+                error                TEXT,
+                started_at           REAL NOT NULL,
+                updated_at           REAL NOT NULL
+            )"""
+        )
+
+    def start(self, alias, collection, embedding_model, total_files) -> str:
+        run_id = str(uuid.uuid4())
+        now = time.time()
+        self.db.execute(
+            """INSERT INTO reindex_runs
+                (id, alias, collection, embedding_model, status, total_files,
+                 started_at, updated_at)
+            VALUES (:id, :alias, :collection, :embedding_model, :status,
+                    :total_files, :now, :now)""",
+            {
+                "id": run_id,
+                "alias": alias,
+                "collection": collection,
+                "embedding_model": embedding_model,
+                "status": BUILDING,
+                "total_files": total_files,
+                "now": now,
+            },
+        )
+        return run_id
+
+    def update(self, run_id: str, **fields):
+        sets = ", ".join(f"{key}=:{key}" for key in fields)
+        self.db.execute(
+            f"UPDATE reindex_runs SET {sets}, updated_at=:now WHERE id=:id",
+            {**fields, "id": run_id, "now": time.time()},
+        )
+
+    def latest(self, alias: str, status: str | None = None):
+        run = self.db.get_row_or_default(
+            """SELECT * FROM reindex_runs
+            WHERE alias=:alias AND (:status IS NULL OR status=:status)
+            ORDER BY started_at DESC LIMIT 1""",
+            {"alias": alias, "status": status},
+        )
+        if run:
+            run.update(self._progress(run))
+        return run
+
+    def collections(self, alias: str) -> list[str]:
+        rows = self.db.get_rows(
+            "SELECT collection, previous_collection FROM reindex_runs WHERE alias=:alias",
+            {"alias": alias},
+        )
+        names = {row["collection"] for row in rows}
+        names |= {row["previous_collection"] for row in rows if row["previous_collection"]}
+        return sorted(names)
+
+    @staticmethod
+    def _progress(run):
+        processed = run["done_files"] + run["failed_files"]
+        total = run["total_files"]
+        elapsed = run["updated_at"] - run["started_at"]
+        eta = None
+        if run["status"] == BUILDING and processed:
+            eta = elapsed / processed * max(total - processed, 0)
+        return {
+            "progress": processed / total if total else 1.0,
+            "elapsed_seconds": elapsed,
+            "eta_seconds": eta,
+        }
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from services.db import Db
+
+BLOCK_SIZE = 1 << 20
+MAX_FORM_FIELD_SIZE = 1 << 20
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Upload continues at offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(Exception):
+    pass
+
+
+class UploadStore:
+    """
+    Writes uploads to DOCUMENT_FOLDER_DIR block by block, as the request body
+    arrives, while their SHA-256 is computed, so large files are never held
+    in memory and an exact duplicate of an indexed file is recognised before
+    it is ingested.
+
+    Resumable uploads are appended to `uploads/<upload_id>.part`. The size of
+    the part file is the offset the client resumes from; the hash state is
+    kept in memory and rebuilt from the part file when it is missing (after a
+    restart, or when another process served the previous block).
+    """
+
+    def __init__(self, db: Db, folder: str, session_ttl_hours: float = 24):
+        self.db = db
+        self.folder = folder
+        self.parts_dir = os.path.join(folder, "uploads")
+        self.session_ttl = session_ttl_hours * 3600
+        self._hashers = {}  # upload_id -> (offset, sha256 state)
+        self._active: set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS file_hashes (
+                file_id       TEXT PRIMARY KEY,
+                content_hash  TEXT NOT NULL
+            )"""
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS file_hashes_hash ON file_hashes (content_hash)"
+        )
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS uploads (
+                id          TEXT PRIMARY KEY,
+                file_name   TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                meta        TEXT NOT NULL,
+                created_at  REAL NOT NULL
+            )"""
+        )
+
+    ### Content hashes ###
+    def find_duplicate(self, content_hash: str):
+        """Id of an indexed (or queued) file with this content, if any."""
+        row = self.db.get_row_or_default(
+            """SELECT h.file_id FROM file_hashes h
+            WHERE h.content_hash=:hash
+              AND (EXISTS (SELECT 1 FROM files f WHERE f.id = h.file_id)
+                   OR EXISTS (SELECT 1 FROM ingestion_jobs j
+                              WHERE j.file_id = h.file_id
+                                AND j.status IN ('queued', 'running')))
+            LIMIT 1""",
+            {"hash": content_hash},
+        )
+        return row["file_id"] if row else None
+
+    def register(self, file_id: str, content_hash: str):
+        self.db.execute(
+            """INSERT OR REPLACE INTO file_hashes (file_id, content_hash)
+            VALUES (:file_id, :hash)""",
+            {"file_id": file_id, "hash": content_hash},
+        )
+
+    def forget(self, file_ids: list[str]):
+        self.db.execute_many(
+            "DELETE FROM file_hashes WHERE file_id=?", [(id,) for id in file_ids]
+        )
+
+    async def receive_form(self, body, content_type: str, accept=None):
+        """
+        Stream a multipart/form-data request body from the async iterable
+        `body`. File parts are written to staging files block by block as
+        they arrive while their SHA-256 is computed, so the request is never
+        buffered. Returns (fields, files) where files lists the `name`,
+        `filename`, staging `path` and `content_hash` of each file part;
+        `accept(filename)` rejects a file part with ValueError.
+        """
+        mimetype, options = parse_options_header(content_type)
+        if mimetype != "multipart/form-data" or not options.get("boundary"):
+            raise ValueError("Expected a multipart/form-data body")
+        decoder = MultipartDecoder(options["boundary"].encode(), MAX_FORM_FIELD_SIZE)
+        fields, files = {}, []
+        part, value, out, digest = None, None, None, None
+
+        def handle(event):
+            nonlocal part, value, out, digest
+            if isinstance(event, Field):
+                part, value = event, bytearray()
+            elif isinstance(event, File):
+                if accept and event.filename and not accept(event.filename):
+                    raise ValueError("File type not allowed")
+                path = self.staging_path(os.path.splitext(event.filename)[1].lower())
+                part, out, digest = event, open(path, "wb"), hashlib.sha256()
+                files.append({"name": event.name, "filename": event.filename, "path": path})
+            elif isinstance(event, Data):
+                if out:
+                    digest.update(event.data)
+                    out.write(event.data)
+                else:
+                    value.extend(event.data)
+                if event.more_data:
+                    return
+                if out:
+                    out.close()
+                    files[-1]["content_hash"] = digest.hexdigest()
+                    out = None
+                else:
+                    fields.setdefault(part.name, value.decode("utf-8"))
+
+        try:
+            async for block in body:
+                decoder.receive_data(block)
+                while not isinstance(event := decoder.next_event(), (NeedData, Epilogue)):
+                    handle(event)
+            decoder.receive_data(None)
+            while not isinstance(event := decoder.next_event(), (NeedData, Epilogue)):
+                handle(event)
+            if out or not isinstance(event, Epilogue):
+                raise ValueError("Incomplete multipart body")
+        except BaseException:
+            if out:
+                out.close()
+            self.discard_files(files)
+            raise
+        return fields, files
+
+    def discard_files(self, files: list[dict]):
+        """Remove the staging files of received file parts."""
+        for file in files:
+            if os.path.exists(file["path"]):
+                os.remove(file["path"])
+
+    def staging_path(self, ext: str) -> str:
+        """A new file next to the upload parts, on the same file system as the documents."""
+        return os.path.join(self.parts_dir, f"{uuid.uuid4()}{ext}")
+
+    ### Resumable uploads ###
+    def create(self, file_name: str, size: int, meta: dict) -> dict:
+        self.expire()
+        upload = {
+            "id": str(uuid.uuid4()),
+            "file_name": file_name,
+            "size": size,
+            "meta": json.dumps(meta),
+            "created_at": time.time(),
+        }
+        self.db.execute(
+            """INSERT INTO uploads (id, file_name, size, meta, created_at)
+            VALUES (:id, :file_name, :size, :meta, :created_at)""",
+            upload,
+        )
+        open(self._part_path(upload["id"]), "wb").close()
+        return self.get(upload["id"])
+
+    def get(self, upload_id: str):
+        upload = self.db.get_row_or_default(
+            "SELECT * FROM uploads WHERE id=:id", {"id": upload_id}
+        )
+        if upload:
+            upload["meta"] = json.loads(upload["meta"])
+            path = self._part_path(upload_id)
+            upload["offset"] = os.path.getsize(path) if os.path.exists(path) else 0
+        return upload
+
+    async def append(self, upload: dict, offset: int, body) -> int:
+        """
+        Stream a block of the upload from the async iterable `body`, which
+        must start at `offset`; returns the new offset. A dropped connection
+        keeps what was written, and the client resumes from the offset.
+        """
+        upload_id = upload["id"]
+        with self._lock:
+            if upload_id in self._active:
+                raise UploadBusy(f"Upload {upload_id} is already receiving data")
+            self._active.add(upload_id)
+        try:
+            path = self._part_path(upload_id)
+            if offset != os.path.getsize(path):
+                raise UploadOffsetMismatch(os.path.getsize(path))
+            # Rehashing the part after a restart reads the whole file; keep
+            # it off the event loop
+            digest = await asyncio.to_thread(self._hasher, upload_id, offset)
+            with open(path, "ab") as out:
+                async for block in body:
+                    if offset + len(block) > upload["size"]:
+                        raise ValueError("Upload is larger than its declared size")
+                    digest.update(block)
+                    out.write(block)
+                    offset += len(block)
+            self._hashers[upload_id] = (offset, digest)
+            return offset
+        finally:
+            with self._lock:
+                self._active.discard(upload_id)
+
+    def complete(self, upload: dict, path: str) -> str:
+        """Move a fully received upload to `path`; returns its SHA-256."""
+        part = self._part_path(upload["id"])
+        digest = self._hasher(upload["id"], os.path.getsize(part))
+        os.replace(part, path)
+        self.discard(upload["id"])
+        return digest.hexdigest()
+
+    def discard(self, upload_id: str):
+        self._hashers.pop(upload_id, None)
+        path = self._part_path(upload_id)
+        if os.path.exists(path):
+            os.remove(path)
+        self.db.execute("DELETE FROM uploads WHERE id=:id", {"id": upload_id})
+
+    def expire(self):
+        """Drop sessions not completed within the session TTL."""
+        rows = self.db.get_rows(
+            "SELECT id FROM uploads WHERE created_at<:limit",
+            {"limit": time.time() - self.session_ttl},
+        )
+        for row in rows:
+            self.discard(row["id"])
+
+    def _hasher(self, upload_id: str, offset: int):
+        """SHA-256 state of the first `offset` bytes received; blocking when not cached."""
+        cached = self._hashers.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(self._part_path(upload_id), "rb") as part:
+            while block := part.read(BLOCK_SIZE):
+                digest.update(block)
+        return digest
+
+    def _part_path(self, upload_id: str):
+        return os.path.join(self.parts_dir, f"{upload_id}.part")
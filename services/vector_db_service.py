@@ -1,19 +1,16 @@
 from __future__ import annotations
-import os
 from typing import List, Tuple
-from langchain_community.document_loaders import (
-    PDFPlumberLoader,
-    Docx2txtLoader,
-    TextLoader,
-    UnstructuredWordDocumentLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 import uuid
 import re
+import math
+import asyncio
+import time
+import logging
 import itertools
 
 from langchain_milvus import BM25BuiltInFunction, Milvus
+from pymilvus import MilvusException
 
 from model.domain.core import UserFilter
 from services.db import Db
@@ -24,8 +21,34 @@ from langchain_core.documents import Document
 from langchain_core.runnables import chain
 
 from services.milvus_hybrid_retriever import HybridRetrieverWithScores
+from services.embedding_cache import EmbeddingCache
+from services.chunk_dedup import ChunkDeduplicator
+from services.document_parser import iter_chunk_batches, file_meta, ParseOptions
 
 DATE_FMT = "%Y-%m-%d"
+# Files deleted per Milvus delete expression and SQL statement
+DELETE_BATCH_SIZE = 500
+# Scalar index per metadata field used in Milvus filter expressions; every
+# category from categories.json gets an INVERTED index as well
+SCALAR_INDEXES = {
+    "file_id": "INVERTED",
+    "folder": "INVERTED",
+    "created_at": "INVERTED",
+    "updated_at": "INVERTED",
+    "chunk_index": "STL_SORT",
+}
+
+# Metadata chat searches return: ids to select and download a file, names to
+# show it, and the chunk position. The rest stays in Milvus and SQLite.
+RESULT_FIELDS = ["file_id", "original_file_name", "folder", "page", "chunk_index"]
+
+# Retrieval plans chosen by plan_retrieval
+DIRECT_FETCH = "direct_fetch"
+FILTERED_ANN = "filtered_ann"
+POST_FILTER_ANN = "post_filter_ann"
+ANN = "ann"
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------------------
@@ -38,6 +61,39 @@ def _parse_date(value: str):
         return None
 
 
+def _has_conditions(filter: UserFilter | None) -> bool:
+    """Whether a UserFilter restricts anything."""
+    return bool(filter) and (
+        any(filter.model_dump(exclude={"category_ids"}).values())
+        or any(category.categories for category in filter.category_ids or [])
+    )
+
+
+def _quote(value: str) -> str:
+    """A Milvus expression string literal."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _collapse_queries(queries, threshold=0.8):
+    """Drop queries whose token set nearly matches (Jaccard) an earlier query."""
+    kept, kept_tokens = [], []
+    for query in queries:
+        tokens = frozenset(re.findall(r"\w+", query.lower()))
+        duplicate = any(
+            tokens == other
+            or (
+                tokens
+                and other
+                and len(tokens & other) / len(tokens | other) >= threshold
+            )
+            for other in kept_tokens
+        )
+        if not duplicate:
+            kept.append(query)
+            kept_tokens.append(tokens)
+    return kept
+
+
 class VectorDbService:
     def __init__(
         self,
@@ -47,18 +103,45 @@ class VectorDbService:
         embedding_model,
         db: Db,
         categories,
+        embedding_cache: EmbeddingCache | None = None,
+        ingest_batch_size: int = 128,
+        parse_options: ParseOptions | None = None,
+        collection_name: str = "LangChainCollection",
+        deduplicator: ChunkDeduplicator | None = None,
+        scalar_indexes: bool = True,
+        partition_key: str | None = None,
+        direct_fetch_max_chunks: int = 20,
+        post_filter_share: float = 0.9,
     ):
         URI = f"http://{mulvis_db_host}:{mulvis_db_port}"
         self.vectorstore = Milvus(
             embedding_function=embedding_model,
+            collection_name=collection_name,
             connection_args={"uri": URI, "token": "root:Milvus", "db_name": mulvis_db},
             consistency_level="Strong",
             drop_old=False,
             builtin_function=BM25BuiltInFunction(),
             vector_field=["dense", "sparse"],
+            # Only applies when the store creates the collection
+            partition_key_field=partition_key,
         )
+        self.embedding_model = embedding_model
+        self.embedding_cache = embedding_cache
+        self.ingest_batch_size = ingest_batch_size
+        self.parse_options = parse_options or ParseOptions()
+        self.deduplicator = deduplicator
         self.db = db
         self.categories = categories
+        self.scalar_indexes = scalar_indexes
+        self._partition_key = partition_key
+        self.direct_fetch_max_chunks = direct_fetch_max_chunks
+        self.post_filter_share = post_filter_share
+        if db:
+            columns = {row["name"] for row in db.get_rows("PRAGMA table_info(files)")}
+            if columns and "chunk_count" not in columns:
+                db.execute("ALTER TABLE files ADD COLUMN chunk_count INTEGER")
+        if scalar_indexes:
+            self.ensure_scalar_indexes()
 
     ### File Management ###
     def save_meta_in_sql(self, meta):
@@ -72,77 +155,334 @@ class VectorDbService:
             meta,
         )
 
-    def add_file(self, file: dict):
-        file_path = file["file_path"]
-        ext = os.path.splitext(file_path)[1].lower()
-
-        if ext == ".pdf":
-            loader = PDFPlumberLoader(file_path)
-        elif ext == ".docx":
-            loader = Docx2txtLoader(file_path)
-        elif ext == ".doc":
-            loader = UnstructuredWordDocumentLoader(file_path)
-        elif ext == ".txt":
-            loader = TextLoader(file_path, encoding="utf-8")
-        else:
-            raise ValueError("Unsupported file type: " + ext)
+    def save_meta_many(self, metas: list[dict]):
+        """Insert the rows of many files in one executemany transaction."""
+        if not metas:
+            return
+        rows = []
+        for meta in metas:
+            row = dict(meta)
+            row["id"] = row.pop("file_id")
+            rows.append(row)
+        cols = list(dict.fromkeys(key for row in rows for key in row))
+        self.db.execute_many(
+            f"""INSERT INTO files ({','.join(cols)})
+                        values ({','.join([f":{col}" for col in cols])})""",
+            [{col: row.get(col) for col in cols} for row in rows],
+        )
 
-        docs = loader.load()
+    def update_meta_in_sql(self, meta):
+        meta = dict(meta)
+        meta["id"] = meta.pop("file_id")
+        sets = ", ".join(f"{col}=:{col}" for col in meta if col != "id")
+        self.db.execute(f"UPDATE files SET {sets} WHERE id=:id", meta)
 
-        docs = [
-            d
-            for d in docs
-            if isinstance(d, Document) and d.page_content and d.page_content.strip()
-        ]
-        if not docs:
+    def add_file(self, file: dict, on_progress=None):
+        """Stream the file through extraction, embedding and insert in fixed-size batches."""
+        report = on_progress or (lambda stage: None)
+        chunk_count = 0
+        for chunks in iter_chunk_batches(
+            file, self.ingest_batch_size, self.parse_options
+        ):
+            if not chunk_count:
+                report("parsed")
+            chunk_count += len(chunks)
+            chunks, staged = self.dedupe_chunks(chunks)
+            self.insert_chunks(
+                chunks, self.embed_texts([c.page_content for c in chunks]), staged
+            )
+        if not chunk_count:
             return False
-        splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=90)
-        chunks = splitter.split_documents(docs)
+        report("chunked")
+        report("embedded")
 
-        chunks = [c for c in splitter.split_documents(docs) if c.page_content.strip()]
+        self.save_meta_in_sql({**file_meta(file), "chunk_count": chunk_count})
+        report("indexed")
+        return True
 
-        if not chunks:
-            return False
+    def add_files(self, files: list[dict], on_progress=None) -> dict:
+        """
+        Ingest several files with embedding and inserts batched across them:
+        the chunks of the files are streamed into shared batches of
+        ingest_batch_size and the files are recorded in one transaction.
+        Returns the error of each file that could not be added (None for the
+        files that were); `on_progress(file_id, stage)` reports the stages.
+        """
+        report = on_progress or (lambda file_id, stage: None)
+        errors, counts, pending = {}, {}, []
 
-        original_file_name = file["original_file_name"]
-        meta = {}
-
-        for md in file:
-            if md != "file_path":
-                # Milvus varchar fields reject None; default to empty string
-                meta[md] = file[md] if file[md] is not None else ""
-
-        # Standard loader fields with defaults so every document type
-        # produces the same Milvus schema regardless of loader used.
-        _LOADER_DEFAULTS = {"page": 0, "total_pages": 1}
-
-        for idx, doc in enumerate(chunks):
-            text = doc.page_content
-            text = re.sub(r"\s+", " ", text).strip()  # normalize spaces
-            doc.page_content = text
-            loader_meta = {
-                k: doc.metadata.get(k, default)
-                for k, default in _LOADER_DEFAULTS.items()
+        def flush():
+            chunks, staged = self.dedupe_chunks(
+                [c for c in pending if c.metadata["file_id"] not in errors]
+            )
+            pending.clear()
+            self.insert_chunks(
+                chunks, self.embed_texts([c.page_content for c in chunks]), staged
+            )
+
+        for file in files:
+            file_id = file["file_id"]
+            counts[file_id] = 0
+            batches = iter_chunk_batches(file, self.ingest_batch_size, self.parse_options)
+            while True:
+                try:
+                    chunks = next(batches, None)
+                except Exception as err:
+                    # A file that cannot be parsed does not fail the others
+                    errors[file_id] = str(err)
+                    break
+                if chunks is None:
+                    break
+                if not counts[file_id]:
+                    report(file_id, "parsed")
+                counts[file_id] += len(chunks)
+                pending.extend(chunks)
+                if len(pending) >= self.ingest_batch_size:
+                    flush()
+            if not counts[file_id]:
+                errors.setdefault(file_id, "No text could be extracted")
+        flush()
+
+        # Drop what was already inserted for files that failed half-way
+        self.delete_chunks_many([id for id in errors if counts[id]])
+        added = [file for file in files if file["file_id"] not in errors]
+        for file in added:
+            report(file["file_id"], "chunked")
+            report(file["file_id"], "embedded")
+        self.save_meta_many(
+            [{**file_meta(file), "chunk_count": counts[file["file_id"]]} for file in added]
+        )
+        for file in added:
+            report(file["file_id"], "indexed")
+        return {file["file_id"]: errors.get(file["file_id"]) for file in files}
+
+    def update_file(self, file: dict, on_progress=None):
+        """
+        Re-ingest a new version of an indexed file. Chunk ids are derived from
+        the file id and the chunk text, so the new version is diffed against
+        the stored chunks by id: only new chunks are embedded and inserted,
+        unchanged ones keep their vectors (their metadata is rewritten when
+        their position or the file metadata changed) and chunks that are gone
+        are deleted. Running it again for the same version changes nothing.
+        Returns the counts, or None when no text could be extracted.
+        """
+        report = on_progress or (lambda stage: None)
+        file_id = file["file_id"]
+        store = self.vectorstore
+        batches = iter_chunk_batches(file, self.ingest_batch_size, self.parse_options)
+        # Extract before touching the index so a file that cannot be parsed
+        # keeps its current chunks
+        first = next(batches, None)
+        if first is None:
+            return None
+        report("parsed")
+
+        pk_field = store._primary_field
+        stored = {
+            row[pk_field]: row
+            for row in store.client.query(
+                store.collection_name,
+                filter=f"file_id=='{file_id}'",
+                output_fields=self._scalar_fields(),
+            )
+        }
+        seen, changed, added, referenced = set(), {}, 0, set()
+        for chunks in itertools.chain([first], batches):
+            new_chunks = []
+            for chunk in chunks:
+                seen.add(chunk.id)
+                row = stored.get(chunk.id)
+                if row is None:
+                    new_chunks.append(chunk)
+                elif any(row[k] != v for k, v in chunk.metadata.items() if k in row):
+                    changed[chunk.id] = chunk.metadata
+            new_chunks, staged = self.dedupe_chunks(new_chunks)
+            self.insert_chunks(
+                new_chunks, self.embed_texts([c.page_content for c in new_chunks]), staged
+            )
+            added += len(new_chunks)
+            if staged:
+                referenced |= staged.referenced
+        report("chunked")
+        report("embedded")
+        if self.deduplicator:
+            # References of the previous version the new one no longer makes;
+            # dropped only now so a failed update keeps the old ones
+            self.deduplicator.clear_refs(file_id, keep=referenced)
+
+        self._rewrite_chunks(changed)
+        removed = [pk for pk in stored if pk not in seen]
+        if self.deduplicator:
+            handovers = self.deduplicator.release_chunks(file_id, removed)
+            if handovers:
+                self._hand_over_chunks(handovers)
+                handed_over = {h["pk"] for h in handovers}
+                removed = [pk for pk in removed if pk not in handed_over]
+        if removed:
+            store.delete(ids=removed)
+
+        self.update_meta_in_sql({**file_meta(file), "chunk_count": len(seen)})
+        report("indexed")
+        return {
+            "added": added,
+            "unchanged": len(seen & stored.keys()) - len(changed),
+            "rewritten": len(changed),
+            "removed": len(removed),
+        }
+
+    def dedupe_chunks(self, chunks: list[Document]):
+        """
+        Drop chunks already stored as near-duplicates; they become file
+        references. Returns the chunks to insert and the staged dedup rows
+        (None without deduplication) to pass to insert_chunks.
+        """
+        if not self.deduplicator:
+            return chunks, None
+        return self.deduplicator.filter(chunks)
+
+    def insert_chunks(self, chunks: list[Document], embeddings, staged=None):
+        """Insert embedded chunks, then record the dedup rows staged for them."""
+        if chunks:
+            uuids = [c.id or str(uuid.uuid4()) for c in chunks]
+            # The store creates the collection on its first insert
+            created = self.vectorstore.col is None
+            self.vectorstore.add_embeddings(
+                [c.page_content for c in chunks],
+                embeddings,
+                metadatas=[c.metadata for c in chunks],
+                ids=uuids,
+            )
+            if created and self.scalar_indexes:
+                self.ensure_scalar_indexes()
+        if staged:
+            self.deduplicator.commit(staged)
+
+    def index_chunks(self, items: list[tuple[dict, list[Document]]], embeddings, staged=None):
+        """Insert the embedded chunks of one or more files and record the files."""
+        self.insert_chunks(
+            [c for _, file_chunks in items for c in file_chunks], embeddings, staged
+        )
+        self.save_meta_many([file_meta(file) for file, _ in items])
+
+    def embed_texts(self, texts: list[str]):
+        if not texts:
+            return []
+        if self.embedding_cache:
+            return self.embedding_cache.embed_documents(self.embedding_model, texts)
+        return self.embedding_model.embed_documents(texts)
+
+    def delete_chunks(self, file_id):
+        self.delete_chunks_many([file_id])
+
+    def delete_chunks_many(self, file_ids: list[str]):
+        """Delete the chunks of many files with one Milvus delete expression."""
+        if not file_ids:
+            return
+        if self.deduplicator:
+            # A chunk may be handed from one deleted file to another; only
+            # its last owner counts, and it is deleted with them if it is one
+            handovers = {
+                h["pk"]: h
+                for file_id in file_ids
+                for h in self.deduplicator.release_file(file_id)
             }
-            doc.metadata = {**loader_meta, **meta, "chunk_index": idx}
-            if idx == 0 and original_file_name:
-                doc.page_content = f"Source: {original_file_name}\n\n{doc.page_content}"
+            handovers = [h for h in handovers.values() if h["file_id"] not in file_ids]
+            if handovers:
+                self._hand_over_chunks(handovers)
+        quoted = ",".join(f"'{id}'" for id in file_ids)
+        self.vectorstore.delete(expr=f"file_id in [{quoted}]")
 
-        uuids = [str(uuid.uuid4()) for _ in range(len(chunks))]
-        self.vectorstore.add_documents(chunks, ids=uuids)
+    def _hand_over_chunks(self, handovers: list[dict]):
+        """Rewrite shared chunks as chunks of the file that still references them."""
+        owners, updates = {}, {}
+        for handover in handovers:
+            owner_id = handover["file_id"]
+            if owner_id not in owners:
+                owner = self.get_file_data(owner_id) or {"id": owner_id}
+                owner["file_id"] = owner.pop("id")
+                owners[owner_id] = file_meta(owner)
+            updates[handover["pk"]] = {
+                **owners[owner_id],
+                "page": handover["page"],
+                "chunk_index": handover["chunk_index"],
+            }
+        self._rewrite_chunks(updates)
 
-        self.save_meta_in_sql(meta)
-        return True
+    def _rewrite_chunks(self, updates: dict[str, dict]):
+        """Upsert stored chunks with new metadata, keeping their text and vectors."""
+        store = self.vectorstore
+        fields = [f.name for f in store.col.schema.fields if not f.is_function_output]
+        pks = list(updates)
+        for start in range(0, len(pks), self.ingest_batch_size):
+            quoted = ",".join(f"'{pk}'" for pk in pks[start : start + self.ingest_batch_size])
+            rows = store.client.query(
+                store.collection_name,
+                filter=f"{store._primary_field} in [{quoted}]",
+                output_fields=fields,
+            )
+            for row in rows:
+                values = updates[row[store._primary_field]]
+                row.update({k: v for k, v in values.items() if k in row})
+            if rows:
+                store.client.upsert(store.collection_name, rows)
+
+    def _scalar_fields(self):
+        store = self.vectorstore
+        skip = {store._text_field, *store._as_list(store._vector_field)}
+        return [
+            f.name
+            for f in store.col.schema.fields
+            if not f.is_function_output and f.name not in skip
+        ]
+
+    def _file_expr(self, file_ids: list[str]):
+        """Milvus filter for chunks of the files, including shared chunks they reference."""
+        quoted = ",".join(f"'{id}'" for id in file_ids)
+        expr = f"file_id in [{quoted}]"
+        if self.deduplicator:
+            pks = {ref["pk"] for ref in self.deduplicator.refs_for_files(file_ids)}
+            if pks:
+                pk_field = self.vectorstore._primary_field
+                expr = f"({expr}) or {pk_field} in [{','.join(f'{pk!r}' for pk in pks)}]"
+        return expr
 
     def delete_file(self, file_id):
-        self.vectorstore.delete(expr=f"file_id=='{file_id}'")
+        self.delete_chunks(file_id)
         self.db.execute("DELETE FROM files WHERE id=:id", {"id": file_id})
 
+    def delete_files(self, file_ids: list[str], compact=False):
+        """
+        Delete many files: one Milvus delete and one SQL statement per batch
+        of DELETE_BATCH_SIZE files. With `compact`, a Milvus compaction is
+        started afterwards to merge the segments the deletes fragmented.
+        """
+        for start in range(0, len(file_ids), DELETE_BATCH_SIZE):
+            batch = file_ids[start : start + DELETE_BATCH_SIZE]
+            self.delete_chunks_many(batch)
+            params = {f"id{i}": id for i, id in enumerate(batch)}
+            self.db.execute(
+                f"DELETE FROM files WHERE id IN ({','.join(f':{key}' for key in params)})",
+                params,
+            )
+        if compact and file_ids:
+            store = self.vectorstore
+            store.client.compact(self.serving_collection(store.collection_name))
+
     def get_file_content(self, file_id):
 
         results = self.vectorstore.similarity_search(
-            query="", expr=f"file_id=='{file_id}'", k=200, fetch_k=200
+            query="", expr=self._file_expr([file_id]), k=200, fetch_k=200
         )
+        if self.deduplicator:
+            # Shared chunks carry the position they have in this file
+            refs = {
+                ref["pk"]: ref for ref in self.deduplicator.refs_for_files([file_id])
+            }
+            for doc in results:
+                ref = refs.get(doc.metadata.get(self.vectorstore._primary_field))
+                if ref:
+                    doc.metadata["page"] = ref["page"]
+                    doc.metadata["chunk_index"] = ref["chunk_index"]
         documents = [doc.model_dump() for doc in results]
         documents = sorted(documents, key=lambda c: c["metadata"]["chunk_index"])
         return documents
@@ -171,6 +511,90 @@ class VectorDbService:
             "SELECT * FROM files WHERE id=:id", {"id": file_id}
         )
 
+    def get_file_names(self, file_ids: list[str]) -> list[str]:
+        """Stored file names of the listed files, in batches of DELETE_BATCH_SIZE."""
+        names = []
+        for start in range(0, len(file_ids), DELETE_BATCH_SIZE):
+            params = {
+                f"id{i}": id
+                for i, id in enumerate(file_ids[start : start + DELETE_BATCH_SIZE])
+            }
+            rows = self.db.get_rows(
+                f"SELECT file_name FROM files WHERE id IN ({','.join(f':{key}' for key in params)})",
+                params,
+            )
+            names += [row["file_name"] for row in rows]
+        return names
+
+    ### Collections ###
+    def serving_collection(self, alias: str):
+        """The collection an alias points to, the name itself for a plain collection, or None."""
+        client = self.vectorstore.client
+        try:
+            return client.describe_alias(alias)["collection_name"]
+        except MilvusException:
+            return alias if client.has_collection(alias) else None
+
+    def point_alias(self, alias: str, collection: str):
+        """
+        Switch an alias to another collection in one server-side operation and
+        return the collection it pointed to before. A plain collection holding
+        the alias name (a deployment from before aliases were used) is renamed
+        first so the alias can take over its name.
+        """
+        client = self.vectorstore.client
+        previous = self.serving_collection(alias)
+        if previous == alias:
+            previous = f"{alias}_{datetime.datetime.now():%Y%m%d%H%M%S}"
+            client.rename_collection(alias, previous)
+            client.create_alias(collection, alias)
+        elif previous:
+            client.alter_alias(collection, alias)
+        else:
+            client.create_alias(collection, alias)
+        return previous
+
+    def ensure_scalar_indexes(self) -> list[str]:
+        """
+        Create the missing scalar indexes on the filterable metadata fields
+        and return the fields indexed. Runs when the collection is created
+        and on startup, so collections from before the indexes (or that
+        gained a category field in a rebuild) get them as well.
+        """
+        store = self.vectorstore
+        fields = self._milvus_fields()
+        if fields is None:
+            return []
+        client = store.client
+        collection = self.serving_collection(store.collection_name)
+        wanted = {
+            **SCALAR_INDEXES,
+            **{cat["id"]: "INVERTED" for cat in self.categories or []},
+        }
+        index_params = client.prepare_index_params()
+        missing = []
+        for field, index_type in wanted.items():
+            if field in fields and not client.list_indexes(collection, field_name=field):
+                index_params.add_index(
+                    field_name=field, index_type=index_type, index_name=f"{field}_idx"
+                )
+                missing.append(field)
+        if not missing:
+            return []
+        try:
+            client.create_index(collection, index_params)
+        except MilvusException as err:
+            # Servers that refuse index changes on a loaded collection
+            logger.warning(f"Reloading {collection} to index {missing}: {err}")
+            client.release_collection(collection)
+            client.create_index(collection, index_params)
+            client.load_collection(collection)
+        logger.info(f"Created scalar indexes on {collection}: {', '.join(missing)}")
+        return missing
+
+    def drop_collection(self, collection: str):
+        self.vectorstore.client.drop_collection(collection)
+
     ### Searching ###
     def get_file_ids(self, filter: UserFilter):
         if not filter:
@@ -181,8 +605,462 @@ class VectorDbService:
         rows = self.db.get_rows(sql, sql_params)
         return [row["id"] for row in rows] or None
 
+    def get_folders(self, prefix: str) -> list[str]:
+        """Stored folders starting with `prefix`, compared case-insensitively like the file list."""
+        rows = self.db.get_rows(
+            "SELECT DISTINCT folder FROM files WHERE folder LIKE :folder || '%'",
+            {"folder": prefix},
+        )
+        return [row["folder"] for row in rows]
+
+    def filter_expr(self, filter: UserFilter):
+        """
+        Compile a UserFilter into a Milvus expression over the metadata every
+        chunk carries, so filtered searches do not inline an id list of every
+        matching file. File name and author are case-insensitive substring
+        matches, which Milvus LIKE cannot express; those (and categories the
+        collection has no field for) are still resolved in SQL, which only
+        returns the few files they match. The folder prefix is case-insensitive
+        too, so it is resolved in SQL to the folders it matches, far fewer
+        than their files. Returns None for an empty filter.
+        """
+        fields = self._milvus_fields()
+        clauses = []
+        sql_filter = UserFilter(file=filter.file, author=filter.author, category_ids=[])
+
+        if filter.folder:
+            folders = self.get_folders(filter.folder)
+            clauses.append(
+                f"folder in [{','.join(_quote(f) for f in folders)}]"
+                if folders
+                else 'file_id in [""]'  # no file is in such a folder
+            )
+        for field, start, end in (
+            ("created_at", filter.created_from, filter.created_to),
+            ("updated_at", filter.updated_from, filter.updated_to),
+        ):
+            start, end = _parse_date(start), _parse_date(end)
+            if start:
+                clauses.append(f"{field} >= {_quote(start)}")
+            if end:
+                clauses.append(f"{field} < {_quote(end + datetime.timedelta(days=1))}")
+        for category in filter.category_ids or []:
+            if not category.categories:
+                continue
+            if fields is not None and category.id not in fields:
+                sql_filter.category_ids.append(category)
+                continue
+            values = ",".join(_quote(val) for val in category.categories)
+            clauses.append(f"{category.id} in [{values}]")
+
+        if sql_filter.file or sql_filter.author or sql_filter.category_ids:
+            file_ids = self.get_file_ids(sql_filter) or [""]  # "" matches no chunk
+            clauses.append(f"file_id in [{','.join(_quote(id) for id in file_ids)}]")
+        if not clauses:
+            return None
+
+        expr = " and ".join(f"({clause})" for clause in clauses)
+        if self.deduplicator:
+            # Shared chunks carry their owner's metadata, not the referencing file's
+            where, sql_params = self._prepare_user_filter(filter)
+            refs = self.deduplicator.refs_matching(where, sql_params)
+            if refs:
+                pk_field = self.vectorstore._primary_field
+                pks = ",".join(_quote(pk) for pk in sorted({ref["pk"] for ref in refs}))
+                expr = f"({expr}) or {pk_field} in [{pks}]"
+                expr = self._route_partitions(
+                    expr, filter, {ref["owner_id"] for ref in refs}
+                )
+        return expr
+
+    @property
+    def partition_key(self):
+        """The category the collection is partitioned by, or None."""
+        col = self.vectorstore.col
+        if col is None:
+            return self._partition_key
+        return next((f.name for f in col.schema.fields if f.is_partition_key), None)
+
+    def _route_partitions(self, expr: str, filter: UserFilter, owner_ids: set[str]):
+        """
+        Milvus searches only the partitions a top-level condition on the
+        partition key selects. The shared-chunk alternative hides that
+        condition, so restate it with the partitions of the chunks' owners.
+        """
+        key = self.partition_key
+        values = next(
+            (
+                category.categories
+                for category in filter.category_ids or []
+                if category.id == key and category.categories
+            ),
+            None,
+        )
+        if not values:
+            return expr
+        params = {f"id{i}": id for i, id in enumerate(owner_ids)}
+        rows = self.db.get_rows(
+            f"""SELECT DISTINCT {key} AS value FROM files
+            WHERE id IN ({','.join(f':{name}' for name in params)})""",
+            params,
+        )
+        values = sorted({*values, *(row["value"] or "" for row in rows)})
+        return f"{key} in [{','.join(_quote(val) for val in values)}] and ({expr})"
+
+    def _milvus_fields(self):
+        """Field names of the collection, or None before it is created."""
+        col = self.vectorstore.col
+        return {f.name for f in col.schema.fields} if col is not None else None
+
     async def get_documents(
-        self, queries, file_ids, k=5, fetch_k=30, alpha=0.7, beta=0.3
+        self,
+        queries,
+        file_ids,
+        k=5,
+        fetch_k=30,
+        alpha=0.7,
+        beta=0.3,
+        user_filter: UserFilter | None = None,
+        output_fields: list[str] | None = None,
+    ):
+        """
+        Hybrid search over the chunks of `file_ids`, or over the chunks
+        matching `user_filter` when no files are given. `output_fields` limits
+        the metadata returned with the chunk text (default: all fields).
+        How the search runs is chosen by plan_retrieval; a scope small enough
+        to be fetched whole returns all its chunks rather than k.
+        """
+        started = time.perf_counter()
+        # The planner and the scope queries hit SQLite and Milvus synchronously
+        plan, scope_chunks, total_chunks = await asyncio.to_thread(
+            self.plan_retrieval, file_ids, user_filter
+        )
+        if plan == DIRECT_FETCH:
+            documents = await asyncio.to_thread(
+                self._fetch_scope, file_ids, user_filter, output_fields
+            )
+        elif plan == POST_FILTER_ANN:
+            # Search everything and drop the few out-of-scope results
+            share = scope_chunks / total_chunks
+            limit = math.ceil(2 * k / share)
+            in_scope, scope_fields = await asyncio.to_thread(
+                self._scope_test, file_ids, user_filter
+            )
+            extra = (
+                [field for field in scope_fields if field not in output_fields]
+                if output_fields is not None
+                else []
+            )
+            search_kwargs = self._search_kwargs(
+                None,
+                None,
+                max(fetch_k, limit),
+                alpha,
+                beta,
+                None if output_fields is None else [*output_fields, *extra],
+            )
+            documents = await self._search(queries, limit, search_kwargs)
+            documents = [doc for doc in documents if in_scope(doc)][:k]
+            for doc in documents:
+                for field in extra:
+                    doc.metadata.pop(field, None)
+        else:
+            search_kwargs = self._search_kwargs(
+                file_ids, user_filter, fetch_k, alpha, beta, output_fields
+            )
+            documents = await self._search(queries, k, search_kwargs)
+        if plan in (FILTERED_ANN, POST_FILTER_ANN):
+            shared = await asyncio.to_thread(self._shared_refs, file_ids, user_filter)
+            self._attribute_shared(documents, shared)
+        logger.info(
+            f"Retrieval plan {plan}: scope {scope_chunks} of {total_chunks} chunks, "
+            f"{len(documents)} results in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return documents
+
+    async def _search(self, queries, k, search_kwargs):
+        retriever = HybridRetrieverWithScores(
+            self.vectorstore, k=k, search_kwargs=search_kwargs
+        )
+        lists = await retriever.abatch_hybrid(_collapse_queries(queries))
+        documents = self.merge_documents(lists, k)
+        if self.deduplicator:
+            self.deduplicator.record_results(documents)
+        return documents
+
+    def plan_retrieval(self, file_ids=None, user_filter: UserFilter | None = None):
+        """
+        Choose how to retrieve from the scope (the selected files, or the
+        files matching the filter), estimated from the chunk counts stored at
+        ingest. Returns (plan, scope chunks, total chunks); counts are None
+        when unknown.
+
+        - DIRECT_FETCH: the scope is at most direct_fetch_max_chunks chunks,
+          fetched whole by file_id in chunk_index order.
+        - POST_FILTER_ANN: the scope is at least post_filter_share of the
+          corpus, so an unfiltered search rarely returns chunks outside it.
+        - FILTERED_ANN: hybrid search restricted to the scope.
+        - ANN: no scope.
+        """
+        if file_ids:
+            params = {f"id{i}": id for i, id in enumerate(file_ids)}
+            where = f"id IN ({','.join(f':{name}' for name in params)})"
+        elif _has_conditions(user_filter):
+            where, params = self._prepare_user_filter(user_filter)
+        else:
+            return ANN, None, None
+        scope_chunks = self._chunk_count(where, params)
+        total_chunks = self._chunk_count("1=1", {})
+
+        if scope_chunks is not None and scope_chunks <= self.direct_fetch_max_chunks:
+            plan = DIRECT_FETCH
+        elif (
+            scope_chunks
+            and total_chunks
+            and scope_chunks / total_chunks >= self.post_filter_share
+        ):
+            plan = POST_FILTER_ANN
+        else:
+            plan = FILTERED_ANN
+        return plan, scope_chunks, total_chunks
+
+    def _chunk_count(self, where: str, params: dict):
+        """Chunks of the files matching `where`; None if one was ingested before counts."""
+        row = self.db.get_row_or_default(
+            f"""SELECT SUM(chunk_count) AS chunks, COUNT(chunk_count) AS counted,
+                COUNT(0) AS files
+            FROM files WHERE {where}""",
+            params,
+        )
+        if not row or row["counted"] < row["files"]:
+            return None
+        return row["chunks"] or 0
+
+    def _fetch_scope(self, file_ids, user_filter, output_fields=None):
+        """All chunks of a small scope, file by file in chunk_index order."""
+        store = self.vectorstore
+        if store.col is None:
+            return []
+        expr = (
+            self._file_expr(file_ids) if file_ids else self.filter_expr(user_filter)
+        )
+        if not expr:
+            return []
+        rows = store.client.query(
+            store.collection_name,
+            filter=expr,
+            output_fields=self._output_fields(output_fields)
+            or [*self._scalar_fields(), store._text_field],
+        )
+        order = {id: i for i, id in enumerate(file_ids or [])}
+        documents = []
+        for row in rows:
+            # Every chunk of the scope goes to the context: there is no ranking
+            row["score"] = 1.0
+            documents.append(Document(page_content=row.pop(store._text_field), metadata=row))
+        self._attribute_shared(documents, self._shared_refs(file_ids, user_filter))
+        documents.sort(
+            key=lambda doc: (
+                order.get(doc.metadata.get("file_id"), len(order)),
+                doc.metadata.get("file_id") or "",
+                doc.metadata.get("chunk_index") or 0,
+            )
+        )
+        return documents
+
+    def _shared_refs(self, file_ids, user_filter) -> dict[str, dict]:
+        """
+        Shared chunks the scope reaches only through a reference: their owner
+        is outside the scope, so the stored metadata names a file the user did
+        not select. Maps each pk to the metadata of an in-scope file that
+        references the chunk, with the chunk's page and index in that file.
+        """
+        if not self.deduplicator:
+            return {}
+        if file_ids:
+            selected = set(file_ids)
+            refs = [
+                ref
+                for ref in self.deduplicator.refs_for_files(file_ids)
+                if ref["owner_id"] not in selected
+            ]
+        elif _has_conditions(user_filter):
+            where, params = self._prepare_user_filter(user_filter)
+            refs = self.deduplicator.refs_matching(where, params)
+            owners = {f"o{i}": id for i, id in enumerate({ref["owner_id"] for ref in refs})}
+            in_scope = set()
+            if owners:
+                rows = self.db.get_rows(
+                    f"""SELECT id FROM files WHERE {where}
+                    AND id IN ({','.join(f':{name}' for name in owners)})""",
+                    {**params, **owners},
+                )
+                in_scope = {row["id"] for row in rows}
+            refs = [ref for ref in refs if ref["owner_id"] not in in_scope]
+        else:
+            return {}
+
+        files, shared = {}, {}
+        for ref in refs:
+            if ref["pk"] in shared:
+                continue
+            if ref["file_id"] not in files:
+                row = self.get_file_data(ref["file_id"]) or {"id": ref["file_id"]}
+                row["file_id"] = row.pop("id")
+                files[ref["file_id"]] = file_meta(row)
+            shared[ref["pk"]] = {
+                **files[ref["file_id"]],
+                "page": ref["page"],
+                "chunk_index": ref["chunk_index"],
+            }
+        return shared
+
+    def _attribute_shared(self, documents: list[Document], shared: dict[str, dict]):
+        """Rewrite the returned metadata of shared chunks as _shared_refs resolved it."""
+        pk_field = self.vectorstore._primary_field
+        for doc in documents:
+            meta = shared.get(doc.metadata.get(pk_field))
+            if meta:
+                doc.metadata.update({k: v for k, v in meta.items() if k in doc.metadata})
+
+    def _scope_test(self, file_ids, user_filter):
+        """
+        Predicate telling whether a search result belongs to the scope, and
+        the metadata fields it reads. Folder, dates and categories are checked
+        on the result's metadata the way filter_expr compiles them; only file
+        name, author and categories the collection has no field for are
+        looked up in SQL.
+        """
+        pk_field = self.vectorstore._primary_field
+        if file_ids:
+            scope = set(file_ids)
+            pks = set()
+            if self.deduplicator:
+                pks = {ref["pk"] for ref in self.deduplicator.refs_for_files(file_ids)}
+            return (
+                lambda doc: doc.metadata.get("file_id") in scope
+                or doc.metadata.get(pk_field) in pks
+            ), ["file_id"]
+
+        fields = self._milvus_fields()
+        tests = []
+        scope_fields = ["file_id"]
+        sql_filter = UserFilter(
+            file=user_filter.file, author=user_filter.author, category_ids=[]
+        )
+        if user_filter.folder:
+            # Case-insensitive, like the folder list filter_expr resolves
+            folder = user_filter.folder.lower()
+            tests.append(
+                lambda meta: str(meta.get("folder") or "").lower().startswith(folder)
+            )
+            scope_fields.append("folder")
+        for field, start, end in (
+            ("created_at", user_filter.created_from, user_filter.created_to),
+            ("updated_at", user_filter.updated_from, user_filter.updated_to),
+        ):
+            start, end = _parse_date(start), _parse_date(end)
+            if not (start or end):
+                continue
+            start = str(start) if start else None
+            end = str(end + datetime.timedelta(days=1)) if end else None
+            tests.append(
+                lambda meta, field=field, start=start, end=end: (
+                    (start is None or str(meta.get(field) or "") >= start)
+                    and (end is None or str(meta.get(field) or "") < end)
+                )
+            )
+            scope_fields.append(field)
+        for category in user_filter.category_ids or []:
+            if not category.categories:
+                continue
+            if fields is not None and category.id not in fields:
+                sql_filter.category_ids.append(category)
+                continue
+            values = set(category.categories)
+            tests.append(lambda meta, id=category.id, values=values: meta.get(id) in values)
+            scope_fields.append(category.id)
+        if sql_filter.file or sql_filter.author or sql_filter.category_ids:
+            files = set(self.get_file_ids(sql_filter) or [])
+            tests.append(lambda meta: meta.get("file_id") in files)
+
+        pks = set()
+        if self.deduplicator:
+            # Shared chunks carry their owner's metadata, not the referencing file's
+            where, params = self._prepare_user_filter(user_filter)
+            pks = {ref["pk"] for ref in self.deduplicator.refs_matching(where, params)}
+        return (
+            lambda doc: all(test(doc.metadata) for test in tests)
+            or doc.metadata.get(pk_field) in pks
+        ), scope_fields
+
+    async def find_files(
+        self,
+        queries,
+        file_ids=None,
+        user_filter: UserFilter | None = None,
+        page_size=10,
+        cursor=0,
+        group_size=3,
+        fetch_k=30,
+        alpha=0.7,
+        beta=0.3,
+        output_fields: list[str] | None = None,
+    ):
+        """
+        Grouped search: the files best matching any of the queries, each with
+        up to `group_size` of its best chunks, one page at a time. Every query
+        asks Milvus for its top `cursor + page_size` files (group-by on
+        file_id), so the merged ranking is exact up to the end of the page and
+        no file shows up on two pages. Returns the page's chunks, best file
+        first, and the cursor of the next page (None after the last page).
+        `output_fields` works as in get_documents.
+        """
+        limit = cursor + page_size
+        search_kwargs = self._search_kwargs(
+            file_ids,
+            user_filter,
+            max(fetch_k, limit * group_size),
+            alpha,
+            beta,
+            output_fields,
+        )
+        search_kwargs.update(group_by_field="file_id", group_size=group_size)
+        retriever = HybridRetrieverWithScores(
+            self.vectorstore, k=limit, search_kwargs=search_kwargs
+        )
+        lists = await retriever.abatch_hybrid(_collapse_queries(queries))
+        shared = await asyncio.to_thread(self._shared_refs, file_ids, user_filter)
+        for docs in lists:
+            # Grouped under the selected file that references them, not their owner
+            self._attribute_shared(docs, shared)
+
+        def score(doc):
+            return abs(doc.metadata.get("score", 0.0))
+
+        files: dict[str, dict] = {}  # file_id -> {pk: best scoring copy of the chunk}
+        for doc in itertools.chain.from_iterable(lists):
+            chunks = files.setdefault(doc.metadata["file_id"], {})
+            key = doc.metadata.get("pk") or doc.page_content
+            if key not in chunks or score(doc) > score(chunks[key]):
+                chunks[key] = doc
+        ranked = [
+            sorted(chunks.values(), key=score, reverse=True)[:group_size]
+            for chunks in files.values()
+        ]
+        ranked.sort(key=lambda group: score(group[0]), reverse=True)
+        documents = [doc for group in ranked[cursor:limit] for doc in group]
+        if self.deduplicator:
+            self.deduplicator.record_results(documents)
+
+        # A query that filled its limit may have more files beyond it
+        more = len(ranked) > limit or any(
+            len({doc.metadata["file_id"] for doc in docs}) >= limit for docs in lists
+        )
+        return documents, limit if more else None
+
+    def _search_kwargs(
+        self, file_ids, user_filter, fetch_k, alpha, beta, output_fields=None
     ):
         search_kwargs = {
             "fetch_k": fetch_k,
@@ -193,15 +1071,28 @@ class VectorDbService:
             },
         }
         if file_ids:
-            quoted = ",".join(f"'{id}'" for id in file_ids)
-            expr = f"file_id in [{quoted}]"
-            search_kwargs["expr"] = expr
+            search_kwargs["expr"] = self._file_expr(file_ids)
+        elif user_filter:
+            expr = self.filter_expr(user_filter)
+            if expr:
+                search_kwargs["expr"] = expr
+        if output_fields is not None:
+            search_kwargs["output_fields"] = self._output_fields(output_fields)
+        return search_kwargs
 
-        retriever = HybridRetrieverWithScores(
-            self.vectorstore, k=k, search_kwargs=search_kwargs
-        )
+    def _output_fields(self, output_fields):
+        """Milvus output fields for a metadata projection: the key, text and the fields."""
+        if output_fields is None:
+            return None
+        store = self.vectorstore
+        fields = self._milvus_fields() or set()
+        return [
+            store._primary_field,
+            store._text_field,
+            *(field for field in output_fields if field in fields),
+        ]
 
-        lists = await retriever.abatch(queries)
+    def merge_documents(self, lists: list[list[Document]], k=5):
         candidates = list(itertools.chain.from_iterable(lists))
 
         seen, deduped = set(), []
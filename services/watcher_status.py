@@ -0,0 +1,78 @@
+import os
+import time
+
+from services.db import Db
+
+
+class WatcherStatus:
+    """
+    Live state of the folder watcher (`python -m setup.document_loader
+    --watch`), one row per watched folder. The watcher writes it after every
+    batch and on a heartbeat; the API reads it to report queue depth and
+    ingestion lag.
+    """
+
+    def __init__(self, db: Db, heartbeat_seconds: float = 10):
+        self.db = db
+        self.heartbeat_seconds = heartbeat_seconds
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS watcher_status (
+                folder                  TEXT PRIMARY KEY,
+                mode                    TEXT NOT NULL,
+                pid                     INTEGER NOT NULL,
+                started_at              REAL NOT NULL,
+                updated_at              REAL NOT NULL,
+                pending                 INTEGER NOT NULL DEFAULT 0,
+                processing              INTEGER NOT NULL DEFAULT 0,
+                oldest_pending_seconds  REAL,
+                files_indexed           INTEGER NOT NULL DEFAULT 0,
+                files_failed            INTEGER NOT NULL DEFAULT 0,
+                last_batch_files        INTEGER NOT NULL DEFAULT 0,
+                last_lag_seconds        REAL,
+                max_lag_seconds         REAL
+            )"""
+        )
+
+    def start(self, folder: str, mode: str):
+        now = time.time()
+        self.db.execute(
+            """INSERT OR REPLACE INTO watcher_status
+                (folder, mode, pid, started_at, updated_at)
+            VALUES (:folder, :mode, :pid, :now, :now)""",
+            {"folder": folder, "mode": mode, "pid": os.getpid(), "now": now},
+        )
+
+    def update(self, folder: str, **fields):
+        sets = "".join(f", {key}=:{key}" for key in fields)
+        self.db.execute(
+            f"UPDATE watcher_status SET updated_at=:now{sets} WHERE folder=:folder",
+            {**fields, "folder": folder, "now": time.time()},
+        )
+
+    def add_batch(self, folder: str, indexed: int, failed: int, lag: float):
+        self.db.execute(
+            """UPDATE watcher_status SET
+                updated_at=:now,
+                files_indexed=files_indexed + :indexed,
+                files_failed=files_failed + :failed,
+                last_batch_files=:indexed + :failed,
+                last_lag_seconds=:lag,
+                max_lag_seconds=MAX(COALESCE(max_lag_seconds, 0), :lag)
+            WHERE folder=:folder""",
+            {
+                "folder": folder,
+                "indexed": indexed,
+                "failed": failed,
+                "lag": lag,
+                "now": time.time(),
+            },
+        )
+
+    def snapshot(self) -> list[dict]:
+        rows = self.db.get_rows("SELECT * FROM watcher_status ORDER BY folder")
+        now = time.time()
+        for row in rows:
+            # A watcher that stopped writing its heartbeat is not running
+            row["running"] = now - row["updated_at"] < 3 * self.heartbeat_seconds
+            row["queue_depth"] = row["pending"] + row["processing"]
+        return rows
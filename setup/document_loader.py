@@ -1,12 +1,18 @@
 ### RUN AS
-##python -m setup.document_loader
+##python -m setup.document_loader [--bulk]
+##python -m setup.document_loader --watch
 
 import os
+import time
 import uuid
 import json
+import queue
 import shutil
+import argparse
 import datetime
+import threading
 import win32security
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 from pathlib import Path
 from docx import Document
@@ -16,6 +22,19 @@ from dotenv import load_dotenv, find_dotenv
 from services.vector_db_service import VectorDbService
 from services.db import Db
 from services.llm_init_service import GetEmbeddingModel
+from services.embedding_cache import EmbeddingCache
+from services.document_parser import (
+    load_chunks,
+    file_meta,
+    ParseOptions,
+    EXTRACTOR_VERSION,
+)
+from services.page_text_cache import PageTextCache
+from services.bulk_import import BulkImporter
+from services.chunk_dedup import ChunkDeduplicator
+from setup.loader_manifest import LoaderManifest, INDEXED, FAILED
+from setup.folder_watcher import watch
+from services.watcher_status import WatcherStatus
 
 
 
@@ -25,10 +44,41 @@ load_dotenv(env_path)
 MILVUS_DB = os.getenv("MILVUS_DB")
 MILVUS_HOST = os.getenv("MILVUS_HOST")
 MILVUS_PORT = os.getenv("MILVUS_PORT")
+MILVUS_COLLECTION = os.getenv("MILVUS_COLLECTION", "LangChainCollection")
+MILVUS_PARTITION_KEY = os.getenv("MILVUS_PARTITION_KEY") or None
 SQL_DB_PATH = os.getenv("SQL_DB_PATH")
 CATEGORIES_PATH = os.getenv("CATEGORIES_PATH")
 DOCUMENT_FOLDER_DIR = os.getenv("DOCUMENT_FOLDER_DIR")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "true").lower() == "true"
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.8"))
+CHUNK_DEDUP_MIN_WORDS = int(os.getenv("CHUNK_DEDUP_MIN_WORDS", "20"))
+LOADER_WORKERS = int(os.getenv("LOADER_WORKERS") or os.cpu_count() or 1)
+LOADER_BATCH_SIZE = int(os.getenv("LOADER_BATCH_SIZE", "256"))
+LOADER_QUEUE_SIZE = int(os.getenv("LOADER_QUEUE_SIZE", "4"))
+PARSER_TIME_LIMIT = float(os.getenv("PARSER_TIME_LIMIT", "0")) or None
+PARSER_MEMORY_LIMIT_MB = int(os.getenv("PARSER_MEMORY_LIMIT_MB", "0")) or None
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "600"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "90"))
+MILVUS_MINIO_ENDPOINT = os.getenv("MILVUS_MINIO_ENDPOINT", "localhost:9000")
+MILVUS_MINIO_ACCESS_KEY = os.getenv("MILVUS_MINIO_ACCESS_KEY", "minioadmin")
+MILVUS_MINIO_SECRET_KEY = os.getenv("MILVUS_MINIO_SECRET_KEY", "minioadmin")
+MILVUS_MINIO_BUCKET = os.getenv("MILVUS_MINIO_BUCKET", "a-bucket")
+WATCH_MODE = os.getenv("WATCH_MODE", "auto")
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "5"))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "30"))
+
+# Module level so every parser process builds its own copy
+PARSE_OPTIONS = ParseOptions(
+    chunk_size=CHUNK_SIZE,
+    chunk_overlap=CHUNK_OVERLAP,
+    time_limit=PARSER_TIME_LIMIT,
+    memory_limit_mb=PARSER_MEMORY_LIMIT_MB,
+    text_cache=PageTextCache(DOCUMENT_FOLDER_DIR, EXTRACTOR_VERSION),
+)
 main_folder = os.getenv("DOCUMENT_SOURCE_DIR")
 
 
@@ -61,73 +111,475 @@ def get_file_owner(path):
         return None
 
 
-embedding_model = GetEmbeddingModel(EMBEDDING_MODEL_NAME)
-
 # Allowed extensions
 extensions = {".txt", ".doc", ".docx", ".pdf"}
-# Category mapping
-with open(CATEGORIES_PATH, "r") as file:
-    categories = json.load(file)
 
-results = []
 
-for root, _, files in os.walk(main_folder):
-    for file in files:
-        ext = Path(file).suffix.lower()
-        if ext not in extensions:
-            continue
+def build_record(root, file, categories, file_id=None):
+    ext = Path(file).suffix.lower()
+    file_path = os.path.join(root, file)
+
+    # Folders relative to main_folder
+    relative_path = os.path.relpath(root, main_folder)
+    folder_parts = relative_path.split(os.sep) if relative_path != "." else []
+
+    cats = {}
+    for category in categories:
+        val = None
+        for value in category["values"]:
+            for folder in folder_parts:
+                if folder.lower() == value.lower():
+                    val = value
+        cats[category["id"]] = val
+
+    # File metadata
+    stat = os.stat(file_path)
+    created_at = datetime.datetime.fromtimestamp(stat.st_ctime).isoformat()
+    updated_at = datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
+
+    author = None
+    if ext == ".docx":
+        author = get_docx_author(file_path)
+    elif ext == ".pdf":
+        author = get_pdf_author(file_path)
+    else:
+        author = get_file_owner(file_path)  # fallback to OS owner
+
+    file_id = file_id or str(uuid.uuid4())
+    # Build record
+
+    record = {
+        "file_id": file_id,
+        "file_path": file_path,
+        "file_name": f"{file_id}{ext}",
+        "original_file_name": file,
+        "folder": "\\".join(folder_parts),
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "author": author or "",
+    }
+    for cat in cats:
+        record[cat] = cats[cat]
+    return record
+
+
+def collect_paths(folder=None):
+    paths = []
+    for root, _, files in os.walk(folder or main_folder):
+        for file in files:
+            if Path(file).suffix.lower() not in extensions:
+                continue
+            paths.append(os.path.join(root, file))
+    return paths
+
+
+def collect_changed(changed):
+    """Source files under the files and folders reported by the watcher."""
+    paths = []
+    for path in changed:
+        if os.path.isdir(path):
+            paths += collect_paths(path)
+        elif os.path.isfile(path) and Path(path).suffix.lower() in extensions:
+            paths.append(path)
+    return paths
+
 
-        file_path = os.path.join(root, file)
-
-        # Folders relative to main_folder
-        relative_path = os.path.relpath(root, main_folder)
-        folder_parts = relative_path.split(os.sep) if relative_path != "." else []
-
-        cats = {}
-        for category in categories:
-            val = None
-            for value in category["values"]:
-                for folder in folder_parts:
-                    if folder.lower() == value.lower():
-                        val = value
-            cats[category["id"]] = val
-
-        # File metadata
-        stat = os.stat(file_path)
-        created_at = datetime.datetime.fromtimestamp(stat.st_ctime).isoformat()
-        updated_at = datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
-
-        ext = Path(file).suffix.lower()
-        author = None
-        if ext == ".docx":
-            author = get_docx_author(file_path)
-        elif ext == ".pdf":
-            author = get_pdf_author(file_path)
+def sync_manifest(vectordb, manifest, categories, changed=None):
+    """
+    Remove vanished files and return the records of new, changed or
+    unfinished files: of the whole source folder, or only within the
+    `changed` files and folders. Returns (records, updates): changed files
+    whose previous version is indexed are in `updates` and keep serving that
+    version until the new one replaces it.
+    """
+    if changed is None:
+        to_process, removed = manifest.plan(collect_paths())
+    else:
+        to_process, removed = manifest.plan(collect_changed(changed), scopes=changed)
+
+    # Vanished files are deleted, and so are the chunks left by files an
+    # interrupted run did not finish, in batched deletes
+    replaced = [
+        file_id
+        for _, file_id, replaces_existing in to_process
+        if replaces_existing and not vectordb.get_file_data(file_id)
+    ]
+    vectordb.delete_files([entry["file_id"] for entry in removed] + replaced)
+    for entry in removed:
+        print(f"Removed {entry['path']} (no longer in the source folder)")
+        stored = os.path.join(
+            DOCUMENT_FOLDER_DIR, f"{entry['file_id']}{Path(entry['path']).suffix.lower()}"
+        )
+        if os.path.exists(stored):
+            os.remove(stored)
+        PARSE_OPTIONS.text_cache.delete(entry["file_id"])
+    manifest.remove([entry["path"] for entry in removed])
+
+    records, updates = [], []
+    for path, file_id, replaces_existing in to_process:
+        root, file = os.path.split(path)
+        record = build_record(root, file, categories, file_id)
+        if replaces_existing and file_id not in replaced:
+            updates.append(record)
         else:
-            author = get_file_owner(file_path)  # fallback to OS owner
-
-        file_id = str(uuid.uuid4())
-        # Build record
-
-        record = {
-            "file_id": file_id,
-            "file_path": file_path,
-            "file_name": f"{file_id}{ext}",
-            "original_file_name": file,
-            "folder": "\\".join(folder_parts),
-            "created_at": created_at,
-            "updated_at": updated_at,
-            "author": author or "",
-        }
-        for cat in cats:
-            record[cat] = cats[cat]
-        results.append(record)
-db = Db(SQL_DB_PATH)
-vectordb = VectorDbService(MILVUS_HOST, MILVUS_PORT, MILVUS_DB, embedding_model,db,categories)
-for r in results:
-    print(f"Processing {r['original_file_name']} in {r['folder']}")
-    dest_path = os.path.join(DOCUMENT_FOLDER_DIR, r["file_name"])
-    shutil.copy2(r["file_path"], dest_path)
-
-    vectordb.add_file(r)
-    print(f"{r['original_file_name']} added successfully\n=========================\n")
+            records.append(record)
+    return records, updates
+
+
+def update_records(vectordb, manifest, records):
+    """
+    Re-index changed files with the diff path of VectorDbService.update_file:
+    only new chunks are embedded and the old version is searchable until the
+    new one is indexed. A version that cannot be parsed leaves the old one.
+    Returns (updated, failed).
+    """
+    updated = failed = 0
+    for record in records:
+        try:
+            counts = vectordb.update_file(record)
+        except Exception as err:
+            counts = None
+            print(f"Updating {record['original_file_name']} failed: {err}")
+        if counts is None:
+            print(f"{record['original_file_name']} kept its previous version")
+            manifest.set_status([record["file_path"]], FAILED)
+            failed += 1
+            continue
+        shutil.copy2(
+            record["file_path"], os.path.join(DOCUMENT_FOLDER_DIR, record["file_name"])
+        )
+        manifest.set_status([record["file_path"]], INDEXED)
+        updated += 1
+        print(f"{record['original_file_name']} updated: {counts}")
+    return updated, failed
+
+
+def parse_record(record):
+    """Process-pool worker: copy the file into storage and extract its chunks."""
+    started = time.perf_counter()
+    dest_path = os.path.join(DOCUMENT_FOLDER_DIR, record["file_name"])
+    shutil.copy2(record["file_path"], dest_path)
+    chunks = load_chunks(record, options=PARSE_OPTIONS)
+    # Set after chunking so it is stored in the files table, not on the chunks
+    record["chunk_count"] = len(chunks)
+    return record, chunks, time.perf_counter() - started
+
+
+class LoaderStats:
+    def __init__(self, total_files, workers):
+        self.total_files = total_files
+        self.workers = workers
+        self.started = time.perf_counter()
+        self.files = 0
+        self.chunks = 0
+        self.failed = 0
+        self.busy = {"parse": 0.0, "embed": 0.0, "index": 0.0}
+        self._lock = threading.Lock()
+
+    def add_busy(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] += seconds
+
+    def add_indexed(self, files, chunks):
+        with self._lock:
+            self.files += files
+            self.chunks += chunks
+
+    def add_failed(self, files=1):
+        with self._lock:
+            self.failed += files
+
+    def report(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            parse_util = self.busy["parse"] / (elapsed * self.workers)
+            print(
+                f"[{self.files + self.failed}/{self.total_files} files] "
+                f"{self.files / elapsed:.2f} files/s, {self.chunks / elapsed:.1f} chunks/s | "
+                f"utilisation parse {parse_util:.0%}, "
+                f"embed {self.busy['embed'] / elapsed:.0%}, "
+                f"index {self.busy['index'] / elapsed:.0%} | failed {self.failed}"
+            )
+
+
+def embed_stage(vectordb, parsed, embedded, stats, batch_size, on_failed):
+    """Group parsed files into batches of >= batch_size chunks and embed each batch once."""
+    group, group_chunks, done = [], 0, False
+    while not done:
+        try:
+            item = parsed.get(timeout=1)
+        except queue.Empty:
+            item = ()
+        if item is None:
+            done = True
+        elif item:
+            group.append(item)
+            group_chunks += len(item[1])
+        if group and (done or group_chunks >= batch_size or item == ()):
+            started = time.perf_counter()
+            try:
+                # Near-duplicates of stored chunks are neither embedded nor
+                # inserted; their dedup rows are recorded once the batch is
+                kept, staged = vectordb.dedupe_chunks(
+                    [c for _, chunks in group for c in chunks]
+                )
+                by_file = {record["file_id"]: [] for record, _ in group}
+                for chunk in kept:
+                    by_file[chunk.metadata["file_id"]].append(chunk)
+                group = [(record, by_file[record["file_id"]]) for record, _ in group]
+                texts = [c.page_content for _, chunks in group for c in chunks]
+                embedded.put((group, vectordb.embed_texts(texts), staged))
+            except Exception as err:
+                print(f"Embedding failed for {len(group)} files: {err}")
+                stats.add_failed(len(group))
+                on_failed([record for record, _ in group])
+            stats.add_busy("embed", time.perf_counter() - started)
+            group, group_chunks = [], 0
+    embedded.put(None)
+
+
+def index_stage(vectordb, embedded, stats, on_indexed, on_failed, bulk_importer=None):
+    """
+    Insert each embedded batch into Milvus with one call, or with a bulk
+    importer stage every batch into Parquet files and import them all at the end.
+    """
+    staged, staged_dedup = [], []
+    while (item := embedded.get()) is not None:
+        group, embeddings, dedup = item
+        records = [record for record, _ in group]
+        started = time.perf_counter()
+        try:
+            if bulk_importer:
+                bulk_importer.append([c for _, chunks in group for c in chunks], embeddings)
+                staged.extend(records)
+                if dedup:
+                    staged_dedup.append(dedup)
+                stats.add_indexed(len(group), len(embeddings))
+            else:
+                vectordb.index_chunks(group, embeddings, dedup)
+                stats.add_indexed(len(group), len(embeddings))
+                on_indexed(records)
+                for record in records:
+                    print(f"{record['original_file_name']} added successfully")
+        except Exception as err:
+            print(f"Indexing failed for {len(group)} files: {err}")
+            stats.add_failed(len(group))
+            on_failed(records)
+        stats.add_busy("index", time.perf_counter() - started)
+
+    if staged:
+        started = time.perf_counter()
+        try:
+            print(f"Importing {bulk_importer.rows} staged chunks with Milvus bulk import")
+            bulk_importer.finish()
+            for dedup in staged_dedup:
+                vectordb.deduplicator.commit(dedup)
+            vectordb.save_meta_many([file_meta(record) for record in staged])
+            on_indexed(staged)
+            print(f"{len(staged)} files imported successfully")
+        except Exception as err:
+            print(f"Bulk import failed for {len(staged)} files: {err}")
+            stats.add_failed(len(staged))
+            on_failed(staged)
+        stats.add_busy("index", time.perf_counter() - started)
+
+
+def run_pipeline(
+    vectordb,
+    records,
+    workers,
+    batch_size,
+    queue_size,
+    report_every=10,
+    on_indexed=None,
+    on_failed=None,
+    bulk_importer=None,
+):
+    """
+    Pipelined bulk load: a process pool extracts and chunks files, one thread
+    embeds batches of chunks across files and another inserts them in Milvus.
+    `on_indexed` / `on_failed` are called with the records of each committed
+    or failed batch. With a `bulk_importer` the chunks are bulk imported once
+    all files are embedded.
+    """
+    on_indexed = on_indexed or (lambda records: None)
+    on_failed = on_failed or (lambda records: None)
+    stats = LoaderStats(len(records), workers)
+    parsed = queue.Queue(maxsize=queue_size)
+    embedded = queue.Queue(maxsize=queue_size)
+    embedder = threading.Thread(
+        target=embed_stage,
+        args=(vectordb, parsed, embedded, stats, batch_size, on_failed),
+    )
+    indexer = threading.Thread(
+        target=index_stage,
+        args=(vectordb, embedded, stats, on_indexed, on_failed, bulk_importer),
+    )
+    embedder.start()
+    indexer.start()
+
+    last_report = time.perf_counter()
+    pending_records = iter(records)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        while True:
+            # Keep a bounded window of files in extraction
+            while len(in_flight) < workers * 2:
+                record = next(pending_records, None)
+                if record is None:
+                    break
+                in_flight[pool.submit(parse_record, record)] = record
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = in_flight.pop(future)
+                try:
+                    record, chunks, seconds = future.result()
+                except Exception as err:
+                    print(f"Parsing {record['original_file_name']} failed: {err}")
+                    stats.add_failed()
+                    on_failed([record])
+                    continue
+                stats.add_busy("parse", seconds)
+                if not chunks:
+                    print(f"{record['original_file_name']} has no text, skipped")
+                    stats.add_failed()
+                    on_failed([record])
+                    continue
+                parsed.put((record, chunks))
+            if time.perf_counter() - last_report >= report_every:
+                stats.report()
+                last_report = time.perf_counter()
+
+    parsed.put(None)
+    embedder.join()
+    indexer.join()
+    stats.report()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the source folder into the knowledge base")
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Stage chunks as Parquet files and load them with Milvus bulk import",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After loading, keep watching the source folder and ingest changes",
+    )
+    args = parser.parse_args()
+
+    embedding_model = GetEmbeddingModel(EMBEDDING_MODEL_NAME)
+
+    # Category mapping
+    with open(CATEGORIES_PATH, "r") as file:
+        categories = json.load(file)
+
+    db = Db(SQL_DB_PATH)
+    embedding_cache = (
+        EmbeddingCache(
+            EMBEDDING_CACHE_DIR,
+            EMBEDDING_MODEL_NAME,
+            EMBEDDING_CACHE_MAX_ENTRIES,
+            EMBEDDING_CACHE_DTYPE,
+        )
+        if EMBEDDING_CACHE_DIR
+        else None
+    )
+    vectordb = VectorDbService(
+        MILVUS_HOST,
+        MILVUS_PORT,
+        MILVUS_DB,
+        embedding_model,
+        db,
+        categories,
+        embedding_cache=embedding_cache,
+        parse_options=PARSE_OPTIONS,
+        collection_name=MILVUS_COLLECTION,
+        partition_key=MILVUS_PARTITION_KEY,
+        deduplicator=(
+            ChunkDeduplicator(
+                db, MILVUS_COLLECTION, CHUNK_DEDUP_THRESHOLD, CHUNK_DEDUP_MIN_WORDS
+            )
+            if CHUNK_DEDUP
+            else None
+        ),
+    )
+    manifest = LoaderManifest(db)
+    results, updates = sync_manifest(vectordb, manifest, categories)
+
+    bulk_importer = (
+        BulkImporter(
+            vectordb,
+            MILVUS_MINIO_ENDPOINT,
+            MILVUS_MINIO_ACCESS_KEY,
+            MILVUS_MINIO_SECRET_KEY,
+            MILVUS_MINIO_BUCKET,
+        )
+        if args.bulk
+        else None
+    )
+
+    def load(records, bulk_importer=None):
+        return run_pipeline(
+            vectordb,
+            records,
+            LOADER_WORKERS,
+            LOADER_BATCH_SIZE,
+            LOADER_QUEUE_SIZE,
+            on_indexed=lambda records: manifest.set_status(
+                [r["file_path"] for r in records], INDEXED
+            ),
+            on_failed=lambda records: manifest.set_status(
+                [r["file_path"] for r in records], FAILED
+            ),
+            bulk_importer=bulk_importer,
+        )
+
+    print(f"Loading {len(results)} new or unfinished files with {LOADER_WORKERS} parser processes")
+    load(results, bulk_importer)
+    if updates:
+        print(f"Updating {len(updates)} changed files")
+        update_records(vectordb, manifest, updates)
+
+    if embedding_cache:
+        print(f"Embedding cache: {embedding_cache.snapshot()}")
+    if vectordb.deduplicator:
+        print(f"Chunk deduplication: {vectordb.deduplicator.snapshot()}")
+
+    if args.watch:
+
+        def on_changes(paths):
+            records, updates = sync_manifest(vectordb, manifest, categories, changed=paths)
+            files = failed = 0
+            if records:
+                print(f"Loading {len(records)} new or unfinished files")
+                stats = load(records)
+                files, failed = stats.files, stats.failed
+            if updates:
+                print(f"Updating {len(updates)} changed files")
+                updated, update_failed = update_records(vectordb, manifest, updates)
+                files, failed = files + updated, failed + update_failed
+            return files, failed
+
+        print(f"Watching {main_folder} for changes (Ctrl+C to stop)")
+        try:
+            watch(
+                main_folder,
+                on_changes,
+                WatcherStatus(db),
+                mode=WATCH_MODE,
+                debounce_seconds=WATCH_DEBOUNCE_SECONDS,
+                poll_interval=WATCH_POLL_INTERVAL,
+                extensions=extensions,
+            )
+        except KeyboardInterrupt:
+            print("Stopped watching")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+### RUN AS
+##python -m setup.filter_benchmark [--files 2000] [--chunks 20] [--dim 768] [--runs 50]
+# Compares filtered-search latency on two scratch collections holding the
+# same synthetic corpus, one with the scalar indexes VectorDbService creates
+# and one without. The files are listed in a scratch SQLite database, as the
+# folder filter and the retrieval planner read it. The collections are
+# dropped afterwards.
+
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import datetime
+import tempfile
+import statistics
+
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from model.domain.core import Category, UserFilter
+from services.db import Db
+from services.vector_db_service import VectorDbService
+
+load_dotenv(find_dotenv())
+
+MILVUS_DB = os.getenv("MILVUS_DB")
+MILVUS_HOST = os.getenv("MILVUS_HOST")
+MILVUS_PORT = os.getenv("MILVUS_PORT")
+
+WORDS = "report budget project country year policy review analysis data plan".split()
+CATEGORIES = [
+    {"id": "country", "name": "Country", "values": [f"country{i}" for i in range(20)]},
+    {"id": "year", "name": "Year", "values": [str(year) for year in range(2015, 2025)]},
+]
+
+
+def synthetic_files(files, chunks_per_file, dim, seed=0):
+    """(chunks, vectors) per file, with folders, dates and categories spread evenly."""
+    rng = np.random.default_rng(seed)
+    for n in range(files):
+        file_id = str(uuid.UUID(int=n + 1))
+        country = CATEGORIES[0]["values"][n % len(CATEGORIES[0]["values"])]
+        year = CATEGORIES[1]["values"][n % len(CATEGORIES[1]["values"])]
+        created = datetime.date(int(year), 1, 1) + datetime.timedelta(days=n % 365)
+        meta = {
+            "total_pages": 1,
+            "file_id": file_id,
+            "file_name": f"{file_id}.pdf",
+            "original_file_name": f"benchmark_{n}.pdf",
+            "folder": f"{country}\\{year}",
+            "created_at": created.isoformat(),
+            "updated_at": created.isoformat(),
+            "author": "",
+            "country": country,
+            "year": year,
+        }
+        chunks = [
+            Document(
+                page_content=" ".join(rng.choice(WORDS, size=80)),
+                metadata={**meta, "page": 0, "chunk_index": i},
+            )
+            for i in range(chunks_per_file)
+        ]
+        vectors = rng.standard_normal((chunks_per_file, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield chunks, vectors.tolist()
+
+
+def scratch_db(path, args):
+    """A files table listing the synthetic corpus, with its chunk counts."""
+    db = Db(path)
+    category_fields = "".join(f"{cat['id']} TEXT,\n" for cat in CATEGORIES)
+    db.execute(
+        f"""CREATE TABLE files (
+            id UUID PRIMARY KEY, original_file_name TEXT NOT NULL,
+            file_name TEXT NOT NULL, folder TEXT NOT NULL, created_at TEXT,
+            updated_at TEXT, author TEXT, chunk_count INTEGER,
+            {category_fields}
+            upload_date TEXT DEFAULT CURRENT_TIMESTAMP
+        )"""
+    )
+    rows = []
+    for chunks, _ in synthetic_files(args.files, args.chunks, 1):
+        meta = dict(chunks[0].metadata)
+        for key in ("total_pages", "page", "chunk_index"):
+            meta.pop(key)
+        meta["id"] = meta.pop("file_id")
+        rows.append({**meta, "chunk_count": len(chunks)})
+    cols = list(rows[0])
+    db.execute_many(
+        f"INSERT INTO files ({','.join(cols)}) VALUES ({','.join(f':{col}' for col in cols)})",
+        rows,
+    )
+    return db
+
+
+def scratch_vectordb(name, dim, scalar_indexes, db):
+    return VectorDbService(
+        MILVUS_HOST,
+        MILVUS_PORT,
+        MILVUS_DB,
+        FakeEmbeddings(size=dim),
+        db=db,
+        categories=CATEGORIES,
+        collection_name=name,
+        scalar_indexes=scalar_indexes,
+    )
+
+
+def wait_for_indexes(vectordb, timeout=600):
+    client = vectordb.vectorstore.client
+    collection = vectordb.vectorstore.collection_name
+    deadline = time.monotonic() + timeout
+    for name in client.list_indexes(collection):
+        while client.describe_index(collection, name).get("pending_index_rows", 0):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Index {name} still building")
+            time.sleep(1)
+
+
+def load(vectordb, args):
+    batch_chunks, batch_vectors = [], []
+    for chunks, vectors in synthetic_files(args.files, args.chunks, args.dim):
+        batch_chunks += chunks
+        batch_vectors += vectors
+        if len(batch_chunks) >= 1000:
+            vectordb.insert_chunks(batch_chunks, batch_vectors)
+            batch_chunks, batch_vectors = [], []
+    vectordb.insert_chunks(batch_chunks, batch_vectors)
+    vectordb.vectorstore.client.flush(vectordb.vectorstore.collection_name)
+    wait_for_indexes(vectordb)
+
+
+def scenarios(file_id):
+    return {
+        "country": UserFilter(category_ids=[Category(id="country", categories=["country3"])]),
+        "country+year": UserFilter(
+            category_ids=[
+                Category(id="country", categories=["country3"]),
+                Category(id="year", categories=["2023"]),
+            ]
+        ),
+        "folder prefix": UserFilter(folder="country7"),
+        "created range": UserFilter(created_from="2020-03-01", created_to="2020-03-31"),
+        "file_id": file_id,
+    }
+
+
+def measure(vectordb, scenario, runs):
+    store = vectordb.vectorstore
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        if isinstance(scenario, str):
+            # The lookup delete_file and get_file_content run
+            store.client.query(
+                store.collection_name,
+                filter=f'file_id == "{scenario}"',
+                output_fields=[store._primary_field],
+            )
+        else:
+            asyncio.run(
+                vectordb.get_documents(["project budget review"], None, user_filter=scenario)
+            )
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark filtered search with and without scalar indexes"
+    )
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=20, help="Chunks per file")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    args = parser.parse_args()
+
+    stamp = f"{datetime.datetime.now():%Y%m%d%H%M%S}"
+    db = scratch_db(os.path.join(tempfile.mkdtemp(), "files.sqlite"), args)
+    plain = scratch_vectordb(f"bench_filter_plain_{stamp}", args.dim, False, db)
+    indexed = scratch_vectordb(f"bench_filter_indexed_{stamp}", args.dim, True, db)
+    for vectordb in (plain, indexed):
+        load(vectordb, args)
+    file_id = str(uuid.UUID(int=args.files // 2 + 1))
+
+    print(f"{args.files} files x {args.chunks} chunks, dim {args.dim}, {args.runs} runs")
+    print(f"  {'filter':<16}{'no index p50/p95':>22}{'indexed p50/p95':>22}{'speedup':>10}")
+    for name, scenario in scenarios(file_id).items():
+        plain_p50, plain_p95 = measure(plain, scenario, args.runs)
+        indexed_p50, indexed_p95 = measure(indexed, scenario, args.runs)
+        print(
+            f"  {name:<16}{plain_p50:>10.1f} /{plain_p95:>7.1f} ms"
+            f"{indexed_p50:>10.1f} /{indexed_p95:>7.1f} ms"
+            f"{plain_p50 / indexed_p50:>9.2f}x"
+        )
+
+    if not args.keep:
+        for vectordb in (plain, indexed):
+            vectordb.drop_collection(vectordb.vectorstore.collection_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import os
+import time
+import queue
+import ctypes
+import select
+import struct
+import logging
+import threading
+import ctypes.util
+
+from services.watcher_status import WatcherStatus
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event masks
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF
+)
+_EVENT = struct.Struct("iIII")
+
+
+class InotifySource:
+    """
+    Changed paths from Linux inotify, with a watch on every folder of the
+    tree. Events on network mounts are not delivered; use polling there.
+    """
+
+    mode = "inotify"
+
+    def __init__(self, root: str, extensions: set[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.root = root
+        self.extensions = extensions
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: dict[int, str] = {}
+        self._watch_tree(root)
+
+    @staticmethod
+    def available() -> bool:
+        libc_name = ctypes.util.find_library("c")
+        return bool(libc_name) and hasattr(ctypes.CDLL(libc_name), "inotify_init1")
+
+    def _watch_tree(self, folder: str):
+        for current, _, _ in os.walk(folder):
+            wd = self._add_watch(self.fd, os.fsencode(current), WATCH_MASK)
+            if wd < 0:
+                logger.warning(f"Cannot watch {current}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.watches[wd] = current
+
+    def poll(self, timeout: float) -> set[str]:
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        data = os.read(self.fd, 1 << 16)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset : offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: rescan the whole tree
+                changed.add(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            folder = self.watches.get(wd)
+            if folder is None or mask & IN_DELETE_SELF:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(path)
+                changed.add(path)
+            elif os.path.splitext(name)[1].lower() in self.extensions:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Changed paths found by comparing size and mtime of every file on each scan."""
+
+    mode = "poll"
+
+    def __init__(self, root: str, interval: float, extensions: set[str]):
+        self.root = root
+        self.interval = interval
+        self.extensions = extensions
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> dict[str, tuple[int, float]]:
+        snapshot = {}
+        for current, _, files in os.walk(self.root):
+            for file in files:
+                if os.path.splitext(file)[1].lower() not in self.extensions:
+                    continue
+                path = os.path.join(current, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def poll(self, timeout: float) -> set[str]:
+        time.sleep(max(min(timeout, self._next_scan - time.monotonic()), 0))
+        if time.monotonic() < self._next_scan:
+            return set()
+        snapshot = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        changed = {
+            path
+            for path in snapshot.keys() | self._snapshot.keys()
+            if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_source(root: str, mode: str, poll_interval: float, extensions: set[str]):
+    """`mode` is inotify, poll or auto (inotify when the platform has it)."""
+    if mode == "inotify" or (mode == "auto" and InotifySource.available()):
+        return InotifySource(root, extensions)
+    return PollingSource(root, poll_interval, extensions)
+
+
+def watch(
+    root: str,
+    on_changes,
+    status: WatcherStatus,
+    mode: str = "auto",
+    debounce_seconds: float = 5.0,
+    poll_interval: float = 30.0,
+    extensions: set[str] | None = None,
+    stop: threading.Event | None = None,
+):
+    """
+    Watch `root` until `stop` is set. A path is handed over once no event
+    has arrived for it for `debounce_seconds`, so files still being copied
+    are not read half-written. Ready paths are passed in batches to
+    `on_changes(paths)`, which returns (indexed, failed) file counts; it runs
+    on its own thread so events keep being collected meanwhile.
+    """
+    stop = stop or threading.Event()
+    source = open_source(root, mode, poll_interval, extensions or set())
+    if source.mode == "poll":
+        # A file is only known to be stable once a later scan saw it unchanged
+        debounce_seconds = max(debounce_seconds, poll_interval)
+    status.start(root, source.mode)
+    logger.info(f"Watching {root} ({source.mode})")
+
+    pending: dict[str, tuple[float, float]] = {}  # path -> (first event, last event)
+    batches = queue.Queue()
+    processing = [0]
+
+    def ingest():
+        while (batch := batches.get()) is not None:
+            processing[0] = len(batch)
+            try:
+                indexed, failed = on_changes(list(batch))
+            except Exception:
+                logger.exception(f"Ingesting {len(batch)} changed paths failed")
+                indexed, failed = 0, len(batch)
+            processing[0] = 0
+            status.add_batch(root, indexed, failed, time.time() - min(batch.values()))
+
+    worker = threading.Thread(target=ingest, name="watcher-ingest", daemon=True)
+    worker.start()
+    last_heartbeat = 0.0
+    try:
+        while not stop.is_set():
+            for path in source.poll(timeout=1.0):
+                now = time.time()
+                first_seen = pending.get(path, (now, now))[0]
+                pending[path] = (first_seen, now)
+
+            now = time.time()
+            ready = {
+                path: first_seen
+                for path, (first_seen, last_seen) in pending.items()
+                if now - last_seen >= debounce_seconds
+            }
+            if ready:
+                for path in ready:
+                    del pending[path]
+                batches.put(ready)
+
+            if ready or now - last_heartbeat >= status.heartbeat_seconds:
+                queued = [first for batch in list(batches.queue) for first in batch.values()]
+                waiting = queued + [first for first, _ in pending.values()]
+                status.update(
+                    root,
+                    pending=len(waiting),
+                    processing=processing[0],
+                    oldest_pending_seconds=now - min(waiting) if waiting else None,
+                )
+                last_heartbeat = now
+    finally:
+        batches.put(None)
+        worker.join()
+        source.close()
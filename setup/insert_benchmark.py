@@ -0,0 +1,120 @@
+### RUN AS
+##python -m setup.insert_benchmark [--rows 100000] [--dim 768] [--batch 256]
+# Compares Milvus insert throughput of the regular loader path (batched
+# add_embeddings) with the bulk import path, on synthetic chunks written to
+# two scratch collections that are dropped afterwards.
+
+import os
+import time
+import uuid
+import argparse
+import datetime
+
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from services.vector_db_service import VectorDbService
+from services.bulk_import import BulkImporter
+
+load_dotenv(find_dotenv())
+
+MILVUS_DB = os.getenv("MILVUS_DB")
+MILVUS_HOST = os.getenv("MILVUS_HOST")
+MILVUS_PORT = os.getenv("MILVUS_PORT")
+MILVUS_MINIO_ENDPOINT = os.getenv("MILVUS_MINIO_ENDPOINT", "localhost:9000")
+MILVUS_MINIO_ACCESS_KEY = os.getenv("MILVUS_MINIO_ACCESS_KEY", "minioadmin")
+MILVUS_MINIO_SECRET_KEY = os.getenv("MILVUS_MINIO_SECRET_KEY", "minioadmin")
+MILVUS_MINIO_BUCKET = os.getenv("MILVUS_MINIO_BUCKET", "a-bucket")
+
+WORDS = "report budget project country year policy review analysis data plan".split()
+
+
+def synthetic_batches(rows, dim, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    file_id = str(uuid.uuid4())
+    for start in range(0, rows, batch_size):
+        count = min(batch_size, rows - start)
+        chunks = [
+            Document(
+                page_content=" ".join(rng.choice(WORDS, size=80)),
+                metadata={
+                    "page": 0,
+                    "total_pages": 1,
+                    "file_id": file_id,
+                    "file_name": f"{file_id}.pdf",
+                    "original_file_name": "benchmark.pdf",
+                    "folder": "",
+                    "created_at": "",
+                    "updated_at": "",
+                    "author": "",
+                    "chunk_index": start + i,
+                },
+            )
+            for i in range(count)
+        ]
+        vectors = rng.standard_normal((count, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        yield chunks, vectors.tolist()
+
+
+def scratch_vectordb(name, dim):
+    return VectorDbService(
+        MILVUS_HOST,
+        MILVUS_PORT,
+        MILVUS_DB,
+        FakeEmbeddings(size=dim),
+        db=None,
+        categories=[],
+        collection_name=name,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Milvus insert paths")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    args = parser.parse_args()
+
+    stamp = f"{datetime.datetime.now():%Y%m%d%H%M%S}"
+    results = {}
+
+    # Regular path: one add_embeddings call per batch
+    vectordb = scratch_vectordb(f"bench_insert_{stamp}", args.dim)
+    started = time.perf_counter()
+    for chunks, vectors in synthetic_batches(args.rows, args.dim, args.batch):
+        vectordb.insert_chunks(chunks, vectors)
+    results["insert"] = time.perf_counter() - started
+
+    # Bulk path: stage Parquet files, then one server-side import
+    bulk_vectordb = scratch_vectordb(f"bench_bulk_{stamp}", args.dim)
+    importer = BulkImporter(
+        bulk_vectordb,
+        MILVUS_MINIO_ENDPOINT,
+        MILVUS_MINIO_ACCESS_KEY,
+        MILVUS_MINIO_SECRET_KEY,
+        MILVUS_MINIO_BUCKET,
+    )
+    started = time.perf_counter()
+    for chunks, vectors in synthetic_batches(args.rows, args.dim, args.batch):
+        importer.append(chunks, vectors)
+    staged = time.perf_counter() - started
+    importer.finish()
+    results["bulk"] = time.perf_counter() - started
+
+    print(f"{args.rows} rows, dim {args.dim}, batch {args.batch}")
+    for path, seconds in results.items():
+        print(f"  {path:<8}{seconds:>8.1f}s {args.rows / seconds:>10.0f} rows/s")
+    print(f"  (bulk: {staged:.1f}s writing Parquet, {results['bulk'] - staged:.1f}s importing)")
+    print(f"  speedup {results['insert'] / results['bulk']:.2f}x")
+
+    if not args.keep:
+        for db in (vectordb, bulk_vectordb):
+            db.drop_collection(db.vectorstore.collection_name)
+
+
+if __name__ == "__main__":
+    main()
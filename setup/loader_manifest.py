@@ -0,0 +1,131 @@
+import os
+import uuid
+import hashlib
+
+from services.db import Db
+
+# Manifest statuses
+PENDING = "pending"
+INDEXED = "indexed"
+FAILED = "failed"
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _within(path: str, scopes: list[str]) -> bool:
+    return any(
+        path == scope or path.startswith(scope.rstrip(os.sep) + os.sep) for scope in scopes
+    )
+
+
+class LoaderManifest:
+    """
+    Tracks every source file the bulk loader has seen (path, size, mtime and
+    content hash -> file_id, status) so runs only process the delta and an
+    interrupted run resumes with the files it did not commit.
+    """
+
+    def __init__(self, db: Db):
+        self.db = db
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS loader_manifest (
+                path          TEXT PRIMARY KEY,
+                size          INTEGER NOT NULL,
+                mtime         REAL NOT NULL,
+                content_hash  TEXT NOT NULL,
+                file_id       TEXT NOT NULL,
+                status        TEXT NOT NULL,
+                updated_at    TEXT DEFAULT CURRENT_TIMESTAMP
+            )"""
+        )
+
+    def entries(self) -> dict[str, dict]:
+        rows = self.db.get_rows("SELECT * FROM loader_manifest")
+        return {row["path"]: row for row in rows}
+
+    def plan(self, paths: list[str], scopes: list[str] | None = None):
+        """
+        Compare the source tree with the manifest.
+
+        Returns (to_process, removed) where to_process is a list of
+        (path, file_id, replaces_existing) for new, changed, pending or failed
+        files, and removed lists the manifest entries whose file disappeared.
+        With `scopes` (files and folders reported by the watcher) `paths` only
+        covers those, and only entries within them can be removed.
+        """
+        known = self.entries()
+        to_process, unchanged_updates = [], []
+        for path in paths:
+            stat = os.stat(path)
+            entry = known.get(path)
+            if entry is None:
+                file_id = str(uuid.uuid4())
+                self._upsert(path, stat, hash_file(path), file_id, PENDING)
+                to_process.append((path, file_id, False))
+                continue
+
+            if entry["status"] == INDEXED and (
+                entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+            ):
+                continue
+
+            content_hash = hash_file(path)
+            if entry["status"] == INDEXED and entry["content_hash"] == content_hash:
+                # Touched but not modified
+                unchanged_updates.append(
+                    (stat.st_size, stat.st_mtime, entry["path"])
+                )
+                continue
+
+            self._upsert(path, stat, content_hash, entry["file_id"], PENDING)
+            to_process.append((path, entry["file_id"], True))
+
+        if unchanged_updates:
+            self.db.execute_many(
+                "UPDATE loader_manifest SET size=?, mtime=? WHERE path=?",
+                unchanged_updates,
+            )
+
+        current = set(paths)
+        removed = [
+            entry
+            for path, entry in known.items()
+            if path not in current and (scopes is None or _within(path, scopes))
+        ]
+        return to_process, removed
+
+    def _upsert(self, path, stat, content_hash, file_id, status):
+        self.db.execute(
+            """INSERT INTO loader_manifest (path, size, mtime, content_hash, file_id, status)
+            VALUES (:path, :size, :mtime, :content_hash, :file_id, :status)
+            ON CONFLICT(path) DO UPDATE SET
+                size=excluded.size, mtime=excluded.mtime,
+                content_hash=excluded.content_hash, file_id=excluded.file_id,
+                status=excluded.status, updated_at=CURRENT_TIMESTAMP""",
+            {
+                "path": path,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "content_hash": content_hash,
+                "file_id": file_id,
+                "status": status,
+            },
+        )
+
+    def set_status(self, paths: list[str], status: str):
+        self.db.execute_many(
+            """UPDATE loader_manifest SET status=?, updated_at=CURRENT_TIMESTAMP
+            WHERE path=?""",
+            [(status, path) for path in paths],
+        )
+
+    def remove(self, paths: list[str]):
+        self.db.execute_many(
+            "DELETE FROM loader_manifest WHERE path=?", [(path,) for path in paths]
+        )
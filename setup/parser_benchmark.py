@@ -0,0 +1,85 @@
+### RUN AS
+##python -m setup.parser_benchmark [folder] [--limit N]
+# Times every registered parser backend on the files of a folder.
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+from dotenv import load_dotenv, find_dotenv
+
+from services.document_parser import PARSERS, detect_format, _page_chars
+
+load_dotenv(find_dotenv())
+
+
+def run_backend(backend, file_path):
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        pages = list(backend.factory(file_path).lazy_load())
+        error = None
+    except Exception as err:
+        pages, error = [], f"{type(err).__name__}: {err}"
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "pages": len(pages),
+        "chars": _page_chars(pages),
+        "peak_mb": peak / (1024 * 1024),
+        "error": error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark document parser backends")
+    parser.add_argument("folder", nargs="?", default=os.getenv("DOCUMENT_SOURCE_DIR"))
+    parser.add_argument("--limit", type=int, default=0, help="Max files per format")
+    args = parser.parse_args()
+    if not args.folder:
+        sys.exit("Pass a folder or set DOCUMENT_SOURCE_DIR")
+
+    files = {}
+    for root, _, names in os.walk(args.folder):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                fmt = detect_format(path)
+            except ValueError:
+                continue
+            files.setdefault(fmt, []).append(path)
+
+    for fmt, paths in sorted(files.items()):
+        if args.limit:
+            paths = paths[: args.limit]
+        print(f"\n{fmt}: {len(paths)} files")
+        print(
+            f"  {'backend':<14}{'files/s':>9}{'pages/s':>9}{'chars/page':>12}"
+            f"{'peak MB':>9}{'low text':>10}{'errors':>8}"
+        )
+        for backend in PARSERS[fmt]:
+            results = [run_backend(backend, path) for path in paths]
+            seconds = sum(r["seconds"] for r in results) or 1e-9
+            pages = sum(r["pages"] for r in results)
+            chars = sum(r["chars"] for r in results)
+            low_text = sum(
+                1
+                for r in results
+                if backend.min_chars_per_page
+                and r["chars"] < backend.min_chars_per_page * max(r["pages"], 1)
+            )
+            errors = sum(1 for r in results if r["error"])
+            print(
+                f"  {backend.name:<14}{len(results) / seconds:>9.2f}{pages / seconds:>9.1f}"
+                f"{chars / max(pages, 1):>12.0f}"
+                f"{max((r['peak_mb'] for r in results), default=0):>9.1f}"
+                f"{low_text:>10}{errors:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+### RUN AS
+##python -m setup.reindex [--file-id ID ...]
+##python -m setup.reindex --shadow [--embedding-model NAME] [--chunk-size N] [--chunk-overlap N]
+##python -m setup.reindex --rollback | --status
+# Re-chunks and re-embeds indexed documents from the cached page text in
+# DOCUMENT_FOLDER_DIR. Files without cached text are extracted once from
+# their stored copy; the original source documents are never read.
+#
+# By default the chunks of the serving collection are replaced file by file.
+# With --shadow a new collection is built while the current one keeps
+# serving, then the MILVUS_COLLECTION alias is switched to it; the previous
+# collection is kept so --rollback can switch back.
+
+import os
+import json
+import time
+import argparse
+import datetime
+import itertools
+import dataclasses
+
+from dotenv import load_dotenv, find_dotenv
+
+from services.vector_db_service import VectorDbService
+from services.db import Db
+from services.llm_init_service import GetEmbeddingModel
+from services.embedding_cache import EmbeddingCache
+from services.document_parser import iter_chunk_batches
+from services.reindex_runs import ReindexRuns, SWAPPED, FAILED, ROLLED_BACK
+from services.chunk_dedup import ChunkDeduplicator
+from setup.document_loader import (
+    PARSE_OPTIONS,
+    CHUNK_DEDUP,
+    CHUNK_DEDUP_THRESHOLD,
+    CHUNK_DEDUP_MIN_WORDS,
+)
+
+env_path = find_dotenv()
+load_dotenv(env_path)
+
+MILVUS_DB = os.getenv("MILVUS_DB")
+MILVUS_HOST = os.getenv("MILVUS_HOST")
+MILVUS_PORT = os.getenv("MILVUS_PORT")
+MILVUS_COLLECTION = os.getenv("MILVUS_COLLECTION", "LangChainCollection")
+MILVUS_PARTITION_KEY = os.getenv("MILVUS_PARTITION_KEY") or None
+SQL_DB_PATH = os.getenv("SQL_DB_PATH")
+CATEGORIES_PATH = os.getenv("CATEGORIES_PATH")
+DOCUMENT_FOLDER_DIR = os.getenv("DOCUMENT_FOLDER_DIR")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
+
+
+def file_record(row: dict) -> dict:
+    """Rebuild the ingest record of an indexed file from its files table row."""
+    record = dict(row)
+    record["file_id"] = record.pop("id")
+    record.pop("upload_date", None)
+    record.pop("chunk_count", None)
+    record["file_path"] = os.path.join(DOCUMENT_FOLDER_DIR, record["file_name"])
+    return record
+
+
+def reindex_file(vectordb: VectorDbService, record: dict, batch_size: int) -> int:
+    """Replace the chunks of one file; returns the number of chunks it now has."""
+    batches = iter_chunk_batches(record, batch_size, vectordb.parse_options)
+    # Extract (or read the cache) before dropping the old chunks so a file
+    # that cannot be parsed keeps its current index
+    first = next(batches, None)
+    if first is None:
+        return 0
+    # Shared chunks the file stores are handed to files that still reference
+    # them, and its own references are dropped; the new chunks then go
+    # through deduplication again, so none of them re-creates a handed-over id
+    vectordb.delete_chunks(record["file_id"])
+    return index_file(vectordb, record, batch_size, itertools.chain([first], batches))
+
+
+def index_file(vectordb: VectorDbService, record: dict, batch_size: int, batches=None) -> int:
+    """
+    Insert the chunks of one file into a collection that does not hold it yet;
+    near-duplicates of chunks already in it are recorded as references.
+    """
+    if batches is None:
+        batches = iter_chunk_batches(record, batch_size, vectordb.parse_options)
+    count = 0
+    for chunks in batches:
+        count += len(chunks)
+        chunks, staged = vectordb.dedupe_chunks(chunks)
+        vectordb.insert_chunks(
+            chunks, vectordb.embed_texts([c.page_content for c in chunks]), staged
+        )
+    return count
+
+
+def build_vectordb(db, categories, embedding_model_name, collection_name, parse_options):
+    embedding_cache = (
+        EmbeddingCache(
+            EMBEDDING_CACHE_DIR,
+            embedding_model_name,
+            EMBEDDING_CACHE_MAX_ENTRIES,
+            EMBEDDING_CACHE_DTYPE,
+        )
+        if EMBEDDING_CACHE_DIR
+        else None
+    )
+    return VectorDbService(
+        MILVUS_HOST,
+        MILVUS_PORT,
+        MILVUS_DB,
+        GetEmbeddingModel(embedding_model_name),
+        db,
+        categories,
+        embedding_cache=embedding_cache,
+        ingest_batch_size=INGEST_BATCH_SIZE,
+        parse_options=parse_options,
+        collection_name=collection_name,
+        partition_key=MILVUS_PARTITION_KEY,
+        deduplicator=(
+            ChunkDeduplicator(
+                db, collection_name, CHUNK_DEDUP_THRESHOLD, CHUNK_DEDUP_MIN_WORDS
+            )
+            if CHUNK_DEDUP
+            else None
+        ),
+    )
+
+
+def reindex_in_place(vectordb: VectorDbService, rows):
+    started = time.perf_counter()
+    total_chunks, failed = 0, 0
+    for i, row in enumerate(rows, start=1):
+        record = file_record(row)
+        try:
+            chunks = reindex_file(vectordb, record, INGEST_BATCH_SIZE)
+        except Exception as err:
+            print(f"Reindexing {record['original_file_name']} failed: {err}")
+            failed += 1
+            continue
+        if not chunks:
+            print(f"{record['original_file_name']} has no text, left unchanged")
+            failed += 1
+            continue
+        total_chunks += chunks
+        vectordb.update_meta_in_sql({"file_id": record["file_id"], "chunk_count": chunks})
+        elapsed = time.perf_counter() - started
+        print(
+            f"[{i}/{len(rows)}] {record['original_file_name']}: {chunks} chunks "
+            f"({total_chunks / elapsed:.1f} chunks/s)"
+        )
+
+    print(
+        f"Reindexed {len(rows) - failed} files, {total_chunks} chunks, "
+        f"{failed} failed | page text cache {vectordb.parse_options.text_cache.snapshot()}"
+    )
+
+
+def file_version(row: dict):
+    """What a file's shadow chunks are built from: its files row and its stored copy."""
+    try:
+        stat = os.stat(os.path.join(DOCUMENT_FOLDER_DIR, row["file_name"]))
+        source = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    except OSError:
+        source = None
+    # chunk_count is written by the build itself once the shadow serves
+    return tuple(sorted((k, v) for k, v in row.items() if k != "chunk_count")), source
+
+
+def stale_rows(db, shadow: VectorDbService, versions: dict):
+    """
+    Drop files deleted since they were indexed from the shadow collection and
+    return the rows of files added, or updated in place (PUT, loader), since.
+    """
+    current = {row["id"]: row for row in db.get_rows("SELECT * FROM files")}
+    gone = [file_id for file_id in versions if file_id not in current]
+    for file_id in gone:
+        shadow.delete_chunks(file_id)
+        del versions[file_id]
+    stale = [
+        row
+        for file_id, row in current.items()
+        if versions.get(file_id) != file_version(row)
+    ]
+    return stale, len(current), gone
+
+
+def build_shadow(db, shadow: VectorDbService, runs: ReindexRuns, alias, embedding_model_name):
+    """Index the whole corpus into the shadow collection, then switch the alias to it."""
+    collection = shadow.vectorstore.collection_name
+    rows = db.get_rows("SELECT * FROM files ORDER BY upload_date")
+    run_id = runs.start(alias, collection, embedding_model_name, len(rows))
+    print(f"Building {collection} from {len(rows)} files; {alias} keeps serving")
+
+    versions = {}  # file_id -> file_version of the row its shadow chunks were built from
+    counts = {}  # file_id -> chunks in the shadow collection, recorded once it serves
+    failed = set()
+
+    def index_row(row):
+        record = file_record(row)
+        if row["id"] in versions:
+            # Changed while the build ran: replace its shadow chunks
+            shadow.delete_chunks(row["id"])
+        versions[row["id"]] = file_version(row)
+        try:
+            chunks = index_file(shadow, record, INGEST_BATCH_SIZE)
+        except Exception as err:
+            print(f"Indexing {record['original_file_name']} failed: {err}")
+            chunks = 0
+        counts[row["id"]] = chunks
+        if chunks:
+            failed.discard(row["id"])
+        else:
+            failed.add(row["id"])
+        runs.update(
+            run_id,
+            done_files=len(versions) - len(failed),
+            failed_files=len(failed),
+            chunks=sum(counts.values()),
+        )
+        run = runs.latest(alias)
+        eta = run["eta_seconds"]
+        print(
+            f"[{len(versions)}/{run['total_files']}] "
+            f"{record['original_file_name']}: {chunks} chunks"
+            + (f", ETA {datetime.timedelta(seconds=int(eta))}" if eta else "")
+        )
+
+    def forget(file_ids):
+        for file_id in file_ids:
+            counts.pop(file_id, None)
+            failed.discard(file_id)
+
+    try:
+        while rows:
+            for row in rows:
+                index_row(row)
+            # Catch up with files uploaded, updated or deleted while the build ran
+            rows, total_files, gone = stale_rows(db, shadow, versions)
+            forget(gone)
+            runs.update(run_id, total_files=total_files)
+
+        if not any(counts.values()):
+            raise RuntimeError("No chunks were indexed; keeping the current collection")
+        previous = shadow.point_alias(alias, collection)
+        # Changes that landed between the last check and the switch
+        rows, _, gone = stale_rows(db, shadow, versions)
+        forget(gone)
+        for row in rows:
+            index_row(row)
+        db.execute_many(
+            "UPDATE files SET chunk_count=? WHERE id=?",
+            [(count, file_id) for file_id, count in counts.items() if count],
+        )
+        runs.update(run_id, status=SWAPPED, previous_collection=previous)
+        if shadow.deduplicator:
+            # Fingerprints follow their collection to the names it is served under
+            if previous:
+                shadow.deduplicator.move_scope(alias, previous)
+            shadow.deduplicator.move_scope(collection, alias)
+    except Exception as err:
+        runs.update(run_id, status=FAILED, error=str(err))
+        raise
+
+    print(f"{alias} now serves {collection} (previous: {previous})")
+    # Keep only the collection we can roll back to
+    for name in runs.collections(alias):
+        if name not in (collection, previous) and shadow.vectorstore.client.has_collection(name):
+            shadow.drop_collection(name)
+            print(f"Dropped retired collection {name}")
+
+
+def rollback(vectordb: VectorDbService, runs: ReindexRuns, alias):
+    run = runs.latest(alias, SWAPPED)
+    if not run or not run["previous_collection"]:
+        raise SystemExit("Nothing to roll back")
+    vectordb.point_alias(alias, run["previous_collection"])
+    runs.update(run["id"], status=ROLLED_BACK)
+    if vectordb.deduplicator:
+        vectordb.deduplicator.move_scope(alias, run["collection"])
+        vectordb.deduplicator.move_scope(run["previous_collection"], alias)
+    print(f"{alias} serves {run['previous_collection']} again")
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-chunk and re-embed indexed documents")
+    parser.add_argument("--file-id", action="append", help="Only reindex these files")
+    parser.add_argument(
+        "--shadow", action="store_true", help="Build a new collection and switch to it"
+    )
+    parser.add_argument(
+        "--embedding-model",
+        default=EMBEDDING_MODEL_NAME,
+        help="Embed with another model (--shadow only)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=PARSE_OPTIONS.chunk_size)
+    parser.add_argument("--chunk-overlap", type=int, default=PARSE_OPTIONS.chunk_overlap)
+    parser.add_argument("--rollback", action="store_true", help="Switch back to the previous collection")
+    parser.add_argument("--status", action="store_true", help="Show the last shadow re-index")
+    args = parser.parse_args()
+    if args.embedding_model != EMBEDDING_MODEL_NAME and not args.shadow:
+        # Vectors of another model (or dimension) cannot go into the serving
+        # collection; they need a new collection and an alias switch
+        parser.error("--embedding-model requires --shadow")
+
+    with open(CATEGORIES_PATH, "r") as file:
+        categories = json.load(file)
+
+    db = Db(SQL_DB_PATH)
+    runs = ReindexRuns(db)
+    parse_options = dataclasses.replace(
+        PARSE_OPTIONS, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+    )
+
+    if args.status:
+        print(json.dumps(runs.latest(MILVUS_COLLECTION), indent=2, default=str))
+        return
+
+    if args.shadow:
+        collection = f"{MILVUS_COLLECTION}_{datetime.datetime.now():%Y%m%d%H%M%S}"
+        shadow = build_vectordb(
+            db, categories, args.embedding_model, collection, parse_options
+        )
+        build_shadow(db, shadow, runs, MILVUS_COLLECTION, args.embedding_model)
+        if args.embedding_model != EMBEDDING_MODEL_NAME:
+            print(
+                f"Set EMBEDDING_MODEL_NAME={args.embedding_model} and restart the "
+                "application so queries are embedded with the new model"
+            )
+        return
+
+    vectordb = build_vectordb(
+        db, categories, args.embedding_model, MILVUS_COLLECTION, parse_options
+    )
+    if args.rollback:
+        rollback(vectordb, runs, MILVUS_COLLECTION)
+        return
+
+    rows = db.get_rows("SELECT * FROM files ORDER BY upload_date")
+    if args.file_id:
+        rows = [row for row in rows if row["id"] in set(args.file_id)]
+    reindex_in_place(vectordb, rows)
+    if vectordb.embedding_cache:
+        print(f"Embedding cache: {vectordb.embedding_cache.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,18 @@ MILVUS_HOST = os.getenv("MILVUS_HOST")
 MILVUS_PORT = os.getenv("MILVUS_PORT")
 MILVUS_DB = os.getenv("MILVUS_DB")
 CATEGORIES_PATH = os.getenv("CATEGORIES_PATH")
+MILVUS_PARTITION_KEY = os.getenv("MILVUS_PARTITION_KEY") or None
+
+with open(CATEGORIES_PATH, "r") as file:
+    categories = json.load(file)
+
+# The collection is created by the first document load, partitioned by this category
+if MILVUS_PARTITION_KEY:
+    if MILVUS_PARTITION_KEY not in [cat["id"] for cat in categories]:
+        raise SystemExit(
+            f"MILVUS_PARTITION_KEY '{MILVUS_PARTITION_KEY}' is not a category in {CATEGORIES_PATH}"
+        )
+    print(f"Documents will be partitioned by '{MILVUS_PARTITION_KEY}'.")
 
 from pymilvus import Collection, MilvusException, connections, db, utility
 
@@ -43,10 +55,8 @@ except MilvusException as e:
 
 SQL_DB_PATH = os.getenv("SQL_DB_PATH")
 category_fields = ""
-with open(CATEGORIES_PATH, "r") as file:
-    categories = json.load(file)
-    for cat in categories:
-        category_fields = category_fields + f"{cat['id']} TEXT,\n"
+for cat in categories:
+    category_fields = category_fields + f"{cat['id']} TEXT,\n"
 
 
 with sqlite3.connect(SQL_DB_PATH) as conn:
@@ -63,11 +73,137 @@ with sqlite3.connect(SQL_DB_PATH) as conn:
             created_at  TEXT,
             updated_at  TEXT,
             author  TEXT,
+            chunk_count  INTEGER,
             {category_fields}
             upload_date TEXT DEFAULT CURRENT_TIMESTAMP
         )
     """
     )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id          TEXT PRIMARY KEY,
+            file_id     TEXT NOT NULL,
+            kind        TEXT NOT NULL DEFAULT 'add',
+            payload     TEXT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'queued',
+            stage       TEXT,
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            error       TEXT,
+            created_at  TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at  TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS loader_manifest (
+            path          TEXT PRIMARY KEY,
+            size          INTEGER NOT NULL,
+            mtime         REAL NOT NULL,
+            content_hash  TEXT NOT NULL,
+            file_id       TEXT NOT NULL,
+            status        TEXT NOT NULL,
+            updated_at    TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reindex_runs (
+            id                   TEXT PRIMARY KEY,
+            alias                TEXT NOT NULL,
+            collection           TEXT NOT NULL,
+            previous_collection  TEXT,
+            embedding_model      TEXT,
+            status               TEXT NOT NULL,
+            total_files          INTEGER NOT NULL DEFAULT 0,
+            done_files           INTEGER NOT NULL DEFAULT 0,
+            chunks               INTEGER NOT NULL DEFAULT 0,
+            failed_files         INTEGER NOT NULL DEFAULT 0,
+            error                TEXT,
+            started_at           REAL NOT NULL,
+            updated_at           REAL NOT NULL
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+            scope     TEXT NOT NULL,
+            pk        TEXT NOT NULL,
+            file_id   TEXT NOT NULL,
+            signature BLOB NOT NULL,
+            band0     INTEGER NOT NULL,
+            band1     INTEGER NOT NULL,
+            band2     INTEGER NOT NULL,
+            band3     INTEGER NOT NULL,
+            band4     INTEGER NOT NULL,
+            band5     INTEGER NOT NULL,
+            band6     INTEGER NOT NULL,
+            band7     INTEGER NOT NULL,
+            PRIMARY KEY (scope, pk)
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chunk_refs (
+            scope        TEXT NOT NULL,
+            pk           TEXT NOT NULL,
+            file_id      TEXT NOT NULL,
+            page         INTEGER,
+            chunk_index  INTEGER,
+            PRIMARY KEY (scope, pk, file_id)
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            file_id       TEXT PRIMARY KEY,
+            content_hash  TEXT NOT NULL
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            id          TEXT PRIMARY KEY,
+            file_name   TEXT NOT NULL,
+            size        INTEGER NOT NULL,
+            meta        TEXT NOT NULL,
+            created_at  REAL NOT NULL
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS watcher_status (
+            folder                  TEXT PRIMARY KEY,
+            mode                    TEXT NOT NULL,
+            pid                     INTEGER NOT NULL,
+            started_at              REAL NOT NULL,
+            updated_at              REAL NOT NULL,
+            pending                 INTEGER NOT NULL DEFAULT 0,
+            processing              INTEGER NOT NULL DEFAULT 0,
+            oldest_pending_seconds  REAL,
+            files_indexed           INTEGER NOT NULL DEFAULT 0,
+            files_failed            INTEGER NOT NULL DEFAULT 0,
+            last_batch_files        INTEGER NOT NULL DEFAULT 0,
+            last_lag_seconds        REAL,
+            max_lag_seconds         REAL
+        )
+    """
+    )
     cur.execute(f"DELETE FROM files")
+    cur.execute("DELETE FROM ingestion_jobs")
+    cur.execute("DELETE FROM loader_manifest")
+    cur.execute("DELETE FROM reindex_runs")
+    cur.execute("DELETE FROM chunk_fingerprints")
+    cur.execute("DELETE FROM chunk_refs")
+    cur.execute("DELETE FROM file_hashes")
+    cur.execute("DELETE FROM uploads")
+    cur.execute("DELETE FROM watcher_status")
     # ---------- commit changes ----------
     conn.commit()
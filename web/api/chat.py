@@ -11,8 +11,9 @@ from uuid import uuid4
 
 from langgraph.types import Command
 
-from model.domain.core import GraphState, UserInput, to_jsonable
+from model.domain.core import GraphState, TaskType, UserInput, to_jsonable
 from model.chat_graph import ScholarGraph
+from model.nodes.find_documents import find_page
 from langchain_core.messages import (
     BaseMessage,
     BaseMessageChunk,
@@ -186,6 +187,34 @@ async def aget_current_state(chat_id):
     return jsonify(state.model_dump()), 200
 
 
+@chat_bp.route("/<uuid:chat_id>/documents", methods=["GET"])
+async def get_documents_page(chat_id):
+    """Next page of the chat's last find_documents results, from `?cursor=`."""
+    chat_graph: ScholarGraph = current_app.chat_graph
+    snapshot = await chat_graph.aget_state(str(chat_id))
+    if not snapshot or not snapshot.values:
+        return jsonify("chat not found"), 404
+    state = GraphState.model_validate(snapshot.values)
+    if not state.task or state.task.type != TaskType.find_documents:
+        return jsonify("last answer did not find documents"), 400
+    cursor = request.args.get("cursor", type=int) or 0
+
+    documents, next_cursor = await find_page(
+        state,
+        current_app.vectordb,
+        cursor=cursor,
+        page_size=chat_graph.find_page_size,
+        group_size=chat_graph.find_group_size,
+    )
+    return (
+        jsonify(
+            documents=[doc.model_dump() for doc in documents],
+            next_cursor=next_cursor,
+        ),
+        200,
+    )
+
+
 @chat_bp.route("/<uuid:chat_id>", methods=["GET"])
 async def get_chat(chat_id):
     if not chat_id:
@@ -1,10 +1,13 @@
 import os
 import uuid
 import json
+import asyncio
 from pathlib import Path
 from quart import Blueprint, request, jsonify, current_app, send_from_directory
 from model.domain.core import UserFilter, UserInput
 from services.vector_db_service import VectorDbService
+from services.ingestion_queue import IngestionQueue, UPDATE
+from services.upload_store import UploadStore, UploadOffsetMismatch, UploadBusy
 
 ALLOWED_EXTENSIONS = {"doc", "docx", "txt", "pdf"}
 
@@ -14,48 +17,254 @@ def allowed_file(filename):
 document_manager_bp = Blueprint("document_manager", __name__)
 ## HELPERS ##
 
+def new_record(original_file_name, form, categories):
+    """Ingest record of a new upload; `form` holds the upload form fields."""
+    file_id = str(uuid.uuid4())
+    filename = f"{file_id}{Path(original_file_name).suffix.lower()}"
+    data = {
+        "file_id": file_id,
+        "file_path": os.path.join(current_app.DOCUMENT_FOLDER_DIR, filename),
+        "file_name": filename,
+        "original_file_name": original_file_name,
+        "folder": form.get("search_path", ""),
+        "created_at": form.get("created_date", ""),
+        "updated_at": form.get("updated_date", ""),
+        "author": form.get("file_author", ""),
+    }
+    for cat in categories:
+        # Every category is set, as the loader does; a partition key cannot be missing
+        data[cat["id"]] = form.get(cat["id"]) or None
+    return data
+
+
+def delete_stored_files(vectordb, upload_store, folder, file_ids, compact=False):
+    """Delete files from the index, their stored copies and cached page text; blocking."""
+    file_names = vectordb.get_file_names(file_ids)
+    vectordb.delete_files(file_ids, compact=compact)
+    upload_store.forget(file_ids)
+    for file_name in file_names:
+        Path(folder, file_name).unlink(missing_ok=True)
+    if vectordb.parse_options.text_cache:
+        for file_id in file_ids:
+            vectordb.parse_options.text_cache.delete(file_id)
+
+
+def duplicate_response(file_name, existing_id):
+    return (
+        jsonify(error=f"{file_name} is already indexed", file_id=existing_id),
+        409,
+    )
+
+
 @document_manager_bp.route("/upload", methods=["POST"])
 async def upload():
-    files = await request.files
-    if "file" not in files:
+    """
+    Upload one or more files (several `file` parts share the form metadata).
+    Queued uploads are ingested together, with embedding and inserts batched
+    across files. Exact duplicates of indexed files are not ingested again.
+    """
+    upload_store: UploadStore = current_app.upload_store
+    try:
+        # File parts are streamed to staging files as the body arrives
+        form, parts = await upload_store.receive_form(
+            request.body, request.headers.get("Content-Type", ""), accept=allowed_file
+        )
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    uploads = [part for part in parts if part["name"] == "file"]
+    upload_store.discard_files([part for part in parts if part["name"] != "file"])
+    if not uploads:
         return jsonify(error="No file part"), 400
 
-    file = files["file"]
-    if file.filename == "":
+    if any(part["filename"] == "" for part in uploads):
+        upload_store.discard_files(uploads)
         return jsonify(error="No selected file"), 400
 
-    if not allowed_file(file.filename):
+    vectordb: VectorDbService = current_app.vectordb
+    records, hashes, duplicates = [], {}, []
+    for part in uploads:
+        data = new_record(part["filename"], form, vectordb.categories)
+        content_hash = part["content_hash"]
+        existing_id = upload_store.find_duplicate(content_hash) or hashes.get(content_hash)
+        if existing_id:
+            os.remove(part["path"])
+            duplicates.append({"file_name": part["filename"], "file_id": existing_id})
+            continue
+        os.replace(part["path"], data["file_path"])
+        hashes[content_hash] = data["file_id"]
+        records.append(data)
+
+    if not records:
+        return duplicate_response(duplicates[0]["file_name"], duplicates[0]["file_id"])
+
+    ingestion_queue: IngestionQueue = current_app.ingestion_queue
+    job_ids = ingestion_queue.enqueue_many(records)
+    for content_hash, file_id in hashes.items():
+        upload_store.register(file_id, content_hash)
+    jobs = [
+        {"job_id": job_id, "file_id": data["file_id"], "file_name": data["original_file_name"]}
+        for job_id, data in zip(job_ids, records)
+    ]
+
+    return (
+        jsonify(
+            message="File uploaded successfully",
+            job_id=job_ids[0],
+            file_id=records[0]["file_id"],
+            jobs=jobs,
+            duplicates=duplicates,
+        ),
+        202,
+    )
+
+
+@document_manager_bp.route("/uploads", methods=["POST"])
+async def create_upload():
+    """
+    Start a resumable upload. The JSON body holds `file_name`, `size` and the
+    upload form fields; the content is then sent with PATCH requests.
+    """
+    params = await request.get_json(force=True)
+    file_name = params.pop("file_name", "")
+    size = params.pop("size", None)
+    if not file_name or not isinstance(size, int) or size <= 0:
+        return jsonify(error="file_name and size are required"), 400
+    if not allowed_file(file_name):
         return jsonify(error="File type not allowed"), 400
 
-    file_id = str(uuid.uuid4())
-    ext = Path(file.filename).suffix.lower()
+    upload_store: UploadStore = current_app.upload_store
+    upload = upload_store.create(file_name, size, params)
+    return jsonify(upload_id=upload["id"], offset=0, size=size), 201
+
+
+@document_manager_bp.route("/uploads/<uuid:upload_id>", methods=["GET"])
+async def get_upload(upload_id):
+    """Offset to resume a dropped upload from."""
+    upload_store: UploadStore = current_app.upload_store
+    upload = upload_store.get(str(upload_id))
+    if not upload:
+        return jsonify(error="Upload not found"), 404
+    return jsonify(upload_id=upload["id"], offset=upload["offset"], size=upload["size"]), 200
+
+
+@document_manager_bp.route("/uploads/<uuid:upload_id>", methods=["PATCH"])
+async def append_upload(upload_id):
+    """
+    Append the request body at the `Upload-Offset` header. The body is
+    streamed to disk as it arrives. The request that completes the file
+    queues its ingestion, unless it duplicates an indexed file.
+    """
+    upload_store: UploadStore = current_app.upload_store
+    upload = upload_store.get(str(upload_id))
+    if not upload:
+        return jsonify(error="Upload not found"), 404
+
+    try:
+        offset = await upload_store.append(
+            upload, int(request.headers.get("Upload-Offset", "0")), request.body
+        )
+    except UploadOffsetMismatch as err:
+        return jsonify(error=str(err), offset=err.offset), 409
+    except UploadBusy as err:
+        return jsonify(error=str(err)), 409
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    if offset < upload["size"]:
+        return jsonify(upload_id=upload["id"], offset=offset, size=upload["size"]), 200
 
+    vectordb: VectorDbService = current_app.vectordb
+    data = new_record(upload["file_name"], upload["meta"], vectordb.categories)
+    # Rehashes the part file when the hash state was lost (restart, other process)
+    content_hash = await asyncio.to_thread(upload_store.complete, upload, data["file_path"])
+    existing_id = upload_store.find_duplicate(content_hash)
+    if existing_id:
+        os.remove(data["file_path"])
+        return duplicate_response(upload["file_name"], existing_id)
+
+    ingestion_queue: IngestionQueue = current_app.ingestion_queue
+    job_id = ingestion_queue.enqueue(data)
+    upload_store.register(data["file_id"], content_hash)
+    return (
+        jsonify(message="File uploaded successfully", job_id=job_id, file_id=data["file_id"]),
+        202,
+    )
+
+
+@document_manager_bp.route("/uploads/<uuid:upload_id>", methods=["DELETE"])
+async def abort_upload(upload_id):
+    upload_store: UploadStore = current_app.upload_store
+    upload_store.discard(str(upload_id))
+    return jsonify("Upload discarded"), 200
+
+
+@document_manager_bp.route("/<uuid:file_id>", methods=["PUT"])
+async def update(file_id):
+    """
+    Replace an indexed file with a new version. Metadata fields that are not
+    sent keep their current values; only the chunks that changed are
+    re-embedded.
+    """
+    file_id = str(file_id)
+    vectordb: VectorDbService = current_app.vectordb
+    current = vectordb.get_file_data(file_id)
+    if not current:
+        return jsonify(error="File not found"), 404
+
+    upload_store: UploadStore = current_app.upload_store
+    try:
+        form, parts = await upload_store.receive_form(
+            request.body, request.headers.get("Content-Type", ""), accept=allowed_file
+        )
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    file = next((part for part in parts if part["name"] == "file"), None)
+    upload_store.discard_files([part for part in parts if part is not file])
+    if file is None:
+        return jsonify(error="No file part"), 400
+
+    if file["filename"] == "":
+        upload_store.discard_files([file])
+        return jsonify(error="No selected file"), 400
+
+    ext = Path(file["filename"]).suffix.lower()
     filename = f"{file_id}{ext}"
     file_path = os.path.join(current_app.DOCUMENT_FOLDER_DIR, filename)
 
-    form = await request.form
     data = {
         "file_id": file_id,
         "file_path": file_path,
         "file_name": filename,
-        "original_file_name": file.filename,
-        "folder": form.get("search_path", ""),
-        "created_at": form.get("created_date", ""),
-        "updated_at": form.get("updated_date", ""),
-        "author": form.get("file_author", ""),
+        "original_file_name": file["filename"],
+        "folder": form.get("search_path", current["folder"]),
+        "created_at": form.get("created_date", current["created_at"]),
+        "updated_at": form.get("updated_date", current["updated_at"]),
+        "author": form.get("file_author", current["author"]),
     }
-
-    vectordb: VectorDbService = current_app.vectordb
     for cat in vectordb.categories:
-        val = form.get(cat["id"])
-        if val:
-            data[cat["id"]] = val
+        data[cat["id"]] = form.get(cat["id"], current.get(cat["id"])) or None
 
-    await file.save(file_path)
+    # The new version stays in its staging file; the job moves it into place
+    # once it is indexed, until then the current copy keeps being served
+    ingestion_queue: IngestionQueue = current_app.ingestion_queue
+    job_id = ingestion_queue.enqueue({**data, "staged_path": file["path"]}, kind=UPDATE)
+    upload_store.register(file_id, file["content_hash"])
 
-    vectordb.add_file(data)
+    return (
+        jsonify(message="File update queued", job_id=job_id, file_id=file_id),
+        202,
+    )
 
-    return jsonify(message="File uploaded successfully"), 200
+
+@document_manager_bp.route("/jobs/<uuid:job_id>", methods=["GET"])
+async def get_job(job_id):
+    ingestion_queue: IngestionQueue = current_app.ingestion_queue
+    job = ingestion_queue.get_job(str(job_id))
+    if not job:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job), 200
 
 @document_manager_bp.route("/", methods=["POST"])
 async def get_files():
@@ -93,8 +302,49 @@ async def get_file_content(file_id):
     vectordb: VectorDbService = current_app.vectordb
     return jsonify(vectordb.get_file_content(str(file_id))), 200
 
+@document_manager_bp.route("/delete", methods=["POST"])
+async def delete_many():
+    """
+    Delete the files listed in `file_ids`, or the files matching the filter
+    fields (as for listing). `compact` forces or skips the Milvus compaction
+    that otherwise follows deletes of COMPACT_AFTER_DELETE_FILES files or more.
+    """
+    params = await request.get_json(force=True)
+    file_ids = params.pop("file_ids", None)
+    compact = params.pop("compact", None)
+
+    vectordb: VectorDbService = current_app.vectordb
+    if file_ids is None:
+        user_filter = UserFilter.model_validate(params)
+        has_filter = any(user_filter.model_dump(exclude={"category_ids"}).values()) or any(
+            category.categories for category in user_filter.category_ids or []
+        )
+        if not has_filter:
+            return jsonify(error="Give file_ids or at least one filter field"), 400
+        file_ids = await asyncio.to_thread(vectordb.get_file_ids, user_filter) or []
+    file_ids = [str(id) for id in file_ids]
+
+    if compact is None:
+        threshold = current_app.COMPACT_AFTER_DELETE_FILES
+        compact = bool(threshold) and len(file_ids) >= threshold
+    await asyncio.to_thread(
+        delete_stored_files,
+        vectordb,
+        current_app.upload_store,
+        current_app.DOCUMENT_FOLDER_DIR,
+        file_ids,
+        compact,
+    )
+    return jsonify(deleted=len(file_ids), compacted=bool(compact and file_ids)), 200
+
+
 @document_manager_bp.route("/<uuid:file_id>", methods=["DELETE"])
 async def delete(file_id):
-    vectordb: VectorDbService = current_app.vectordb
-    vectordb.delete_file(str(file_id))
+    await asyncio.to_thread(
+        delete_stored_files,
+        current_app.vectordb,
+        current_app.upload_store,
+        current_app.DOCUMENT_FOLDER_DIR,
+        [str(file_id)],
+    )
     return jsonify("Meta data updated successfully"), 200
@@ -0,0 +1,80 @@
+from quart import Blueprint, jsonify, current_app
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/classifier", methods=["GET"])
+async def get_classifier_metrics():
+    fast_classifier = current_app.chat_graph.fast_classifier
+    if not fast_classifier:
+        return jsonify({"enabled": False}), 200
+    return (
+        jsonify(
+            {
+                "enabled": fast_classifier.enabled,
+                "threshold": fast_classifier.threshold,
+                "margin": fast_classifier.margin,
+                **fast_classifier.stats.snapshot(),
+            }
+        ),
+        200,
+    )
+
+
+@metrics_bp.route("/speculative_retrieval", methods=["GET"])
+async def get_speculative_retrieval_metrics():
+    speculative_retrieval = current_app.chat_graph.speculative_retrieval
+    return (
+        jsonify(
+            {
+                "enabled": speculative_retrieval.enabled,
+                **speculative_retrieval.stats.snapshot(),
+            }
+        ),
+        200,
+    )
+
+
+@metrics_bp.route("/embeddings", methods=["GET"])
+async def get_embedding_metrics():
+    stats = getattr(current_app.embedding_model, "stats", None)
+    if not stats:
+        return jsonify({"batching": False}), 200
+    return jsonify({"batching": True, **stats.snapshot()}), 200
+
+
+@metrics_bp.route("/embedding_cache", methods=["GET"])
+async def get_embedding_cache_metrics():
+    embedding_cache = current_app.vectordb.embedding_cache
+    if not embedding_cache:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **embedding_cache.snapshot()}), 200
+
+
+@metrics_bp.route("/dedup", methods=["GET"])
+async def get_dedup_metrics():
+    deduplicator = current_app.vectordb.deduplicator
+    if not deduplicator:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **deduplicator.snapshot()}), 200
+
+
+@metrics_bp.route("/watcher", methods=["GET"])
+async def get_watcher_metrics():
+    return jsonify({"watchers": current_app.watcher_status.snapshot()}), 200
+
+
+@metrics_bp.route("/reindex", methods=["GET"])
+async def get_reindex_metrics():
+    alias = current_app.MILVUS_COLLECTION
+    run = current_app.reindex_runs.latest(alias)
+    return (
+        jsonify(
+            {
+                "alias": alias,
+                "serving_collection": current_app.vectordb.serving_collection(alias),
+                "last_run": run,
+            }
+        ),
+        200,
+    )
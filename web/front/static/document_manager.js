@@ -1,5 +1,10 @@
 'use strict';
 const API_BASE = `${window.location.origin}/api/`;
+// Files above this size are sent as resumable uploads, in blocks of this size
+const UPLOAD_BLOCK_SIZE = 8 * 1024 * 1024;
+// Smaller files are posted together, in requests of at most this many bytes
+// (kept below the server's MAX_CONTENT_LENGTH of 16MB)
+const UPLOAD_BATCH_SIZE = 12 * 1024 * 1024;
 
 /* --------------------------- Global state --------------------------- */
 const state = {
@@ -246,27 +251,42 @@ async function fetchJSON(relativePath, req = null) {
 /* -------------------------- CRUD ------------------------------ */
 async function handleUpload() {
   const $status = $('#uploadStatus').text('').removeClass('text-danger');
-  const file = $('#fileInput').prop('files')[0];
+  const files = [...$('#fileInput').prop('files')];
 
-  if (!file) {
+  if (!files.length) {
     return $status.text('Please select a file.').addClass('text-danger mt-2');
   }
 
-  const formData = buildFormData(file);
+  const small = files.filter(file => file.size <= UPLOAD_BLOCK_SIZE);
+  const large = files.filter(file => file.size > UPLOAD_BLOCK_SIZE);
 
   try {
     toggleButtons(false);
-    await fetch(`${API_BASE}document_manager/upload`, { method: 'POST', body: formData });
+    const jobs = [];
+    const duplicates = [];
+    for (const batch of batchBySize(small, UPLOAD_BATCH_SIZE)) {
+      const res = await fetchJSON('document_manager/upload', { method: 'POST', body: buildFormData(batch) });
+      jobs.push(...res.jobs);
+      duplicates.push(...res.duplicates);
+    }
+    for (const file of large) {
+      const res = await uploadResumable(file);
+      if (res.job_id) jobs.push(res);
+      else duplicates.push({ file_name: file.name, file_id: res.file_id });
+    }
 
-    showNotification('Upload successful!', 'success');
+    if (jobs.length) showNotification('Upload accepted, indexing...', 'success');
+    if (duplicates.length) {
+      showNotification(`Already indexed: ${duplicates.map(d => d.file_name).join(', ')}`, 'warning');
+    }
     bootstrap.Modal.getInstance('#uploadModal').hide();
     clearFields();
-    loadPage();
+    jobs.forEach(job => waitForJob(job.job_id));
   } catch (err) {
     console.log(err)
     let msg = 'Upload failed.';
     try {
-      msg = (await err.response.json()).error || msg;
+      msg = (err instanceof Response ? (await err.json()).error : err.message) || msg;
     } catch (_) { }
     showNotification(msg, 'danger');
   } finally {
@@ -274,9 +294,78 @@ async function handleUpload() {
   }
 }
 
-function buildFormData(file) {
+/* Splits files into batches of at most maxBytes in total; a larger file
+   gets a batch of its own. */
+function batchBySize(files, maxBytes) {
+  const batches = [];
+  let batch = [];
+  let bytes = 0;
+  for (const file of files) {
+    if (batch.length && bytes + file.size > maxBytes) {
+      batches.push(batch);
+      batch = [];
+      bytes = 0;
+    }
+    batch.push(file);
+    bytes += file.size;
+  }
+  if (batch.length) batches.push(batch);
+  return batches;
+}
+
+/* Sends a file in blocks; after a dropped connection it asks the server
+   where to resume instead of starting over. */
+async function uploadResumable(file) {
+  const fields = Object.fromEntries(buildFormData([]).entries());
+  const { upload_id } = await fetchJSON('document_manager/uploads', {
+    method: 'POST',
+    body: JSON.stringify({ file_name: file.name, size: file.size, ...fields })
+  });
+
+  let offset = 0;
+  let retries = 0;
+  while (true) {
+    let res;
+    try {
+      res = await fetch(`${API_BASE}document_manager/uploads/${upload_id}`, {
+        method: 'PATCH',
+        headers: { 'Upload-Offset': String(offset) },
+        body: file.slice(offset, offset + UPLOAD_BLOCK_SIZE)
+      });
+    } catch (err) {
+      if (++retries > 5) throw err;
+      await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+      ({ offset } = await fetchJSON(`document_manager/uploads/${upload_id}`));
+      continue;
+    }
+    const body = await res.json();
+    if (res.status === 202) return body;
+    if (res.status === 409 && body.offset === undefined && body.file_id) return body;
+    if (res.status === 409 && body.offset !== undefined) {
+      offset = body.offset;
+      continue;
+    }
+    if (!res.ok) throw new Error(body.error || 'Upload failed.');
+    offset = body.offset;
+    retries = 0;
+  }
+}
+
+async function waitForJob(jobId) {
+  const job = await fetchJSON(`document_manager/jobs/${jobId}`);
+  if (job.status === 'done') {
+    showNotification('Upload successful!', 'success');
+    loadPage();
+  } else if (job.status === 'failed') {
+    showNotification(job.error || 'Upload failed.', 'danger');
+  } else {
+    setTimeout(() => waitForJob(jobId), 1000);
+  }
+}
+
+function buildFormData(files) {
   const fd = new FormData();
-  fd.append('file', file);
+  files.forEach(file => fd.append('file', file));
 
   const searchPath = $('#search-path').val();
   const createdDate = $('#created-date').val();
@@ -326,7 +415,7 @@ async function delete_file(id) {
 
 function showNotification(message, type = 'success') {
   const $note = $('#uploadNotification')
-    .removeClass('alert-success alert-danger')
+    .removeClass('alert-success alert-danger alert-warning')
     .addClass(`alert-${type}`)
     .text(message)
     .fadeIn(200);
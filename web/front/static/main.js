@@ -266,7 +266,7 @@ function fetchPostData(chatId) {
                 res.json().then(data => {
                     const docs = data?.last_conversation?.documents;
                     if (docs && docs.length > 0) {
-                        addDocs(docs);
+                        addDocs(docs, data.last_conversation.next_cursor, chatId);
                     }
                 }).catch(err => {
                     console.log(err)
@@ -478,7 +478,7 @@ function updateDivText($div, newText) {
     });
 }
 
-function addDocs(docs) {
+function addDocs(docs, nextCursor = null, chatId = null) {
     if (!docs || docs.length == 0) return;
     const grouped_docs = []
     docs.forEach(doc => {
@@ -519,4 +519,30 @@ function addDocs(docs) {
     $('.select-file-chk').change(function () {
         check_file($(this)[0])
     });
+    if (nextCursor != null && chatId) {
+        addMoreDocsButton(nextCursor, chatId);
+    }
+}
+
+function addMoreDocsButton(cursor, chatId) {
+    const $more = $('<button>', {
+        class: 'btn btn-outline-secondary btn-sm more-docs-btn',
+        text: 'More documents',
+    }).appendTo($('#output'));
+    $more.on('click', () => {
+        $more.prop('disabled', true);
+        fetch(`${API_BASE}chat/${chatId}/documents?cursor=${cursor}`)
+            .then((res) => {
+                if (!res.ok) throw res;
+                return res.json();
+            })
+            .then((data) => {
+                $more.remove();
+                addDocs(data.documents, data.next_cursor, chatId);
+            })
+            .catch((err) => {
+                console.error('documents page error:', err);
+                $more.prop('disabled', false);
+            });
+    });
 }
\ No newline at end of file